@@ -1,9 +1,11 @@
 import argparse
 import csv
 from scheduler.runner import Runner
-from scheduler.occamscheduler import OccamDepSetScheduler, OccamFIFOScheduler
+from regex.regextool import RegexTool
+from scheduler.occamscheduler import OccamScheduler, OccamDepSetScheduler, OccamFIFOScheduler
 from scheduler.baselinescheduler import PerDcFIFOScheduler, PerDeviceFIFOScheduler
 from scheduler.baselinescheduler import PerDcDepSetScheduler, PerDeviceDepSetScheduler
+from scheduler.deadlock import VICTIM_POLICIES
 import sys
 
 scheduler_choice_mapping = {
@@ -71,6 +73,26 @@ def _configure() -> argparse.Namespace:
         type=int,
         help="The number of wfs you want to run, -1 means run all",
     )
+    parser.add_argument(
+        "-ocs",
+        dest="op_cache_size",
+        default=4096,
+        type=int,
+        help="The number of fsm operation results to cache, 0 disables the cache",
+    )
+    parser.add_argument(
+        "-dv",
+        dest="deadlock_victim",
+        choices=list(VICTIM_POLICIES),
+        default="fewest_locks",
+        help="How to pick the workflow to rollback out of a deadlock",
+    )
+    parser.add_argument(
+        "-fs",
+        dest="full_schedule",
+        action="store_true",
+        help="Go through the whole regextree in every scheduling pass of the occam schedulers, not only the changes",
+    )
     parser.add_argument(
         "-l",
         dest="log_file",
@@ -84,10 +106,14 @@ def _configure() -> argparse.Namespace:
 def main(args: argparse.Namespace) -> None:
     """The main program"""
     csv.field_size_limit(sys.maxsize)
+    RegexTool.op_cache_size = args.op_cache_size
 
     runner = Runner(args.folder, args.result_file, args.num_wf, args.gs, args.es)
     scheduler_cls = scheduler_choice_mapping[args.scheduler]
     scheduler = scheduler_cls()
+    scheduler.deadlock_victim = args.deadlock_victim
+    if isinstance(scheduler, OccamScheduler):
+        scheduler.incremental_schedule = not args.full_schedule
     runner.set_scheduler(scheduler)
 
     runner.run()
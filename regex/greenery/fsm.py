@@ -4,6 +4,10 @@
     Finite state machine library.
 """
 
+import hashlib
+from array import array
+from operator import getitem
+
 
 class anything_else_cls:
     """
@@ -45,6 +49,184 @@ class OblivionError(Exception):
     pass
 
 
+class table:
+    """
+    A dense transition table for an `fsm`. States are numbered 0..n-1 and
+    symbols are interned to columns 0..k-1, in `key` order, so that
+    `anything_else` (if present) is always the last column. The next state
+    for state `i` and column `c` is `delta[i * k + c]`, or -1 for the oblivion
+    state. `labels` maps each state number back to the original state.
+    """
+
+    def __init__(self, symbols, labels, initial, finals, delta):
+        self.symbols = symbols
+        self.columns = dict((symbol, c) for (c, symbol) in enumerate(symbols))
+        self.other = self.columns.get(anything_else, -1)
+        self.labels = labels
+        self.initial = initial
+        self.finals = finals
+        self.delta = delta
+        self.successors = {}
+        self.useful_successors = {}
+        self.classes = None
+        self.live = None
+        self.useful = None
+        self.order = False
+
+    @classmethod
+    def from_map(cls, alphabet, states, initial, finals, map):
+        """
+        Number the states and symbols of a dict-of-dicts FSM.
+        """
+        symbols = []
+        for symbol in alphabet:
+            if isinstance(symbol, anything_else_cls):
+                symbol = anything_else
+            if symbol not in symbols:
+                symbols.append(symbol)
+        symbols.sort(key=key)
+        labels = list(states)
+        index = dict((state, i) for (i, state) in enumerate(labels))
+        columns = dict((symbol, c) for (c, symbol) in enumerate(symbols))
+        k = len(symbols)
+
+        delta = array("l", [-1]) * (len(labels) * k)
+        for (i, state) in enumerate(labels):
+            for (symbol, next) in map.get(state, {}).items():
+                if isinstance(symbol, anything_else_cls):
+                    symbol = anything_else
+                if symbol in columns:
+                    delta[i * k + columns[symbol]] = index[next]
+
+        accepting = bytearray(len(labels))
+        for state in finals:
+            accepting[index[state]] = 1
+
+        return cls(symbols, labels, index[initial], accepting, delta)
+
+    def column(self, symbol):
+        """
+        Return the column for `symbol`, falling back to the `anything_else`
+        column for symbols outside the alphabet. -1 means there is no column
+        at all, i.e. the symbol always leads to the oblivion state.
+        """
+        return self.columns.get(symbol, self.other)
+
+    def symbol_class(self, symbol):
+        """
+        Return the equivalence class of `symbol` in this FSM. Columns with the
+        same transitions from every state share a class, so symbols in the
+        same class are interchangeable. -1 is the class of symbols with no
+        column at all.
+        """
+        if self.classes is None:
+            k = len(self.symbols)
+            seen = {}
+            self.classes = [seen.setdefault(tuple(self.delta[c::k]), len(seen)) for c in range(k)]
+        column = self.column(symbol)
+        return -1 if column == -1 else self.classes[column]
+
+    def live_columns(self, state):
+        """
+        Return the columns which do not lead to oblivion from `state`.
+        """
+        if self.live is None:
+            k = len(self.symbols)
+            rows = range(0, len(self.delta), k)
+            self.live = [[c for c in range(k) if self.delta[row + c] != -1] for row in rows]
+        return self.live[state]
+
+    def alive(self):
+        """
+        Return the set of states which can be reached and from which a final
+        state can be reached. All others behave like the oblivion state.
+        """
+        if self.useful is None:
+            k = len(self.symbols)
+            reachable = [self.initial]
+            seen = {self.initial}
+            predecessors = {}
+            for q in reachable:
+                for j in self.delta[q * k : (q + 1) * k]:
+                    if j != -1:
+                        predecessors.setdefault(j, []).append(q)
+                        if j not in seen:
+                            seen.add(j)
+                            reachable.append(j)
+            live = [q for q in reachable if self.finals[q]]
+            self.useful = set(live)
+            for q in live:
+                for p in predecessors.get(q, ()):
+                    if p not in self.useful:
+                        self.useful.add(p)
+                        live.append(p)
+        return self.useful
+
+    def topological(self):
+        """
+        Return the states of `alive()` in topological order, or None if there
+        is a cycle among them, i.e. if the FSM recognises infinitely many
+        strings.
+        """
+        if self.order is False:
+            k = len(self.symbols)
+            alive = self.alive()
+            indegree = dict.fromkeys(alive, 0)
+            for q in alive:
+                for j in self.delta[q * k : (q + 1) * k]:
+                    if j in indegree:
+                        indegree[j] += 1
+            order = [q for q in alive if indegree[q] == 0]
+            for q in order:
+                for j in self.delta[q * k : (q + 1) * k]:
+                    if j in indegree:
+                        indegree[j] -= 1
+                        if indegree[j] == 0:
+                            order.append(j)
+            self.order = order if len(order) == len(alive) else None
+        return self.order
+
+    def successor(self, column):
+        """
+        Return the next state of every state for one column as a list, plus a
+        trailing -1 so that indexing it with the oblivion state (-1) stays in
+        oblivion. Built once per column and kept.
+        """
+        if column not in self.successors:
+            k = len(self.symbols)
+            n = len(self.finals)
+            if column == -1:
+                self.successors[column] = [-1] * (n + 1)
+            else:
+                self.successors[column] = self.delta[column::k].tolist() + [-1]
+        return self.successors[column]
+
+    def useful_successor(self, column):
+        """
+        Like `successor()`, but the states outside `alive()` lead to -1 as
+        well, since nothing can be accepted from them.
+        """
+        if column not in self.useful_successors:
+            alive = self.alive()
+            self.useful_successors[column] = [j if j in alive else -1 for j in self.successor(column)]
+        return self.useful_successors[column]
+
+    def to_map(self):
+        """
+        Expand the table back into the sparse dict-of-dicts form.
+        """
+        k = len(self.symbols)
+        map = {}
+        for (i, state) in enumerate(self.labels):
+            row = {}
+            for (c, symbol) in enumerate(self.symbols):
+                j = self.delta[i * k + c]
+                if j != -1:
+                    row[symbol] = self.labels[j]
+            map[state] = row
+        return map
+
+
 class fsm:
     """
     A Finite State Machine or FSM has an alphabet and a set of states. At any
@@ -99,6 +281,59 @@ class fsm:
         self.__dict__["finals"] = set(finals)
         self.__dict__["map"] = map
 
+    @classmethod
+    def unchecked(cls, alphabet, states, initial, finals, map):
+        """
+        Build an FSM from parts which are already known to be consistent, e.g.
+        because they come from another FSM. Unlike `__init__()`, this neither
+        validates nor copies them, so they must not be changed afterwards.
+        """
+        new = cls.__new__(cls)
+        new.__dict__["alphabet"] = alphabet
+        new.__dict__["states"] = states
+        new.__dict__["initial"] = initial
+        new.__dict__["finals"] = finals
+        new.__dict__["map"] = map
+        return new
+
+    @classmethod
+    def from_table(cls, alphabet, t):
+        """
+        Wrap a `table` whose states are numbered 0..n-1. The dict-of-dicts
+        `map` is only built if somebody asks for it.
+        """
+        new = cls.__new__(cls)
+        new.__dict__["alphabet"] = set(alphabet)
+        new.__dict__["states"] = set(range(len(t.finals)))
+        new.__dict__["initial"] = t.initial
+        new.__dict__["finals"] = set(i for (i, accepting) in enumerate(t.finals) if accepting)
+        new.__dict__["table"] = t
+        return new
+
+    def __getattr__(self, name):
+        """
+        `map` and `table` are two views of the same transitions. Whichever
+        one is missing is built from the other on first use.
+        """
+        if name == "table" and "map" in self.__dict__:
+            value = table.from_map(self.alphabet, self.states, self.initial, self.finals, self.map)
+        elif name == "map" and "table" in self.__dict__:
+            value = self.__dict__["table"].to_map()
+        else:
+            raise AttributeError(name)
+        self.__dict__[name] = value
+        return value
+
+    def __getstate__(self):
+        """Pickle the plain dict-of-dicts form so old caches stay readable."""
+        return {
+            "alphabet": self.alphabet,
+            "states": self.states,
+            "initial": self.initial,
+            "finals": self.finals,
+            "map": self.map,
+        }
+
     def accepts(self, input):
         """
         Test whether the present FSM accepts the supplied string (iterable of
@@ -108,17 +343,19 @@ class fsm:
         If `fsm.anything_else` is in your alphabet, then any symbol not in your
         alphabet will be converted to `fsm.anything_else`.
         """
-        state = self.initial
+        t = self.table
+        k = len(t.symbols)
+        state = t.initial
         for symbol in input:
-            if anything_else in self.alphabet and not symbol in self.alphabet:
-                symbol = anything_else
+            column = t.column(symbol)
 
             # Missing transition = transition to dead state
-            if not (state in self.map and symbol in self.map[state]):
+            if column == -1:
                 return False
-
-            state = self.map[state][symbol]
-        return state in self.finals
+            state = t.delta[state * k + column]
+            if state == -1:
+                return False
+        return bool(t.finals[state])
 
     def __contains__(self, string):
         """
@@ -128,6 +365,57 @@ class fsm:
         return self.accepts(string)
 
     def reduce(self):
+        """
+        Return a minimal finite state machine equivalent to the original. This
+        uses `revuz()` for FSMs recognising finitely many strings, such as sets
+        of device names, and `hopcroft()` for the rest; `brzozowski()` computes
+        the same FSM in a different way and is kept for cross-checking.
+        """
+        if self.table.topological() is not None:
+            return self.revuz()
+        return self.hopcroft()
+
+    def revuz(self):
+        """
+        Minimise an acyclic FSM in linear time (Revuz, 1992). Going through the
+        states in reverse topological order, all successors of a state have
+        already been merged, so two states are equivalent exactly when they
+        agree on finality and on where each symbol leads. The merged states
+        are numbered exactly as `hopcroft()` numbers them.
+        """
+        t = self.table
+        k = len(t.symbols)
+        delta = t.delta
+        order = t.topological()
+
+        if not order:
+
+            def follow(current, symbol):
+                raise OblivionError
+
+            return crawl(self.alphabet, 0, lambda state: False, follow)
+
+        block = {}
+        register = {}
+        representative = []
+        for q in reversed(order):
+            signature = (t.finals[q],) + tuple(block.get(j, -1) for j in delta[q * k : (q + 1) * k])
+            if signature not in register:
+                register[signature] = len(representative)
+                representative.append(q)
+            block[q] = register[signature]
+
+        def final(b):
+            return t.finals[representative[b]]
+
+        def successors(b):
+            q = representative[b]
+            return [block.get(j) for j in delta[q * k : (q + 1) * k]]
+
+        columns = [t.column(symbol) for symbol in sorted(self.alphabet, key=key)]
+        return renumber(self.alphabet, block[t.initial], final, successors, columns)
+
+    def brzozowski(self):
         """
         A result by Brzozowski (1963) shows that a minimal finite state machine
         equivalent to the original can be obtained by reversing the original
@@ -135,6 +423,93 @@ class fsm:
         """
         return reversed(reversed(self))
 
+    def hopcroft(self):
+        """
+        Minimise by partition refinement (Hopcroft, 1971). Unreachable and dead
+        states are dropped first, then the remaining states are split into
+        blocks of equivalent states, with the oblivion state standing in for
+        every missing transition. Crawling the blocks from the initial one
+        numbers the states exactly as `brzozowski()` does.
+        """
+        t = self.table
+        k = len(t.symbols)
+        delta = t.delta
+
+        # Only states which are both reachable and live survive.
+        alive = t.alive()
+
+        if t.initial not in alive:
+
+            def follow(current, symbol):
+                raise OblivionError
+
+            return crawl(self.alphabet, 0, lambda state: False, follow)
+
+        # Renumber the survivors 0..m-1; m is the oblivion state. Columns in
+        # the same symbol class split blocks identically, so one of each will do.
+        classes = symbol_classes([t], self.alphabet)
+        columns = [t.column(symbols[0]) for symbols in classes]
+        states = sorted(alive)
+        number = dict((q, i) for (i, q) in enumerate(states))
+        sink = len(states)
+        inverse = [[[] for j in range(sink + 1)] for c in columns]
+        for (i, q) in enumerate(states):
+            for (x, c) in enumerate(columns):
+                inverse[x][number.get(delta[q * k + c], sink)].append(i)
+        for x in range(len(columns)):
+            inverse[x][sink].append(sink)
+
+        finals = set(i for (i, q) in enumerate(states) if t.finals[q])
+        blocks = [finals, set(range(sink + 1)) - finals]
+        block = [0 if i in finals else 1 for i in range(sink + 1)]
+        smaller = 0 if len(blocks[0]) <= len(blocks[1]) else 1
+        waiting = [(smaller, x) for x in range(len(columns))]
+        pending = set(waiting)
+
+        while waiting:
+            splitter = waiting.pop()
+            pending.discard(splitter)
+            (a, c) = splitter
+
+            # Every block with some but not all states leading into `a` on `c`
+            # is split in two.
+            touched = {}
+            for j in blocks[a]:
+                for p in inverse[c][j]:
+                    touched.setdefault(block[p], []).append(p)
+            for (b, inside) in touched.items():
+                if len(inside) == len(blocks[b]):
+                    continue
+                inside = set(inside)
+                if 2 * len(inside) <= len(blocks[b]):
+                    new = inside
+                    blocks[b] -= inside
+                else:
+                    new = blocks[b] - inside
+                    blocks[b] = inside
+                z = len(blocks)
+                blocks.append(new)
+                for p in new:
+                    block[p] = z
+                # `new` is the smaller half, so it is always the one to enqueue
+                for d in range(len(columns)):
+                    if (z, d) not in pending:
+                        pending.add((z, d))
+                        waiting.append((z, d))
+
+        representative = [states[min(b)] if sink not in b else None for b in blocks]
+
+        def follow(current, symbol):
+            j = number.get(delta[representative[current] * k + t.column(symbol)], sink)
+            if j == sink:
+                raise OblivionError
+            return block[j]
+
+        def final(state):
+            return bool(t.finals[representative[state]])
+
+        return crawl(self.alphabet, block[number[t.initial]], final, follow, lambda state: classes)
+
     def __repr__(self):
         string = "fsm("
         string += "alphabet = " + repr(self.alphabet)
@@ -192,18 +567,24 @@ class fsm:
         Concatenate arbitrarily many finite state machines together.
         """
         alphabet = set().union(*[fsm.alphabet for fsm in fsms])
+        connected = {}
 
         def connect_all(i, substate):
             """
             Take a state in the numbered FSM and return a set containing it, plus
             (if it's final) the first state from the next FSM, plus (if that's
             final) the first state from the next but one FSM, plus...
+            The answer only depends on `(i, substate)`, so it is memoized.
             """
+            if (i, substate) in connected:
+                return connected[(i, substate)]
             result = {(i, substate)}
+            first = (i, substate)
             while i < len(fsms) - 1 and substate in fsms[i].finals:
                 i += 1
                 substate = fsms[i].initial
                 result.add((i, substate))
+            connected[first] = result
             return result
 
         # Use a superset containing states from all FSMs at once.
@@ -239,7 +620,8 @@ class fsm:
                 raise OblivionError
             return frozenset(next)
 
-        return crawl(alphabet, initial, final, follow).reduce()
+        classes = symbol_classes([fsm.table for fsm in fsms], alphabet)
+        return crawl(alphabet, initial, final, follow, lambda state: classes).reduce()
 
     def __add__(self, other):
         """
@@ -259,7 +641,7 @@ class fsm:
         """
         alphabet = self.alphabet
 
-        initial = {self.initial}
+        initial = frozenset([self.initial])
 
         def follow(state, symbol):
             next = set()
@@ -280,7 +662,8 @@ class fsm:
         def final(state):
             return any(substate in self.finals for substate in state)
 
-        return crawl(alphabet, initial, final, follow) | epsilon(alphabet)
+        classes = symbol_classes([self.table], alphabet)
+        return crawl(alphabet, initial, final, follow, lambda state: classes) | epsilon(alphabet)
 
     def times(self, multiplier):
         """
@@ -292,7 +675,7 @@ class fsm:
         alphabet = self.alphabet
 
         # metastate is a set of iterations+states
-        initial = {(self.initial, 0)}
+        initial = frozenset([(self.initial, 0)])
 
         def final(state):
             """If the initial state is final then multiplying doesn't alter that"""
@@ -313,7 +696,8 @@ class fsm:
                 raise OblivionError
             return frozenset(next)
 
-        return crawl(alphabet, initial, final, follow).reduce()
+        classes = symbol_classes([self.table], alphabet)
+        return crawl(alphabet, initial, final, follow, lambda state: classes).reduce()
 
     def __mul__(self, multiplier):
         """
@@ -381,20 +765,24 @@ class fsm:
         missing "dead" state must now be reified.
         """
         alphabet = self.alphabet
+        t = self.table
+        k = len(t.symbols)
 
-        initial = {0: self.initial}
+        # -1 is the reified dead state
+        initial = t.initial
 
         def follow(current, symbol):
-            next = {}
-            if 0 in current and current[0] in self.map and symbol in self.map[current[0]]:
-                next[0] = self.map[current[0]][symbol]
-            return next
+            column = t.column(symbol)
+            if current == -1 or column == -1:
+                return -1
+            return t.delta[current * k + column]
 
         # state is final unless the original was
         def final(state):
-            return not (0 in state and state[0] in self.finals)
+            return state == -1 or not t.finals[state]
 
-        return crawl(alphabet, initial, final, follow).reduce()
+        classes = symbol_classes([t], alphabet)
+        return crawl(alphabet, initial, final, follow, lambda state: classes).reduce()
 
     def reversed(self):
         """
@@ -402,33 +790,37 @@ class fsm:
         "beer", the new FSM accepts the reversed string ("reeb").
         """
         alphabet = self.alphabet
+        t = self.table
+        k = len(t.symbols)
+
+        # Index every transition backwards once, instead of rescanning the
+        # whole map for every state-set and symbol.
+        predecessors = {}
+        for (i, j) in enumerate(t.delta):
+            if j != -1:
+                predecessors.setdefault((i % k, j), []).append(i // k)
 
         # Start from a composite "state-set" consisting of all final states.
         # If there are no final states, this set is empty and we'll find that
         # no other states get generated.
-        initial = frozenset(self.finals)
+        initial = frozenset(i for (i, accepting) in enumerate(t.finals) if accepting)
 
         # Find every possible way to reach the current state-set
         # using this symbol.
         def follow(current, symbol):
-            next = frozenset(
-                [
-                    prev
-                    for prev in self.map
-                    for state in current
-                    if symbol in self.map[prev] and self.map[prev][symbol] == state
-                ]
-            )
+            column = t.columns.get(symbol, -1)
+            next = frozenset(prev for state in current for prev in predecessors.get((column, state), ()))
             if len(next) == 0:
                 raise OblivionError
             return next
 
         # A state-set is final if the initial state is in it.
         def final(state):
-            return self.initial in state
+            return t.initial in state
 
         # Man, crawl() is the best!
-        return crawl(alphabet, initial, final, follow)
+        classes = symbol_classes([t], alphabet)
+        return crawl(alphabet, initial, final, follow, lambda state: classes)
         # Do not reduce() the result, since reduce() calls us in turn
 
     def __reversed__(self):
@@ -462,7 +854,18 @@ class fsm:
         initial state. Equally, an FSM may be non-empty despite having an empty
         alphabet if the initial state is final.
         """
-        return not self.islive(self.initial)
+        t = self.table
+        k = len(t.symbols)
+        reachable = [t.initial]
+        seen = {t.initial}
+        for current in reachable:
+            if t.finals[current]:
+                return False
+            for next in t.delta[current * k : (current + 1) * k]:
+                if next != -1 and next not in seen:
+                    seen.add(next)
+                    reachable.append(next)
+        return True
 
     def strings(self):
         """
@@ -513,13 +916,145 @@ class fsm:
         """
         return self.strings()
 
+    def lexmin(self, marker=""):
+        """
+        Return the lexicographically smallest string this FSM accepts, or None
+        if it accepts none. With a `marker`, return instead the smallest of the
+        suffixes of accepted strings starting at the first occurrence of
+        `marker`. Found by a greedy walk of the states, so no strings need to be
+        generated. Transitions on `anything_else` are not followed, since they
+        stand for no particular character. Raises a ValueError if there are
+        ever smaller strings without end, as with "a*b".
+        """
+        return self.lexbound(marker, min)
+
+    def lexmax(self, marker=""):
+        """
+        Like `lexmin()`, but return the lexicographically largest string.
+        Raises a ValueError if there are ever larger strings without end, as
+        with "a+".
+        """
+        return self.lexbound(marker, max)
+
+    def lexbound(self, marker, pick):
+        """
+        The walk behind `lexmin()` and `lexmax()`; `pick` is `min` or `max`.
+        """
+        t = self.table
+        k = len(t.symbols)
+        delta = t.delta
+        symbols = [(symbol, c) for (c, symbol) in enumerate(t.symbols) if symbol is not anything_else]
+
+        # States from which a final state can still be reached.
+        predecessors = {}
+        for q in range(len(t.finals)):
+            for (symbol, c) in symbols:
+                if delta[q * k + c] != -1:
+                    predecessors.setdefault(delta[q * k + c], []).append(q)
+        live = [q for q in range(len(t.finals)) if t.finals[q]]
+        alive = set(live)
+        for q in live:
+            for p in predecessors.get(q, ()):
+                if p not in alive:
+                    alive.add(p)
+                    live.append(p)
+
+        # Find the states right after the first occurrence of the marker,
+        # keeping track of how much of the marker has been matched so far.
+        if marker:
+            marker = list(marker)
+            matched = {}
+
+            def progress(j, symbol):
+                if (j, symbol) not in matched:
+                    text = marker[:j] + [symbol]
+                    l = min(len(text), len(marker))
+                    while l > 0 and text[len(text) - l :] != marker[:l]:
+                        l -= 1
+                    matched[(j, symbol)] = l
+                return matched[(j, symbol)]
+
+            starts = set()
+            seen = {(t.initial, 0)}
+            queue = [(t.initial, 0)]
+            for (q, j) in queue:
+                for (c, symbol) in enumerate(t.symbols):
+                    next = delta[q * k + c]
+                    if next == -1:
+                        continue
+                    m = progress(j, symbol)
+                    if m == len(marker):
+                        starts.add(next)
+                    elif (next, m) not in seen:
+                        seen.add((next, m))
+                        queue.append((next, m))
+        else:
+            marker = []
+            starts = {t.initial}
+
+        # Greedily follow the smallest (or largest) symbol which can still
+        # lead to acceptance. Coming back to the same states means that the
+        # walk would go on forever.
+        string = marker
+        current = frozenset(starts & alive)
+        if not current:
+            return None
+        visited = set()
+        while True:
+            accepting = any(t.finals[q] for q in current)
+            if pick is min and accepting:
+                return "".join(string)
+            if current in visited:
+                raise ValueError("No {} string".format("smallest" if pick is min else "largest"))
+            visited.add(current)
+            options = {}
+            for (symbol, c) in symbols:
+                next = frozenset(delta[q * k + c] for q in current) & alive
+                if next:
+                    options[symbol] = next
+            if not options:
+                return "".join(string)
+            symbol = pick(options)
+            string.append(symbol)
+            current = options[symbol]
+
     def equivalent(self, other):
         """
         Two FSMs are considered equivalent if they recognise the same strings.
-        Or, to put it another way, if their symmetric difference recognises no
-        strings.
-        """
-        return (self ^ other).empty()
+        This is decided with the near-linear algorithm of Hopcroft and Karp
+        (1971): states of the two FSMs reached by the same string are merged
+        with union-find, and the FSMs differ as soon as two merged states
+        disagree on finality. Both oblivion states are one shared state.
+        """
+        t1 = self.table
+        t2 = other.table
+        n1 = len(t1.finals)
+        dead = n1 + len(t2.finals)
+        parent = list(range(dead + 1))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        classes = symbol_classes([t1, t2], union_alphabet([self, other]))
+        successors = [(t1.successor(t1.column(symbols[0])), t2.successor(t2.column(symbols[0]))) for symbols in classes]
+
+        parent[n1 + t2.initial] = t1.initial
+        pairs = [(t1.initial, t2.initial)]
+        while pairs:
+            (p, q) = pairs.pop()
+            if (p != -1 and bool(t1.finals[p])) != (q != -1 and bool(t2.finals[q])):
+                return False
+            for (s1, s2) in successors:
+                (p2, q2) = (s1[p], s2[q])
+                x = find(dead if p2 == -1 else p2)
+                y = find(dead if q2 == -1 else n1 + q2)
+                if x != y:
+                    parent[x] = y
+                    pairs.append((p2, q2))
+        return True
 
     def __eq__(self, other):
         """
@@ -533,7 +1068,7 @@ class fsm:
         Two FSMs are considered different if they have a non-empty symmetric
         difference.
         """
-        return not (self ^ other).empty()
+        return not self.equivalent(other)
 
     def __ne__(self, other):
         """
@@ -555,35 +1090,20 @@ class fsm:
     def cardinality(self):
         """
         Consider the FSM as a set of strings and return the cardinality of that
-        set, or raise an OverflowError if there are infinitely many
-        """
+        set, or raise an OverflowError if there are infinitely many. Otherwise
+        the live states are acyclic, and the strings from each of them are
+        counted in one pass in reverse topological order.
+        """
+        t = self.table
+        order = t.topological()
+        if order is None:
+            # There is a cycle! There are infinitely many strings recognised
+            raise OverflowError("Language has infinite cardinality")
+        k = len(t.symbols)
         num_strings = {}
-
-        def get_num_strings(state):
-            # Many FSMs have at least one oblivion state
-            if self.islive(state):
-                if state in num_strings:
-                    if num_strings[state] is None:  # "computing..."
-                        # Recursion! There are infinitely many strings recognised
-                        raise OverflowError(state)
-                    return num_strings[state]
-                num_strings[state] = None  # i.e. "computing..."
-
-                n = 0
-                if state in self.finals:
-                    n += 1
-                if state in self.map:
-                    for symbol in self.map[state]:
-                        n += get_num_strings(self.map[state][symbol])
-                num_strings[state] = n
-
-            else:
-                # Dead state
-                num_strings[state] = 0
-
-            return num_strings[state]
-
-        return get_num_strings(self.initial)
+        for q in reversed(order):
+            num_strings[q] = t.finals[q] + sum(num_strings.get(j, 0) for j in t.delta[q * k : (q + 1) * k])
+        return num_strings.get(t.initial, 0)
 
     def __len__(self):
         """
@@ -596,14 +1116,14 @@ class fsm:
         """
         Treat `self` and `other` as sets of strings and see if they are disjoint
         """
-        return (self & other).empty()
+        return not search([self, other], all)
 
     def issubset(self, other):
         """
         Treat `self` and `other` as sets of strings and see if `self` is a subset
         of `other`... `self` recognises no strings which `other` doesn't.
         """
-        return (self - other).empty()
+        return not search([self, other], lambda accepts: accepts[0] and not accepts[1])
 
     def __le__(self, other):
         """
@@ -615,9 +1135,11 @@ class fsm:
     def ispropersubset(self, other):
         """
         Treat `self` and `other` as sets of strings and see if `self` is a proper
-        subset of `other`.
+        subset of `other`. One walk of the product answers both halves of the
+        question, and it stops at the first string only `self` accepts.
         """
-        return self <= other and self != other
+        (left, common, right) = compare(self, other, lambda found: found[0])
+        return not left and right
 
     def __lt__(self, other):
         """
@@ -631,7 +1153,7 @@ class fsm:
         Treat `self` and `other` as sets of strings and see if `self` is a
         superset of `other`.
         """
-        return (other - self).empty()
+        return other.issubset(self)
 
     def __ge__(self, other):
         """
@@ -645,7 +1167,7 @@ class fsm:
         Treat `self` and `other` as sets of strings and see if `self` is a proper
         superset of `other`.
         """
-        return self >= other and self != other
+        return other.ispropersubset(self)
 
     def __gt__(self, other):
         """
@@ -654,18 +1176,40 @@ class fsm:
         """
         return self.ispropersuperset(other)
 
+    def fingerprint(self):
+        """
+        Return a digest of the transition table with its states renumbered in
+        breadth-first order, following symbols in sorted order. Two minimal
+        FSMs over the same alphabet have the same fingerprint exactly when
+        they recognise the same strings, so it can key caches of results.
+        """
+        if "_fingerprint" not in self.__dict__:
+            t = self.table
+            k = len(t.symbols)
+            number = {t.initial: 0}
+            order = [t.initial]
+            for state in order:
+                for next in t.delta[state * k : (state + 1) * k]:
+                    if next != -1 and next not in number:
+                        number[next] = len(order)
+                        order.append(next)
+            number[-1] = -1
+            delta = array("l", [number[next] for state in order for next in t.delta[state * k : (state + 1) * k]])
+            digest = hashlib.blake2b(repr(t.symbols).encode(), digest_size=16)
+            digest.update(bytes(t.finals[state] for state in order))
+            digest.update(delta.tobytes())
+            self.__dict__["_fingerprint"] = digest.digest()
+        return self.__dict__["_fingerprint"]
+
     def copy(self):
         """
         For completeness only, since `set.copy()` also exists. FSM objects are
-        immutable, so I can see only very odd reasons to need this.
+        immutable, so the copy simply shares everything with the original,
+        including its table and whatever has been worked out about it.
         """
-        return fsm(
-            alphabet=self.alphabet,
-            states=self.states,
-            initial=self.initial,
-            finals=self.finals,
-            map=self.map,
-        )
+        new = fsm.__new__(fsm)
+        new.__dict__.update(self.__dict__)
+        return new
 
     def derive(self, input):
         """
@@ -692,13 +1236,7 @@ class fsm:
 
             # OK so now we have consumed that string, use the new location as the
             # starting point.
-            return fsm(
-                alphabet=self.alphabet,
-                states=self.states,
-                initial=state,
-                finals=self.finals,
-                map=self.map,
-            )
+            return fsm.unchecked(self.alphabet, self.states, state, self.finals, self.map)
 
         except OblivionError:
             # Fell out of the FSM. The derivative of this FSM is the empty FSM.
@@ -711,15 +1249,8 @@ def null(alphabet):
     demonstrates that this is possible, and is also extremely useful
     in some situations
     """
-    return fsm(
-        alphabet=alphabet,
-        states={0},
-        initial=0,
-        finals=set(),
-        map={
-            0: dict([(symbol, 0) for symbol in alphabet]),
-        },
-    )
+    alphabet = set(alphabet)
+    return fsm.unchecked(alphabet, {0}, 0, set(), {0: dict([(symbol, 0) for symbol in alphabet])})
 
 
 def epsilon(alphabet):
@@ -727,20 +1258,12 @@ def epsilon(alphabet):
     Return an FSM matching an empty string, "", only.
     This is very useful in many situations
     """
-    return fsm(
-        alphabet=alphabet,
-        states={0},
-        initial=0,
-        finals={0},
-        map={},
-    )
+    return fsm.unchecked(set(alphabet), {0}, 0, {0}, {})
 
 
-def parallel(fsms, test):
+def union_alphabet(fsms):
     """
-    Crawl several FSMs in parallel, mapping the states of a larger meta-FSM.
-    To determine whether a state in the larger FSM is final, pass all of the
-    finality statuses (e.g. [True, False, False] to `test`.
+    The alphabet of several FSMs crawled in parallel.
     """
     alphabet = set().union(*[fsm.alphabet for fsm in fsms])
 
@@ -754,45 +1277,290 @@ def parallel(fsms, test):
                 has_anything_else = True
         else:
             copied.append(tmp)
-    alphabet = copied
+    return copied
 
-    initial = dict([(i, fsm.initial) for (i, fsm) in enumerate(fsms)])
+
+def parallel(fsms, test):
+    """
+    Crawl several FSMs in parallel, mapping the states of a larger meta-FSM.
+    To determine whether a state in the larger FSM is final, pass all of the
+    finality statuses (e.g. [True, False, False] to `test`.
+    """
+    alphabet = union_alphabet(fsms)
+
+    tables = [fsm.table for fsm in fsms]
+    if tables and all(t.topological() is not None for t in tables):
+        return parallel_acyclic(alphabet, tables, test)
+    initial = tuple(t.initial for t in tables)
+    oblivion = (-1,) * len(tables)
+
+    # Resolve every symbol of the new alphabet to a column of each FSM up
+    # front, so following a transition is just indexing into the tables.
+    successors = dict((symbol, [t.successor(t.column(symbol)) for t in tables]) for symbol in alphabet)
 
     # dedicated function accepts a "superset" and returns the next "superset"
-    # obtained by following this transition in the new FSM
+    # obtained by following this transition in the new FSM. -1 marks an FSM
+    # which has fallen into its oblivion state.
     def follow(current, symbol):
-        next = {}
-        for i in range(len(fsms)):
-            if symbol not in fsms[i].alphabet and anything_else in fsms[i].alphabet:
-                actual_symbol = anything_else
-            else:
-                actual_symbol = symbol
-            if i in current and current[i] in fsms[i].map and actual_symbol in fsms[i].map[current[i]]:
-                next[i] = fsms[i].map[current[i]][actual_symbol]
-        if len(next.keys()) == 0:
+        next = tuple(map(getitem, successors[symbol], current))
+        if next == oblivion:
             raise OblivionError
         return next
 
     # Determine the "is final?" condition of each substate, then pass it to the
     # test to determine finality of the overall FSM.
     def final(state):
-        accepts = [i in state and state[i] in fsm.finals for (i, fsm) in enumerate(fsms)]
+        accepts = [state[i] != -1 and bool(t.finals[state[i]]) for (i, t) in enumerate(tables)]
         return test(accepts)
 
-    return crawl(alphabet, initial, final, follow).reduce()
+    classes = symbol_classes(tables, alphabet)
+    live = live_classes(tables, classes)
+    return crawl(alphabet, initial, final, follow, lambda state: [classes[x] for x in live(state)]).reduce()
 
 
-def crawl(alphabet, initial, final, follow):
+def parallel_acyclic(alphabet, tables, test):
+    """
+    `parallel()` for FSMs recognising finitely many strings, such as sets of
+    device names. Their live states are acyclic, so the meta-FSM is too, and
+    it is built depth first: a meta-state is only finished once all of its
+    successors are, and it is merged straight away with a finished one which
+    agrees on finality and successors, as in `revuz()`. States from which
+    nothing is accepted are dropped as they are found. So the meta-states are
+    visited once each and the result comes out minimal, without crawling the
+    whole product first and reducing it after.
+    """
+    classes = symbol_classes(tables, alphabet)
+    live = live_classes(tables, classes)
+    successors = [[t.useful_successor(t.column(symbols[0])) for t in tables] for symbols in classes]
+    initial = tuple(t.initial if t.initial in t.alive() else -1 for t in tables)
+    oblivion = (-1,) * len(tables)
+
+    # the merged state of every meta-state, -1 if nothing is accepted from it
+    merged = {oblivion: -1}
+    register = {}
+    finals = []
+    rows = []
+    expanded = {}
+    stack = [initial]
+    while stack:
+        state = stack[-1]
+        if state in merged:
+            stack.pop()
+            continue
+        if state not in expanded:
+            expanded[state] = [(x, tuple(map(getitem, successors[x], state))) for x in live(state)]
+            pending = [next for (x, next) in expanded[state] if next not in merged]
+            if pending:
+                stack.extend(pending)
+                continue
+        stack.pop()
+        row = tuple((x, merged[next]) for (x, next) in expanded.pop(state) if merged[next] != -1)
+        accepting = test([q != -1 and bool(t.finals[q]) for (q, t) in zip(state, tables)])
+        if not accepting and not row:
+            merged[state] = -1
+            continue
+        signature = (accepting, row)
+        if signature not in register:
+            register[signature] = len(rows)
+            finals.append(accepting)
+            rows.append(dict(row))
+        merged[state] = register[signature]
+
+    if merged[initial] == -1:
+
+        def follow(current, symbol):
+            raise OblivionError
+
+        return crawl(alphabet, 0, lambda state: False, follow)
+
+    symbol_class = {}
+    for (x, symbols) in enumerate(classes):
+        for symbol in symbols:
+            symbol_class[symbol] = x
+    columns = [symbol_class[symbol] for symbol in sorted(alphabet, key=key)]
+    everywhere = range(len(classes))
+
+    def successors_of(b):
+        return [rows[b].get(x) for x in everywhere]
+
+    return renumber(alphabet, merged[initial], finals.__getitem__, successors_of, columns)
+
+
+def renumber(alphabet, initial, final, successors, columns):
+    """
+    Build the table of a minimal FSM given as `initial`, `final(state)` and
+    `successors(state)`, the next state (or None) for each class of symbols.
+    `columns` gives the class of every symbol of `alphabet` in `key` order,
+    and the classes are in the order of their first symbols. The states are
+    numbered in the order `crawl()` would find them, so equal FSMs come out
+    with equal tables.
+    """
+    symbols = sorted(alphabet, key=key)
+    number = {None: -1, initial: 0}
+    states = [initial]
+    finals = bytearray()
+    rows = array("l")
+    for state in states:
+        finals.append(final(state))
+        row = successors(state)
+        for j in row:
+            if j not in number:
+                number[j] = len(states)
+                states.append(j)
+        row = [number[j] for j in row]
+        rows.extend([row[x] for x in columns])
+    return fsm.from_table(alphabet, table(symbols, range(len(states)), 0, finals, rows))
+
+
+def symbol_classes(tables, alphabet):
+    """
+    Split `alphabet` into classes of symbols which lead to the same place from
+    every state of every one of `tables`, so that crawling them in parallel
+    only needs to follow one symbol per class. A symbol outside some FSM's
+    alphabet behaves like its `anything_else` there, and is classed with it.
+    """
+    classes = {}
+    for symbol in sorted(alphabet, key=key):
+        signature = tuple(t.symbol_class(symbol) for t in tables)
+        classes.setdefault(signature, []).append(symbol)
+    return list(classes.values())
+
+
+def live_classes(tables, classes):
+    """
+    Return a function giving, for a state of the meta-FSM crawled over
+    `tables` in parallel, the indices of the symbol `classes` which lead
+    somewhere from it. In a device name most symbols are only allowed in a few
+    positions, so from any given state most classes lead every FSM into
+    oblivion and can be skipped without following them.
+    """
+    members = [{} for t in tables]
+    for (x, symbols) in enumerate(classes):
+        for (i, t) in enumerate(tables):
+            members[i].setdefault(t.column(symbols[0]), []).append(x)
+
+    def live(current):
+        found = set()
+        for (i, state) in enumerate(current):
+            if state != -1:
+                for c in tables[i].live_columns(state):
+                    found.update(members[i].get(c, ()))
+        return sorted(found)
+
+    return live
+
+
+def search(fsms, test):
+    """
+    Walk the same meta-FSM that `parallel()` would crawl, breadth first, and
+    return True as soon as a state is found whose finality statuses pass
+    `test`. No FSM is built, and states from which no such state can be
+    reached any more, because too many of the FSMs have fallen into oblivion,
+    are not explored further.
+    """
+    tables = [fsm.table for fsm in fsms]
+    initial = tuple(t.initial for t in tables)
+    oblivion = (-1,) * len(tables)
+
+    # Only one symbol of each class needs following.
+    classes = symbol_classes(tables, union_alphabet(fsms))
+    successors = [[t.successor(t.column(symbols[0])) for t in tables] for symbols in classes]
+
+    def possible(dead):
+        """Can `test` still pass once the FSMs marked `dead` are in oblivion?"""
+        live = [i for (i, d) in enumerate(dead) if not d]
+        for mask in range(2 ** len(live)):
+            accepts = [False] * len(tables)
+            for (bit, i) in enumerate(live):
+                accepts[i] = bool(mask >> bit & 1)
+            if test(accepts):
+                return True
+        return False
+
+    viable = {}
+    seen = {initial}
+    queue = [initial]
+    for state in queue:
+        dead = tuple(substate == -1 for substate in state)
+        if dead not in viable:
+            viable[dead] = possible(dead)
+        if not viable[dead]:
+            continue
+        if test([substate != -1 and bool(t.finals[substate]) for (substate, t) in zip(state, tables)]):
+            return True
+        for successor in successors:
+            next = tuple(map(getitem, successor, state))
+            if next != oblivion and next not in seen:
+                seen.add(next)
+                queue.append(next)
+    return False
+
+
+def compare(a, b, enough=all):
+    """
+    Walk the product of `a` and `b` once, breadth first, noting whether it
+    reaches strings accepted by `a` only, by both, and by `b` only. Return
+    those three booleans as a list; e.g. `[False, True, True]` means `a` is a
+    proper subset of `b`. The walk stops early once `enough(found)` holds, by
+    default once all three have been found.
+    """
+    tables = [a.table, b.table]
+    initial = (a.table.initial, b.table.initial)
+    oblivion = (-1, -1)
+    classes = symbol_classes(tables, union_alphabet([a, b]))
+    successors = [[t.successor(t.column(symbols[0])) for t in tables] for symbols in classes]
+
+    found = [False, False, False]
+    seen = {initial}
+    queue = [initial]
+    for state in queue:
+        (p, q) = state
+        # Once one FSM is in oblivion, only the other one's strings are left
+        # to find. Don't look for them again.
+        if (p == -1 and found[2]) or (q == -1 and found[0]):
+            continue
+        accepts1 = p != -1 and bool(tables[0].finals[p])
+        accepts2 = q != -1 and bool(tables[1].finals[q])
+        if accepts1 and accepts2:
+            found[1] = True
+        elif accepts1:
+            found[0] = True
+        elif accepts2:
+            found[2] = True
+        if enough(found):
+            break
+        for successor in successors:
+            next = tuple(map(getitem, successor, state))
+            if next != oblivion and next not in seen:
+                seen.add(next)
+                queue.append(next)
+    return found
+
+
+def crawl(alphabet, initial, final, follow, classes=None):
     """
     Given the above conditions and instructions, crawl a new unknown FSM,
     mapping its states, final states and transitions. Return the new FSM.
     This is a pretty powerful procedure which could potentially go on
     forever if you supply an evil version of follow().
+    States returned by `follow()` must be hashable: each new state is numbered
+    through a dictionary rather than by searching the list of known states.
+    `classes`, if supplied, is a function returning the classes of
+    interchangeable symbols (see `symbol_classes()`) worth following from a
+    state, in order. `follow()` is then only called for the first symbol of
+    each class, and symbols in none of them lead to oblivion.
     """
 
+    symbols = sorted(alphabet, key=key)
+    column = dict((symbol, c) for (c, symbol) in enumerate(symbols))
+    if classes is None:
+        singletons = [[symbol] for symbol in symbols]
+        classes = lambda state: singletons
+    columns = {}
     states = [initial]
-    finals = set()
-    map = {}
+    index = {initial: 0}
+    finals = bytearray()
+    delta = array("l")
 
     # iterate over a growing list
     i = 0
@@ -800,34 +1568,30 @@ def crawl(alphabet, initial, final, follow):
         state = states[i]
 
         # add to finals
-        if final(state):
-            finals.add(i)
+        finals.append(1 if final(state) else 0)
 
-        # compute map for this state
-        map[i] = {}
-        # print(alphabet)
-        for symbol in sorted(alphabet, key=key):
+        # compute the row for this state
+        row = [-1] * len(symbols)
+        for group in classes(state):
+            if id(group) not in columns:
+                columns[id(group)] = [column[symbol] for symbol in group]
             try:
-                next = follow(state, symbol)
+                next = follow(state, group[0])
 
-                try:
-                    j = states.index(next)
-                except ValueError:
+                j = index.get(next)
+                if j is None:
                     j = len(states)
+                    index[next] = j
                     states.append(next)
 
             except OblivionError:
                 # Reached an oblivion state. Don't list it.
                 continue
 
-            map[i][symbol] = j
+            for c in columns[id(group)]:
+                row[c] = j
+        delta.extend(row)
 
         i += 1
 
-    return fsm(
-        alphabet=alphabet,
-        states=range(len(states)),
-        initial=0,
-        finals=finals,
-        map=map,
-    )
+    return fsm.from_table(alphabet, table(symbols, range(len(states)), 0, finals, delta))
@@ -4,7 +4,7 @@ if __name__ == "__main__":
     raise Exception("Test files can't be run directly. Use `python -m pytest greenery`")
 
 import pytest
-from greenery.fsm import fsm, null, epsilon, anything_else
+from greenery.fsm import fsm, null, epsilon, anything_else, search, compare, symbol_classes, live_classes
 
 def test_addbug():
     # Odd bug with fsm.__add__(), exposed by "[bc]*c"
@@ -676,6 +676,15 @@ def test_derive(a, b):
     assert (a * 3).derive("a") == a * 2
     assert (a.star() - epsilon({"a", "b"})).derive("a") == a.star()
 
+def test_copy(a):
+    # FSMs are immutable, so a copy shares the work done on the original
+    a.reduce()
+    c = a.copy()
+    assert c == a
+    assert c.table is a.table
+    assert c.derive("a").accepts("")
+    assert not a.derive("a").derive("a").accepts("")
+
 def test_bug_36():
     etc1 = fsm(
         alphabet = {anything_else},
@@ -725,3 +734,316 @@ def test_add_anything_else():
         map = {0: {anything_else: 1}}
     )
     assert (fsm1 + fsm2).accepts("ba")
+
+def test_table(a):
+    # Dense view of a dict-of-dicts FSM
+    t = a.table
+    assert t.symbols == ["a", "b"]
+    assert t.column("a") == 0
+    assert t.column("c") == -1
+    assert t.labels[t.initial] == 0
+    assert t.delta[t.initial * 2 + t.column("a")] == t.labels.index(1)
+
+    # crawl() results only have the table until somebody asks for the map
+    aa = a + a
+    assert "map" not in aa.__dict__
+    assert aa.accepts("aa")
+    assert not aa.accepts("ab")
+    assert aa.map == aa.table.to_map()
+    assert aa.table.delta.count(-1) > 0
+
+def test_table_anything_else():
+    fsm1 = fsm( # [^a]
+        alphabet = {"a", anything_else},
+        states = {0, 1},
+        initial = 0,
+        finals = {1},
+        map = {0: {anything_else: 1}}
+    )
+    t = fsm1.table
+    assert t.symbols == ["a", anything_else]
+    assert t.column("z") == t.column(anything_else) == 1
+    assert t.delta.tolist() == [-1, 1, -1, -1]
+    assert fsm1.accepts("z")
+    assert not fsm1.accepts("a")
+
+def test_table_pickle(a):
+    import pickle
+    aa = pickle.loads(pickle.dumps(a + a))
+    assert "table" not in aa.__dict__
+    assert aa.accepts("aa")
+    assert aa == a + a
+
+def test_hopcroft_brzozowski(a, b):
+    # Both minimisations number states in the same crawl order, so they must
+    # agree exactly, not just up to isomorphism.
+    def check(f):
+        h = f.hopcroft()
+        z = f.brzozowski()
+        assert h.map == z.map
+        assert h.finals == z.finals
+        assert h.initial == z.initial
+        assert h == f
+    check(a)
+    check(b)
+    check(a | b)
+    check(a + b)
+    check((a | b).star())
+    check(reversed(a + b))
+    check(a.everythingbut())
+    check(a & b)
+    check(a - a)
+    check(fsm(
+        alphabet = {"0", "1"},
+        states   = {1, 2, 3, 4, "oblivion"},
+        initial  = 1,
+        finals   = {4},
+        map      = {
+            1          : {"0" : 2         , "1" : 4         },
+            2          : {"0" : 3         , "1" : 4         },
+            3          : {"0" : 3         , "1" : 4         },
+            4          : {"0" : "oblivion", "1" : "oblivion"},
+            "oblivion" : {"0" : "oblivion", "1" : "oblivion"},
+        }
+    ))
+
+def test_hopcroft_dead_states():
+    # Unreachable and dead states vanish; an empty FSM keeps a single state
+    dead = fsm(
+        alphabet = {"a", anything_else},
+        states   = {0, 1, 2, 3},
+        initial  = 0,
+        finals   = {3},
+        map      = {
+            0 : {"a" : 1, anything_else : 2},
+            1 : {"a" : 1},
+            2 : {"a" : 3},
+        }
+    ).hopcroft()
+    assert len(dead.states) == 3
+    assert dead.accepts("ba")
+    assert not dead.accepts("aa")
+    empty = null({"a"}).hopcroft()
+    assert len(empty.states) == 1
+    assert empty.empty()
+
+def test_search(a, b):
+    # search() agrees with building the product and testing emptiness
+    star = (a | b).star()
+    for (x, y) in [(a, b), (a, a), (a, star), (star, a), (star, star + a)]:
+        assert search([x, y], all) == (not (x & y).empty())
+        assert search([x, y], lambda accepts: accepts[0] and not accepts[1]) == (not (x - y).empty())
+        assert search([x, y], lambda accepts: accepts[0] != accepts[1]) == (not (x ^ y).empty())
+    assert search([a, null({"a"})], any)
+    assert not search([null({"a"}), null({"b"})], any)
+    assert search([epsilon({"a"}), a], lambda accepts: not accepts[1])
+
+def test_search_anything_else():
+    # [^a] and [^b] overlap on everything except "a" and "b"
+    fsm1 = fsm(
+        alphabet = {"a", anything_else},
+        states = {0, 1},
+        initial = 0,
+        finals = {1},
+        map = {0: {anything_else: 1}}
+    )
+    fsm2 = fsm(
+        alphabet = {"b", anything_else},
+        states = {0, 1},
+        initial = 0,
+        finals = {1},
+        map = {0: {anything_else: 1}}
+    )
+    assert not fsm1.isdisjoint(fsm2)
+    assert not fsm1.issubset(fsm2)
+    assert fsm1 != fsm2
+    assert (fsm1 & fsm2).issubset(fsm1)
+
+def test_equivalent_union_find(a, b):
+    # Non-minimal and minimal versions of the same language are equivalent
+    ab = a | b
+    bloated = fsm(
+        alphabet = {"a", "b"},
+        states   = {0, 1, 2, 3, 4},
+        initial  = 0,
+        finals   = {1, 2},
+        map      = {
+            0 : {"a" : 1, "b" : 2},
+            1 : {"a" : 3},
+            2 : {"b" : 4},
+        }
+    )
+    assert bloated.equivalent(ab)
+    assert ab.equivalent(bloated)
+    assert not bloated.equivalent(a)
+    assert not a.equivalent(ab)
+    assert null({"a"}).equivalent(null({"b"}))
+    assert not epsilon({"a"}).equivalent(null({"a"}))
+    assert (a + a.star()).equivalent(a.star() + a)
+
+def test_compare(a, b):
+    ab = a | b
+    assert compare(a, ab) == [False, True, True]
+    assert compare(ab, a) == [True, True, False]
+    assert compare(a, b) == [True, False, True]
+    assert compare(a, a) == [False, True, False]
+    assert a < ab
+    assert not a < a
+    assert not a < b
+    assert ab > b
+    assert not ab > ab
+    # stops at the first string only `a` accepts
+    assert compare(a, b, lambda found: found[0])[0]
+    assert compare(a.star(), a, lambda found: found[0]) == [True, False, False]
+
+def test_symbol_classes():
+    # "b", "c" and everything else go to the same places from every state
+    digits = fsm(
+        alphabet = {"a", "b", "c", anything_else},
+        states   = {0, 1, 2},
+        initial  = 0,
+        finals   = {2},
+        map      = {
+            0 : {"a" : 1, "b" : 1, "c" : 1, anything_else : 1},
+            1 : {"a" : 2, "b" : 0, "c" : 0, anything_else : 0},
+        }
+    )
+    classes = symbol_classes([digits.table], digits.alphabet)
+    assert sorted(map(len, classes)) == [1, 3]
+    # a symbol missing from one FSM behaves like its anything_else there
+    other = fsm(
+        alphabet = {"a", "c"},
+        states   = {0, 1},
+        initial  = 0,
+        finals   = {1},
+        map      = {
+            0 : {"a" : 1, "c" : 0},
+        }
+    )
+    alphabet = digits.alphabet | other.alphabet
+    classes = symbol_classes([digits.table, other.table], alphabet)
+    assert sorted(map(len, classes)) == [1, 1, 2]
+    # from the final state of `other` nothing leads anywhere in it
+    live = live_classes([other.table], symbol_classes([other.table], other.alphabet))
+    assert live((other.table.initial,)) != []
+    assert live((1 - other.table.initial,)) == []
+    # crawling over classes builds the same FSMs
+    assert (digits & other).accepts("ca")
+    assert not (digits & other).accepts("ba")
+    assert (digits | other).equivalent(other | digits)
+    assert (digits.star() + other).accepts("baca")
+    assert digits.everythingbut().accepts("bb")
+    assert not digits.everythingbut().accepts("xa")
+
+def test_fingerprint(a, b):
+    # the same FSM with its states numbered differently
+    renumbered = fsm(
+        alphabet = {"a", "b"},
+        states   = {"x", "y", "z"},
+        initial  = "z",
+        finals   = {"x"},
+        map      = {
+            "z" : {"a" : "x", "b" : "y"},
+            "x" : {"a" : "y", "b" : "y"},
+            "y" : {"a" : "y", "b" : "y"},
+        },
+    )
+    assert renumbered.fingerprint() == a.fingerprint()
+    assert a.copy().fingerprint() == a.fingerprint()
+    assert (a | b).fingerprint() == (b | a).fingerprint()
+    assert a.fingerprint() != b.fingerprint()
+    # the alphabet is part of it
+    assert null({"a"}).fingerprint() != null({"b"}).fingerprint()
+
+def test_lexmin_lexmax(a, b):
+    ab = a | b
+    assert ab.lexmin() == "a"
+    assert ab.lexmax() == "b"
+    assert (ab + ab).lexmin() == "aa"
+    assert (ab + ab).lexmax() == "bb"
+    assert (ab * 2 | ab).lexmin() == "a"
+    assert (ab * 2 | ab).lexmax() == "bb"
+    assert null({"a"}).lexmin() is None
+    assert epsilon({"a"}).lexmax() == ""
+    # no smallest in b, ab, aab, ...; no largest in b, bb, ...
+    with pytest.raises(ValueError):
+        (a.star() + b).lexmin()
+    with pytest.raises(ValueError):
+        b.star().lexmax()
+    assert b.star().lexmin() == ""
+    assert (a.star() + b).lexmax() == "b"
+
+def test_lexmin_lexmax_marker(a, b):
+    ab = a | b
+    # suffixes from the first "ab"
+    f = b + a + b + (a + a | b)
+    assert f.lexmin("ab") == "abaa"
+    assert f.lexmax("ab") == "abb"
+    assert (a + b + a + b).lexmax("ab") == "abab"
+    with pytest.raises(ValueError):
+        (ab.star() + a + b + (a + a | b)).lexmax("ab")
+    assert (b + b).lexmin("ab") is None
+    assert ab.star().lexmin("ab") == "ab"
+
+def test_revuz(a, b):
+    # two equivalent branches and two dead ends, all acyclic
+    bloated = fsm(
+        alphabet = {"a", "b", "c"},
+        states   = {0, 1, 2, 3, 4, 5},
+        initial  = 0,
+        finals   = {3, 4},
+        map      = {
+            0 : {"a" : 1, "b" : 2, "c" : 5},
+            1 : {"c" : 3},
+            2 : {"c" : 4},
+            5 : {"a" : 5},
+        }
+    )
+    assert bloated.table.topological() is not None
+    minimal = bloated.revuz()
+    assert len(minimal.states) == 3
+    hopcroft = bloated.hopcroft()
+    assert minimal.map == hopcroft.map
+    assert minimal.finals == hopcroft.finals
+    assert minimal.initial == hopcroft.initial
+    assert bloated.reduce().map == hopcroft.map
+    assert len(bloated) == 2
+    assert a.star().table.topological() is None
+    assert null({"a"}).revuz().equivalent(null({"a"}))
+
+def test_parallel_acyclic(a, b):
+    # anything but "a", then "c"
+    c = fsm(
+        alphabet = {"a", "c", anything_else},
+        states   = {0, 1, 2, 3},
+        initial  = 0,
+        finals   = {2},
+        map      = {
+            0 : {"c" : 1, anything_else : 1},
+            1 : {"c" : 2},
+            3 : {"a" : 3},
+        }
+    )
+    aa = a + a
+    ab = a + b | b
+    words = [[]] + [[x] for x in "abcd"] + [[x, y] for x in "abcd" for y in "abcd"]
+    for (f1, f2) in [(aa, ab), (ab, c), (c, a | b), (a, b), (ab, ab)]:
+        assert f1.table.topological() is not None
+        assert f2.table.topological() is not None
+        results = [
+            (f1 | f2, lambda w: f1.accepts(w) or f2.accepts(w)),
+            (f1 & f2, lambda w: f1.accepts(w) and f2.accepts(w)),
+            (f1 - f2, lambda w: f1.accepts(w) and not f2.accepts(w)),
+            (f1 ^ f2, lambda w: f1.accepts(w) != f2.accepts(w)),
+        ]
+        for (result, expected) in results:
+            for w in words:
+                assert result.accepts(w) == expected(w)
+            # the result is already minimal, and numbered as hopcroft() numbers it
+            hopcroft = result.hopcroft()
+            assert result.map == hopcroft.map
+            assert result.finals == hopcroft.finals
+    assert len(a & b) == 0
+    assert (a & b).map == {0: {}}
+    assert fsm.union(aa, ab, c).equivalent(aa | (ab | c))
+    assert (a.star() | b).accepts("aaa")
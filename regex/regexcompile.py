@@ -0,0 +1,191 @@
+"""
+Compile a parsed regex straight into a DFA with Brzozowski derivatives. lego's own to_fsm() builds an fsm
+for every node of the regex and crawls and reduces again at every concatenation, alternation and repetition.
+Here every state of the DFA is a regex term, and the state a symbol leads to is the derivative of that term
+by the symbol. Terms are hash-consed to ints and simplified as they are built, so equal derivatives are the
+same state and there are only finitely many of them. Symbols that no character class in the regex tells
+apart share their derivatives, so each state only takes one derivative per block of such symbols.
+
+A term is one of
+    ("c", chars, negated)   a character class, anything but chars if negated
+    ("s", items)            a concatenation, ("s", ()) is the empty string
+    ("a", items)            an alternation of a frozenset of items, ("a", frozenset()) matches nothing
+    ("*", item)             a Kleene star
+    ("r", item, lo, hi)     between lo and hi items, hi is None for no upper bound
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from regex.greenery.fsm import fsm, anything_else
+from regex.greenery.lego import charclass, mult, conc, pattern
+
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Tuple
+    from regex.greenery.lego import lego
+
+
+def to_fsm(parsed: lego, alphabet) -> fsm:
+    """Return an fsm over alphabet for the parsed regex, accepting what parsed.to_fsm(alphabet) accepts."""
+    terms = _Terms()
+    root = terms.from_lego(parsed)
+
+    # symbols in the same block are in the same classes, so every term has the same derivative by them
+    symbols = list(alphabet)
+    classes = [key for key in terms.keys if key[0] == "c"]
+    blocks: Dict[Tuple, int] = {}
+    block_of = [blocks.setdefault(tuple(_contains(c, s) for c in classes), len(blocks)) for s in symbols]
+    firsts: Dict[int, object] = {}
+    for (s, b) in zip(symbols, block_of):
+        firsts.setdefault(b, s)
+
+    states = [root]
+    index = {root: 0}
+    map: Dict[int, Dict] = {}
+    for (i, term) in enumerate(states):
+        nexts = dict((b, terms.derive(term, b, s)) for (b, s) in firsts.items())
+        row = {}
+        for (s, b) in zip(symbols, block_of):
+            j = nexts[b]
+            if j == terms.NULL:
+                continue
+            if j not in index:
+                index[j] = len(states)
+                states.append(j)
+            row[s] = index[j]
+        map[i] = row
+
+    finals = set(i for (i, term) in enumerate(states) if terms.nullable[term])
+    return fsm.unchecked(set(symbols), set(range(len(states))), 0, finals, map)
+
+
+def _contains(c: Tuple, symbol) -> bool:
+    if symbol is anything_else:
+        return c[2]
+    return (symbol in c[1]) != c[2]
+
+
+class _Terms:
+    """The terms met while compiling one regex, numbered in the order they were made."""
+
+    def __init__(self):
+        self.ids: Dict[Tuple, int] = {}
+        self.keys: List[Tuple] = []
+        self.nullable: List[bool] = []
+        self.derivatives: Dict[Tuple[int, int], int] = {}
+        self.NULL = self.make(("a", frozenset()), False)
+        self.EPSILON = self.make(("s", ()), True)
+
+    def make(self, key: Tuple, nullable: bool) -> int:
+        if key not in self.ids:
+            self.ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.nullable.append(nullable)
+        return self.ids[key]
+
+    def from_lego(self, x: lego) -> int:
+        if isinstance(x, charclass):
+            return self.char(frozenset(x.chars), x.negated)
+        if isinstance(x, mult):
+            (lo, hi) = (x.multiplier.min.v, x.multiplier.max.v)
+            return self.repeat(self.from_lego(x.multiplicand), lo, hi)
+        if isinstance(x, conc):
+            return self.seq([self.from_lego(m) for m in x.mults])
+        if isinstance(x, pattern):
+            return self.alt([self.from_lego(c) for c in x.concs])
+        raise Exception("Cannot compile {}".format(repr(x)))
+
+    def char(self, chars, negated: bool) -> int:
+        if not chars and not negated:
+            return self.NULL
+        return self.make(("c", chars, negated), False)
+
+    def seq(self, items: List[int]) -> int:
+        flat: List[int] = []
+        for x in items:
+            if x == self.NULL:
+                return self.NULL
+            key = self.keys[x]
+            if key[0] == "s":
+                flat.extend(key[1])
+            else:
+                flat.append(x)
+        if len(flat) == 1:
+            return flat[0]
+        return self.make(("s", tuple(flat)), all(self.nullable[x] for x in flat))
+
+    def alt(self, items: List[int]) -> int:
+        flat = set()
+        for x in items:
+            key = self.keys[x]
+            if key[0] == "a":
+                flat.update(key[1])
+            else:
+                flat.add(x)
+        # all classes merge into one, so that alternatives of single characters make one state
+        classes = [x for x in flat if self.keys[x][0] == "c"]
+        if len(classes) > 1:
+            flat.difference_update(classes)
+            flat.add(self.union([self.keys[x] for x in classes]))
+        if len(flat) == 1:
+            return flat.pop()
+        return self.make(("a", frozenset(flat)), any(self.nullable[x] for x in flat))
+
+    def union(self, classes: List[Tuple]) -> int:
+        (chars, negated) = (frozenset(), False)
+        for (_, other, other_negated) in classes:
+            if negated and other_negated:
+                chars = chars & other
+            elif negated:
+                chars = chars - other
+            elif other_negated:
+                (chars, negated) = (other - chars, True)
+            else:
+                chars = chars | other
+        return self.char(chars, negated)
+
+    def star(self, x: int) -> int:
+        if x in (self.NULL, self.EPSILON):
+            return self.EPSILON
+        if self.keys[x][0] == "*":
+            return x
+        return self.make(("*", x), True)
+
+    def repeat(self, x: int, lo: int, hi: Optional[int]) -> int:
+        if hi == 0 or x == self.EPSILON:
+            return self.EPSILON
+        if x == self.NULL:
+            return self.EPSILON if lo == 0 else self.NULL
+        if (lo, hi) == (1, 1):
+            return x
+        if (lo, hi) == (0, None):
+            return self.star(x)
+        return self.make(("r", x, lo, hi), lo == 0 or self.nullable[x])
+
+    def derive(self, x: int, block: int, symbol) -> int:
+        """Return the term for what is left of x after reading symbol, which stands for its whole block."""
+        memo = (x, block)
+        if memo in self.derivatives:
+            return self.derivatives[memo]
+        key = self.keys[x]
+        kind = key[0]
+        if kind == "c":
+            res = self.EPSILON if _contains(key, symbol) else self.NULL
+        elif kind == "s":
+            if not key[1]:
+                res = self.NULL
+            else:
+                (head, rest) = (key[1][0], self.seq(list(key[1][1:])))
+                res = self.seq([self.derive(head, block, symbol), rest])
+                if self.nullable[head]:
+                    res = self.alt([res, self.derive(rest, block, symbol)])
+        elif kind == "a":
+            res = self.alt([self.derive(y, block, symbol) for y in key[1]])
+        elif kind == "*":
+            res = self.seq([self.derive(key[1], block, symbol), x])
+        else:
+            (_, y, lo, hi) = key
+            rest = self.repeat(y, max(lo - 1, 0), None if hi is None else hi - 1)
+            res = self.seq([self.derive(y, block, symbol), rest])
+        self.derivatives[memo] = res
+        return res
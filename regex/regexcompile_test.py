@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest regex`")
+
+from regex.greenery.fsm import anything_else
+from regex.greenery.lego import parse
+from regex.regexcompile import to_fsm
+
+
+def same_as_lego(regex: str, alphabet=None) -> bool:
+    parsed = parse(regex)
+    if alphabet is None:
+        alphabet = parsed.alphabet()
+    return to_fsm(parsed, alphabet).equivalent(parsed.to_fsm(alphabet))
+
+
+def test_literals():
+    assert same_as_lego("a")
+    assert same_as_lego("abc")
+    assert same_as_lego("a|bc|")
+    assert same_as_lego("rsw0(1|2)\\.p00[0-9]\\.f00\\._dc0000_1")
+
+
+def test_bounded_repeats():
+    assert same_as_lego("a{2,4}b")
+    assert same_as_lego("x{0,3}")
+    assert same_as_lego("a{3,}")
+    assert same_as_lego("(ab){2}|c{1,2}")
+    assert same_as_lego("(a{0,2}b){2,3}")
+    assert same_as_lego("a?b+c*")
+
+
+def test_negated_classes():
+    assert same_as_lego("[^ab]c")
+    assert same_as_lego("[^a]{2}")
+    assert same_as_lego("[^a]|[^b]")
+    assert same_as_lego("[^a]|a")
+    assert same_as_lego(".*x")
+    f = to_fsm(parse("[^ab]"), {"a", "b", "c", anything_else})
+    assert f.accepts("c")
+    assert f.accepts("z")
+    assert not f.accepts("a")
+
+
+def test_empty_classes():
+    assert same_as_lego("[]")
+    assert same_as_lego("a[]")
+    assert same_as_lego("a|[]")
+    assert same_as_lego("[]*b")
+    assert same_as_lego("[]{0,2}c")
+    assert to_fsm(parse("a[]"), {"a", anything_else}).empty()
+    assert to_fsm(parse("[]*"), {"a", anything_else}).accepts("")
+
+
+def test_nested_stars():
+    assert same_as_lego("(a*b*)*")
+    assert same_as_lego("((ab)*c)*d")
+    assert same_as_lego("((a*)*)*")
+    assert same_as_lego("(a|b*)*c")
+    assert same_as_lego("((a{2})*b)*")
+
+
+def test_wider_alphabet():
+    # symbols the regex never mentions still get a transition, to oblivion or through a negated class
+    alphabet = {"a", "b", "c", "d", anything_else}
+    assert same_as_lego("a[^b]*", alphabet)
+    assert same_as_lego("(a|b)*c", alphabet)
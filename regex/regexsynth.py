@@ -0,0 +1,276 @@
+"""
+Turn an fsm back into a regex by state elimination. lego.from_fsm() eliminates the states in the order it
+finds them and reduces the whole lego tree after every step, which dominates the time of printing a regextree.
+Here the regex is kept as plain tuples with a few local simplifications, and the next state to go is always
+the one with the fewest paths running through it, which keeps the intermediate regexes small.
+
+The tuples are
+    ("c", chars, negated)   a character class, anything but chars if negated
+    ("s", items)            a concatenation, ("s", ()) is the empty string
+    ("a", items, optional)  an alternation, which also matches the empty string if optional
+    ("*", item)             a Kleene star
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from regex.greenery.fsm import anything_else
+from regex.greenery.lego import charclass, escapes
+
+if TYPE_CHECKING:
+    from typing import Dict, FrozenSet, List, Tuple
+    from regex.greenery.fsm import fsm
+
+
+EPSILON = ("s", ())
+INF = None
+DIGITS = frozenset("0123456789")
+
+
+def from_fsm(f: fsm) -> str:
+    """Return a regex, in the syntax lego parses, for the strings f accepts."""
+    t = f.table
+    k = len(t.symbols)
+    alive = t.alive()
+    if t.initial not in alive:
+        return "[]"
+    explicit = frozenset(s for s in t.symbols if s is not anything_else)
+
+    # the states of f, plus a new initial and a new final state with only empty edges
+    (start, end) = (len(t.finals), len(t.finals) + 1)
+    out: Dict[int, Dict[int, Tuple]] = {start: {t.initial: EPSILON}, end: {}}
+    into: Dict[int, set] = {start: set(), end: set()}
+    for q in alive:
+        out[q] = {}
+        into[q] = set()
+    into[t.initial].add(start)
+    for q in sorted(alive):
+        groups: Dict[int, list] = {}
+        for c in range(k):
+            j = t.delta[q * k + c]
+            if j in alive:
+                groups.setdefault(j, []).append(t.symbols[c])
+        for (j, symbols) in groups.items():
+            out[q][j] = _edge(symbols, explicit)
+            into[j].add(q)
+        if t.finals[q]:
+            out[q][end] = EPSILON
+            into[end].add(q)
+
+    remaining = set(alive)
+    while remaining:
+        # the state with the fewest paths through it, the lowest one on ties to stay deterministic
+        q = min(remaining, key=lambda q: ((len(into[q]) - (q in out[q])) * (len(out[q]) - (q in out[q])), q))
+        remaining.remove(q)
+        loop = out[q].pop(q, None)
+        into[q].discard(q)
+        middle = _star(loop) if loop is not None else EPSILON
+        for p in sorted(into[q]):
+            head = _seq(out[p].pop(q), middle)
+            for (r, tail) in out[q].items():
+                path = _seq(head, tail)
+                out[p][r] = _alt(out[p][r], path) if r in out[p] else path
+                into[r].add(p)
+        for r in out[q]:
+            into[r].discard(q)
+        del out[q]
+        del into[q]
+
+    return _render(out[start][end])[0]
+
+
+def _edge(symbols: List, explicit: FrozenSet[str]) -> Tuple:
+    chars = frozenset(s for s in symbols if s is not anything_else)
+    if len(chars) < len(symbols):
+        return ("c", explicit - chars, True)
+    return ("c", chars, False)
+
+
+def _seq(x: Tuple, y: Tuple) -> Tuple:
+    items = (x[1] if x[0] == "s" else (x,)) + (y[1] if y[0] == "s" else (y,))
+    return items[0] if len(items) == 1 else ("s", items)
+
+
+def _items(x: Tuple) -> Tuple:
+    return x[1] if x[0] == "s" else (x,)
+
+
+def _alt(x: Tuple, y: Tuple) -> Tuple:
+    items: List[Tuple] = []
+    optional = False
+    for z in (x, y):
+        if z == EPSILON:
+            optional = True
+        elif z[0] == "a":
+            items.extend(z[1])
+            optional = optional or z[2]
+        else:
+            items.append(z)
+    # single characters collapse into one class
+    classes = [z for z in items if z[0] == "c"]
+    if len(classes) > 1:
+        merged = classes[0]
+        for z in classes[1:]:
+            merged = _union(merged, z)
+        items = [z for z in items if z[0] != "c"]
+        items.insert(0, merged)
+    items = list(dict.fromkeys(items))
+    # a star already matches the empty string
+    if optional and any(z[0] == "*" for z in items):
+        optional = False
+    if len(items) > 1:
+        factored = _factor(items)
+        if factored is not None:
+            return _alt(factored, EPSILON) if optional else factored
+    if len(items) == 1 and not optional:
+        return items[0]
+    return ("a", tuple(items), optional)
+
+
+def _factor(items: List[Tuple]) -> Tuple:
+    """Pull the items all alternatives start or end with out of the alternation, or return None."""
+    seqs = [_items(z) for z in items]
+    shortest = min(len(s) for s in seqs)
+    head = 0
+    while head < shortest and all(s[head] == seqs[0][head] for s in seqs):
+        head += 1
+    tail = 0
+    while tail < shortest - head and all(s[-1 - tail] == seqs[0][-1 - tail] for s in seqs):
+        tail += 1
+    if head == 0 and tail == 0:
+        return None
+    middles = [("s", s[head : len(s) - tail]) if len(s) - tail - head != 1 else s[head] for s in seqs]
+    rest = middles[0]
+    for middle in middles[1:]:
+        rest = _alt(rest, middle)
+    prefix = seqs[0][:head]
+    suffix = seqs[0][len(seqs[0]) - tail :]
+    return _seq(_seq(("s", prefix), rest), ("s", suffix))
+
+
+def _union(x: Tuple, y: Tuple) -> Tuple:
+    (xs, xn), (ys, yn) = x[1:], y[1:]
+    if xn and yn:
+        return ("c", xs & ys, True)
+    if xn:
+        return ("c", xs - ys, True)
+    if yn:
+        return ("c", ys - xs, True)
+    return ("c", xs | ys, False)
+
+
+def _star(x: Tuple) -> Tuple:
+    if x[0] == "*" or x == EPSILON:
+        return x
+    if x[0] == "a" and x[2]:
+        x = ("a", x[1], False) if len(x[1]) > 1 else x[1][0]
+    return ("*", x)
+
+
+# precedence of a rendered regex: an alternation, a concatenation, a quantified atom or a plain atom
+ALT, SEQ, QUANT, ATOM = range(4)
+
+
+def _render(x: Tuple) -> Tuple[str, int]:
+    kind = x[0]
+    if kind == "c":
+        return (_render_class(x[1], x[2]), ATOM)
+    if kind == "*":
+        return (_atom(x[1]) + "*", QUANT)
+    if kind == "a":
+        if x[2] and len(x[1]) == 1:
+            return (_atom(x[1][0]) + "?", QUANT)
+        body = "|".join(_render(z)[0] for z in x[1])
+        if x[2]:
+            return ("(" + body + ")?", QUANT)
+        return (body, ALT)
+
+    # runs of the same item, counting a starred or optional item as zero or more or zero or one of it
+    runs: List[list] = []
+    for z in x[1]:
+        if z[0] == "*":
+            (base, lo, hi) = (z[1], 0, INF)
+        elif z[0] == "a" and z[2] and len(z[1]) == 1:
+            (base, lo, hi) = (z[1][0], 0, 1)
+        else:
+            (base, lo, hi) = (z, 1, 1)
+        if runs and runs[-1][0] == base:
+            runs[-1][1] += lo
+            runs[-1][2] = INF if INF in (runs[-1][2], hi) else runs[-1][2] + hi
+        else:
+            runs.append([base, lo, hi])
+    parts = [_repeat(base, lo, hi) for (base, lo, hi) in runs]
+    if len(parts) == 1:
+        return (parts[0], QUANT)
+    return ("".join(parts), SEQ)
+
+
+def _repeat(x: Tuple, lo: int, hi: int) -> str:
+    if (lo, hi) == (1, 1):
+        (s, prec) = _render(x)
+        return "(" + s + ")" if prec == ALT else s
+    atom = _atom(x)
+    if (lo, hi) == (0, INF):
+        return atom + "*"
+    if (lo, hi) == (1, INF):
+        return atom + "+"
+    if (lo, hi) == (0, 1):
+        return atom + "?"
+    if hi is INF:
+        return atom + "{" + str(lo) + ",}"
+    if lo == hi:
+        (s, prec) = _render(x)
+        plain = ("(" + s + ")" if prec == ALT else s) * lo
+        counted = atom + "{" + str(lo) + "}"
+        return plain if len(plain) <= len(counted) else counted
+    return atom + "{" + str(lo) + "," + str(hi) + "}"
+
+
+def _atom(x: Tuple) -> str:
+    (s, prec) = _render(x)
+    return s if prec == ATOM else "(" + s + ")"
+
+
+def _render_class(chars: FrozenSet[str], negated: bool) -> str:
+    if negated:
+        return "[^" + _class_body(chars) + "]" if chars else "."
+    if len(chars) == 1:
+        (char,) = chars
+        if char in escapes:
+            return escapes[char]
+        if char in charclass.allSpecial:
+            return "\\" + char
+        if 0 <= ord(char) <= 0x1F or ord(char) == 0x7F:
+            return "\\x{0:02x}".format(ord(char))
+        return char
+    if chars == DIGITS:
+        return "\\d"
+    return "[" + _class_body(chars) + "]"
+
+
+def _class_body(chars: FrozenSet[str]) -> str:
+    """The inside of a class, with \\d for the digits and a-z style ranges wherever they are shorter"""
+    output = ""
+    if DIGITS <= chars:
+        output = "\\d"
+        chars = chars - DIGITS
+    run: List[str] = []
+    for char in sorted(chars, key=ord) + [None]:
+        if run and (char is None or ord(char) != ord(run[-1]) + 1):
+            listed = "".join(_class_char(c) for c in run)
+            ranged = _class_char(run[0]) + "-" + _class_char(run[-1])
+            output += listed if len(listed) <= len(ranged) else ranged
+            run = []
+        if char is not None:
+            run.append(char)
+    return output
+
+
+def _class_char(char: str) -> str:
+    if char in charclass.classSpecial:
+        return "\\" + char
+    if char in escapes:
+        return escapes[char]
+    if 0 <= ord(char) <= 0x1F or ord(char) == 0x7F:
+        return "\\x{0:02x}".format(ord(char))
+    return char
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest regex`")
+
+from regex.greenery.fsm import fsm, anything_else, null, epsilon
+from regex.greenery.lego import parse
+from regex.regexsynth import from_fsm
+
+
+def round_trips(f: fsm) -> bool:
+    """Whether the regex written for f parses back into an fsm accepting the same strings."""
+    regex = from_fsm(f.reduce())
+    return parse(regex).to_fsm(f.alphabet).equivalent(f)
+
+
+def lego_fsm(regex: str) -> fsm:
+    parsed = parse(regex)
+    return parsed.to_fsm(parsed.alphabet()).reduce()
+
+
+def test_literals():
+    assert round_trips(lego_fsm("a"))
+    assert round_trips(lego_fsm("abc"))
+    assert round_trips(lego_fsm("ab|ac|b"))
+    # characters with a meaning of their own in a regex are escaped
+    assert round_trips(lego_fsm("a\\.b\\|c\\*\\(\\)\\[\\]\\\\"))
+
+
+def test_repeats():
+    assert round_trips(lego_fsm("a*"))
+    assert round_trips(lego_fsm("a{2,4}b"))
+    assert round_trips(lego_fsm("(ab){3}"))
+    assert round_trips(lego_fsm("a?b+c*"))
+    assert round_trips(lego_fsm("(a*b*)*c"))
+    assert round_trips(lego_fsm("((ab)*c)*d"))
+
+
+def test_classes():
+    assert round_trips(lego_fsm("[0-9]{3}"))
+    assert round_trips(lego_fsm("[a-f0-4]x"))
+    assert round_trips(lego_fsm("[^ab]c"))
+    assert round_trips(lego_fsm(".*x"))
+    assert round_trips(lego_fsm("rsw0(0[1-9]|1[0-2])\\.p00[0-9]\\.f00\\._dc000[0-3]_[12]"))
+
+
+def test_anything_else():
+    # anything but a, then b, and a loop on anything else
+    f = fsm(
+        alphabet={"a", "b", anything_else},
+        states={0, 1, 2},
+        initial=0,
+        finals={2},
+        map={
+            0: {"b": 1, anything_else: 1},
+            1: {"b": 2},
+            2: {anything_else: 2},
+        },
+    )
+    assert round_trips(f)
+    assert parse(from_fsm(f.reduce())).to_fsm(f.alphabet).accepts(["b", "b", anything_else])
+
+
+def test_trivial_languages():
+    assert from_fsm(null({"a"})) == "[]"
+    assert round_trips(null({"a", anything_else}))
+    assert round_trips(epsilon({"a"}))
+    assert round_trips(lego_fsm("a|"))
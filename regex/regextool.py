@@ -1,9 +1,12 @@
 from __future__ import annotations
 import re
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 from regex.greenery.lego import lego, parse, from_fsm
-from regex.greenery.fsm import fsm, anything_else
+from regex.greenery.fsm import fsm, anything_else, compare
+from regex import regexcompile, regexsynth
+from tools.devicenamespace import DeviceNamespace
 
 if TYPE_CHECKING:
     from scheduler.runner import Runner
@@ -11,23 +14,95 @@ if TYPE_CHECKING:
 
 
 class RegexTool:
+    # results of fsm operations, keyed by the operation and the fingerprints of its operands
+    op_cache: OrderedDict = OrderedDict()
+    op_cache_size = 4096
+    op_cache_hits = 0
+    op_cache_misses = 0
+    # regexes written by to_regex(), keyed by the fingerprint of the fsm. Kept apart from op_cache, so that the few
+    # regexes asked for again are not pushed out by the fsm operations, nor gone with op_cache_size = 0.
+    regex_cache: OrderedDict = OrderedDict()
+    regex_cache_size = 1024
+    # lego.from_fsm() instead of regexsynth for to_regex(), it spells regexes differently and is far slower
+    use_lego_to_regex = False
+    # lego's own to_fsm() instead of regexcompile for to_fsm(), it makes the same fsms far slower
+    use_lego_to_fsm = False
+
+    @classmethod
+    def cached(cls, op: str, fsm1: fsm, fsm2: fsm, compute):
+        """Return compute(), or its result from the last time op was applied to fsms equal to fsm1 and fsm2."""
+        if cls.op_cache_size <= 0:
+            return compute()
+        key = (op, fsm1.fingerprint(), fsm2.fingerprint())
+        if key in cls.op_cache:
+            cls.op_cache_hits += 1
+            cls.op_cache.move_to_end(key)
+            return cls.op_cache[key]
+        cls.op_cache_misses += 1
+        res = compute()
+        cls.op_cache[key] = res
+        if len(cls.op_cache) > cls.op_cache_size:
+            cls.op_cache.popitem(last=False)
+        return res
+
+    @classmethod
+    def relation(cls, fsm1: fsm, fsm2: fsm) -> list:
+        """
+        Return whether some strings are only in fsm1, in both, and only in fsm2. The regextree asks for
+        containment both ways and then overlap of the same pair, which are all read off this one result.
+        """
+        if ("compare", fsm2.fingerprint(), fsm1.fingerprint()) in cls.op_cache:
+            return cls.cached("compare", fsm2, fsm1, lambda: compare(fsm2, fsm1))[::-1]
+        return cls.cached("compare", fsm1, fsm2, lambda: compare(fsm1, fsm2))
+
     @classmethod
     def to_fsm(cls, regex) -> fsm:
         parsed = parse(regex)
         alphabet = parsed.alphabet()
-        fsm = parsed.to_fsm(alphabet)
+        if cls.use_lego_to_fsm:
+            fsm = parsed.to_fsm(alphabet)
+        else:
+            fsm = regexcompile.to_fsm(parsed, alphabet)
         return fsm.reduce()
 
     @classmethod
     def to_regex(cls, fsm) -> str:
-        return str(from_fsm(fsm.reduce()))
+        if cls.use_lego_to_regex:
+            return str(from_fsm(fsm.reduce()))
+        if cls.regex_cache_size <= 0:
+            return regexsynth.from_fsm(fsm.reduce())
+        key = fsm.fingerprint()
+        if key in cls.regex_cache:
+            cls.regex_cache.move_to_end(key)
+            return cls.regex_cache[key]
+        res = regexsynth.from_fsm(fsm.reduce())
+        cls.regex_cache[key] = res
+        if len(cls.regex_cache) > cls.regex_cache_size:
+            cls.regex_cache.popitem(last=False)
+        return res
 
     @classmethod
     def equal_regex(cls, fsm1: fsm, fsm2: fsm):
-        return fsm1 == fsm2
+        return cls.cached("==", fsm1, fsm2, lambda: fsm1 == fsm2)
+
+    @classmethod
+    def disjoint_dev_regex(cls, obj1: TreeObjRegex, obj2: TreeObjRegex, runner: Runner):
+        """Whether the signatures of the objs already tell that they have no device in common"""
+        return (
+            runner.use_regextree_dev_signature
+            and obj1._dev_sig
+            and obj2._dev_sig
+            and DeviceNamespace.disjoint(obj1._dev_sig, obj2._dev_sig)
+        )
 
     @classmethod
     def equal_regex_opt(cls, obj1: TreeObjRegex, obj2: TreeObjRegex, runner: Runner):
+        if cls.disjoint_dev_regex(obj1, obj2, runner):
+            return False
+
+        if runner.use_regextree_dev_bitmap and obj1._dev_bits and obj2._dev_bits:
+            return obj1._dev_bits == obj2._dev_bits
+
         if (
             runner.use_regextree_dev_opt
             and obj1._dev
@@ -46,23 +121,34 @@ class RegexTool:
         elif not obj1_dev and obj2_dev:
             return False
         else:
-            return obj1._fsm == obj2._fsm
+            return cls.equal_regex(obj1._fsm, obj2._fsm)
 
     @classmethod
     def contain_regex(cls, fsm1: fsm, fsm2: fsm):
-        return fsm1 >= fsm2
+        if cls.op_cache_size <= 0:
+            return fsm1 >= fsm2
+        return not cls.relation(fsm1, fsm2)[2]
 
     @classmethod
     def is_single_device(cls, obj: TreeObjRegex, runner: Runner):
         if runner.use_regextree_dev_opt:
             return len(obj._dev) == 1
 
+        # only regexes given by a workflow are taken as device names, not the ones written for split objs
+        if obj._regex_str is None:
+            return False
         regex = obj._regex
         regex = regex.replace("\\.", ".")
         return runner and regex in runner.device_cache_dict
 
     @classmethod
     def contain_regex_opt(cls, obj1: TreeObjRegex, obj2: TreeObjRegex, runner: Runner):
+        if cls.disjoint_dev_regex(obj1, obj2, runner):
+            return False
+
+        if runner.use_regextree_dev_bitmap and obj1._dev_bits and obj2._dev_bits:
+            return obj1._dev_bits & obj2._dev_bits == obj2._dev_bits
+
         if (
             runner.use_regextree_dev_opt
             and obj1._dev
@@ -81,14 +167,23 @@ class RegexTool:
         elif not obj1_dev and obj2_dev:
             return re.match(obj1._regex, obj2._regex)
         else:
-            return obj1._fsm >= obj2._fsm
+            return cls.contain_regex(obj1._fsm, obj2._fsm)
 
     @classmethod
     def contain_proper_regex(cls, fsm1: fsm, fsm2: fsm):
-        return fsm1 > fsm2
+        if cls.op_cache_size <= 0:
+            return fsm1 > fsm2
+        (only1, _, only2) = cls.relation(fsm1, fsm2)
+        return only1 and not only2
 
     @classmethod
     def contain_proper_regex_opt(cls, obj1: TreeObjRegex, obj2: TreeObjRegex, runner: Runner):
+        if cls.disjoint_dev_regex(obj1, obj2, runner):
+            return False
+
+        if runner.use_regextree_dev_bitmap and obj1._dev_bits and obj2._dev_bits:
+            return obj1._dev_bits & obj2._dev_bits == obj2._dev_bits != obj1._dev_bits
+
         if (
             runner.use_regextree_dev_opt
             and obj1._dev
@@ -106,22 +201,30 @@ class RegexTool:
         elif obj1_dev and not obj2_dev:
             return False
         else:
-            return obj1._fsm > obj2._fsm
+            return cls.contain_proper_regex(obj1._fsm, obj2._fsm)
 
     @classmethod
     def intersec_regex(cls, fsm1: fsm, fsm2: fsm):
-        intersec = fsm1 & fsm2
-        lhs = fsm1 - intersec
-        rhs = fsm2 - intersec
+        intersec = cls.cached("&", fsm1, fsm2, lambda: fsm1 & fsm2)
+        lhs = cls.cached("-", fsm1, intersec, lambda: fsm1 - intersec)
+        rhs = cls.cached("-", fsm2, intersec, lambda: fsm2 - intersec)
         # return intersec.reduce(), lhs.reduce(), rhs.reduce()
         return intersec, lhs, rhs
 
     @classmethod
     def overlap_regex(cls, fsm1: fsm, fsm2: fsm):
-        return not fsm1.isdisjoint(fsm2)
+        if cls.op_cache_size <= 0:
+            return not fsm1.isdisjoint(fsm2)
+        return cls.relation(fsm1, fsm2)[1]
 
     @classmethod
     def overlap_regex_opt(cls, obj1: TreeObjRegex, obj2: TreeObjRegex, runner: Runner):
+        if cls.disjoint_dev_regex(obj1, obj2, runner):
+            return False
+
+        if runner.use_regextree_dev_bitmap and obj1._dev_bits and obj2._dev_bits:
+            return obj1._dev_bits & obj2._dev_bits != 0
+
         if (
             runner.use_regextree_dev_opt
             and obj1._dev
@@ -140,8 +243,8 @@ class RegexTool:
         elif not obj1_dev and obj2_dev:
             return re.match(obj1._regex, obj2._regex)
         else:
-            return not obj1._fsm.isdisjoint(obj2._fsm)
+            return cls.overlap_regex(obj1._fsm, obj2._fsm)
 
     @classmethod
     def subtract_regex(cls, fsm1: fsm, fsm2: fsm) -> fsm:
-        return fsm1.difference(fsm2)
+        return cls.cached("-", fsm1, fsm2, lambda: fsm1.difference(fsm2))
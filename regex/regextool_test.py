@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest regex`")
+
+from collections import OrderedDict
+
+import pytest
+from regex import regexsynth
+from regex.regextool import RegexTool
+
+
+@pytest.fixture
+def synth_calls(monkeypatch):
+    """Count the regexes written by regexsynth, with empty caches"""
+    calls = []
+    from_fsm = regexsynth.from_fsm
+
+    def counted(f):
+        calls.append(f)
+        return from_fsm(f)
+
+    monkeypatch.setattr(regexsynth, "from_fsm", counted)
+    monkeypatch.setattr(RegexTool, "op_cache", OrderedDict())
+    monkeypatch.setattr(RegexTool, "regex_cache", OrderedDict())
+    return calls
+
+
+def test_to_regex_cached_without_op_cache(synth_calls, monkeypatch):
+    monkeypatch.setattr(RegexTool, "op_cache_size", 0)
+    f = RegexTool.to_fsm("rsw0[0-3]\\.p001") - RegexTool.to_fsm("rsw002\\.p001")
+    regex = RegexTool.to_regex(f)
+    # an equal fsm made another way gets the same regex, written once
+    assert RegexTool.to_regex(RegexTool.to_fsm(regex)) == regex
+    assert len(synth_calls) == 1
+    assert len(RegexTool.op_cache) == 0
+
+
+def test_to_regex_cache_size(synth_calls, monkeypatch):
+    monkeypatch.setattr(RegexTool, "regex_cache_size", 2)
+    fsms = [RegexTool.to_fsm("rsw00{}".format(i)) for i in range(3)]
+    for f in fsms:
+        RegexTool.to_regex(f)
+    assert len(RegexTool.regex_cache) == 2
+    # the least recently used one was dropped
+    RegexTool.to_regex(fsms[2])
+    assert len(synth_calls) == 3
+    RegexTool.to_regex(fsms[0])
+    assert len(synth_calls) == 4
+
+    monkeypatch.setattr(RegexTool, "regex_cache_size", 0)
+    RegexTool.to_regex(fsms[0])
+    assert len(synth_calls) == 5
@@ -3,6 +3,8 @@ from tools.util import get_matched_dcs, get_matched_devices
 from typing import TYPE_CHECKING
 
 import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 
 from regex.regextool import *
 from scheduler.workflow import Workflow, AccType
@@ -10,54 +12,118 @@ from tools.mylogging import logger
 
 if TYPE_CHECKING:
     from scheduler.runner import Runner
-    from typing import List, Set
+    from typing import Dict, List, Optional, Set, Tuple
 
 
 class TreeObjRegex:
-    def __init__(self, regex: str, using_trace: bool, runner: Runner):
-        self._regex = regex
+    def __init__(self, regex: Optional[str], using_trace: bool, runner: Runner, fsm=None):
+        """
+        An obj is made either from a regex, or, for the parts split off by the regextree, straight from an fsm.
+        The regex of the latter is only built if somebody asks for it.
+        """
+        self._regex_str: Optional[str] = regex
         self._runner: Runner = runner
         # logger.debug('The input regex is {}'.format(self._regex))
-        if self._runner and self._regex in self._runner.fsm_cache:
-            self._fsm = self._runner.fsm_cache[self._regex].copy()
+        if fsm is not None:
+            self._fsm = fsm
+        elif self._runner and regex in self._runner.fsm_cache:
+            # fsms are immutable, so the cached one is shared rather than copied
+            self._fsm = self._runner.fsm_cache[regex]
             # self._dev:Set = set(self._runner.reg2dev_map[self._regex])
         else:
-            self._fsm = RegexTool.to_fsm(self._regex)
+            self._fsm = RegexTool.to_fsm(regex)
             # self._dev:Set = set()
-        self._dev: Set = set(get_matched_devices(self._runner, self._regex))
+        self._dev: Set = set(get_matched_devices(self._runner, regex, self._fsm))
+        self.set_dev_bits()
+        self.set_dev_signature()
         self._exlock: List[Workflow] = []
         self._shlock: List[Workflow] = []
         self._ishlock: List[Workflow] = []
         self._iexlock: List[Workflow] = []
         self._children_obj = []
+        # the children are kept in (lo, hi) order, the index over them is built when insert() next needs it
+        self._children_sorted = True
+        self._children_index: Optional[Tuple[List[Tuple[str, str]], List[str], List[str]]] = None
+        # kept up to date by the methods below which add and remove children
+        self._parent: Optional[TreeObjRegex] = None
+        self._depth = 0
+        # the objs in the subtree of the obj and the shlocks and exlocks held there, itself included, per holding wf
+        # and in total. Kept up to date by the methods below which grant and release locks and add and remove children.
+        self._num_sub_objs = 1
+        self._sub_shlock: Dict[Workflow, int] = {}
+        self._sub_exlock: Dict[Workflow, int] = {}
+        self._num_sub_shlock = 0
+        self._num_sub_exlock = 0
+        # for the root only, its children whose subtrees changed since the scheduler last went through them, and
+        # since the wait-for graph of the scheduler last heard of them
+        self._dirty_children: Optional[Set[TreeObjRegex]] = None
+        self._dirty_waits: Optional[Set[TreeObjRegex]] = None
         self._lo: str = ""
         self._hi: str = ""
         self._using_trace = using_trace
         self.set_bound()
 
+    @property
+    def _regex(self) -> str:
+        if self._regex_str is None:
+            return RegexTool.to_regex(self._fsm)
+        return self._regex_str
+
+    def __str__(self):
+        return self._regex
+
+    def is_any(self) -> bool:
+        """Whether the regex is ".*". Only a single-state fsm can be, so no other regex is built for this."""
+        return (self._regex_str is not None or len(self._fsm.states) == 1) and self._regex == ".*"
+
     def set_fsm(self, fsm):
-        self._regex = RegexTool.to_regex(fsm)
+        self._regex_str = None
         self._fsm = fsm
         # if self._runner and self._runner.use_regextree_dev_opt and self._regex in self._runner.fsm_cache:
         #     self._dev:Set = set(self._runner.reg2dev_map[self._regex])
         # else:
         #     self._dev:Set = set()
-        self._dev: Set = set(get_matched_devices(self._runner, self._regex))
+        self._dev: Set = set(get_matched_devices(self._runner, None, fsm))
+        self.set_dev_bits()
+        self.set_dev_signature()
+        bound = (self._lo, self._hi)
         self.set_bound()
+        if self._parent and bound != (self._lo, self._hi):
+            self._parent.children_changed(False)
+
+    def set_dev_bits(self):
+        """
+        Keep the matched devices as a bitmap over the device list as well, so that the regextree can compare
+        objects with a few integer operations instead of their fsms.
+        """
+        if self._runner and self._runner.use_regextree_dev_bitmap:
+            self._dev_bits: int = self._runner.device_index.bitmap(self._dev)
+        else:
+            self._dev_bits: int = 0
+
+    def set_dev_signature(self):
+        """
+        Keep the dcs, fabrics, pods and switch roles the matched devices are in, so that the regextree can tell
+        objects in different places apart before comparing their fsms.
+        """
+        if self._runner and self._runner.use_regextree_dev_signature:
+            self._dev_sig: Tuple[int, ...] = self._runner.device_namespace.signature(self._dev)
+        else:
+            self._dev_sig: Tuple[int, ...] = ()
 
     def set_bound_workload(self):
         """
         set_bound for the real workload. Get all matched devices from the device list
         and get their dc names.
         """
-        logger.debug("original_str = {}".format(self._regex))
-        if self._regex == ".*":
+        logger.debug("original_str = %s", self)
+        if self.is_any():
             # fake dc names that cover all real dc names
             self._lo = "_dc0000_"
             self._hi = "_dc9999_"
             return
 
-        matched_dcs = get_matched_dcs(self._runner, self._regex)
+        matched_dcs = get_matched_dcs(self._runner, self._regex_str, self._fsm)
         # TODO: handle this, the intersection does not match any device
         if not matched_dcs:
             # assert 0
@@ -71,36 +137,23 @@ class TreeObjRegex:
 
     def set_bound(self):
         """
-        extra the dc part of the regex, generate all accepted strings,
-        and select the smallest and highest ones.
+        extra the dc part of the regex, and select the smallest and highest
+        ones of all accepted strings, straight from the fsm.
         """
         if self._using_trace:
             self.set_bound_workload()
             return
 
-        logger.debug("original_str = {}".format(self._regex))
+        logger.debug("original_str = %s", self)
 
-        if self._regex == ".*":
+        if self.is_any():
             self._lo = "dc1"
             self._hi = "dc99999"
             return
 
-        # TODO: more efficient way?
         # TODO: how to optimize core switch
-        min_dc = None
-        max_dc = None
-        for s in self._fsm.strings():
-            s_str = "".join(s)
-            dc_str = s_str[s_str.find("dc") :]
-            if not min_dc:
-                min_dc = dc_str
-                max_dc = dc_str
-                continue
-
-            if min_dc > dc_str:
-                min_dc = dc_str
-            if max_dc < dc_str:
-                max_dc = dc_str
+        min_dc = self._fsm.lexmin("dc")
+        max_dc = self._fsm.lexmax("dc")
         assert min_dc != None and max_dc != None
         self._lo = min_dc
         self._hi = max_dc
@@ -112,27 +165,144 @@ class TreeObjRegex:
     def get_hi(self) -> str:
         return self._hi
 
+    def set_parent(self, parent: Optional[TreeObjRegex]):
+        """Hang the obj with its subtree under parent, the depths below only change if the obj moves up or down."""
+        self._parent = parent
+        depth = parent._depth + 1 if parent else 0
+        if depth != self._depth:
+            stack = [(self, depth)]
+            while stack:
+                (obj, depth) = stack.pop()
+                obj._depth = depth
+                for child in obj._children_obj:
+                    stack.append((child, depth + 1))
+
+    def _count_subtree(self, objs: int, shlock: Dict[Workflow, int], exlock: Dict[Workflow, int], sign: int):
+        """Add (sign=1) or take away (sign=-1) the objs and locks of a subtree to the obj and its ancestors"""
+        (num_shlock, num_exlock) = (sign * sum(shlock.values()), sign * sum(exlock.values()))
+        obj = self
+        while obj is not None:
+            obj._num_sub_objs += sign * objs
+            for (locks, sub) in ((shlock, obj._sub_shlock), (exlock, obj._sub_exlock)):
+                for (wf, n) in locks.items():
+                    n = sub.get(wf, 0) + sign * n
+                    if n:
+                        sub[wf] = n
+                    else:
+                        del sub[wf]
+            obj._num_sub_shlock += num_shlock
+            obj._num_sub_exlock += num_exlock
+            obj = obj._parent
+
+    def touch(self):
+        """
+        Note that the locks, the requests or the children of the obj changed, by marking the child of the root
+        which the obj is under as dirty there.
+        """
+        (top, parent) = (self, self._parent)
+        if parent is None:
+            return
+        while parent._parent is not None:
+            (top, parent) = (parent, parent._parent)
+        if parent._dirty_children is not None:
+            parent._dirty_children.add(top)
+            parent._dirty_waits.add(top)
+
+    def add_shlock(self, wf: Workflow):
+        self._shlock.append(wf)
+        self._count_subtree(0, {wf: 1}, {}, 1)
+        self.touch()
+
+    def del_shlock(self, wf: Workflow):
+        self._shlock.remove(wf)
+        self._count_subtree(0, {wf: 1}, {}, -1)
+        self.touch()
+
+    def add_exlock(self, wf: Workflow):
+        self._exlock.append(wf)
+        self._count_subtree(0, {}, {wf: 1}, 1)
+        self.touch()
+
+    def del_exlock(self, wf: Workflow):
+        self._exlock.remove(wf)
+        self._count_subtree(0, {}, {wf: 1}, -1)
+        self.touch()
+
+    def del_ishlock(self, wf: Workflow):
+        self._ishlock.remove(wf)
+        self.touch()
+
+    def del_iexlock(self, wf: Workflow):
+        self._iexlock.remove(wf)
+        self.touch()
+
+    def children_changed(self, in_order: bool):
+        self._children_sorted = self._children_sorted and in_order
+        self._children_index = None
+
+    def _in_order(self, index: int) -> bool:
+        """Whether the child at index is in (lo, hi) order with its neighbours"""
+        children = self._children_obj
+        key = (children[index]._lo, children[index]._hi)
+        if index > 0 and (children[index - 1]._lo, children[index - 1]._hi) > key:
+            return False
+        if index + 1 < len(children) and key > (children[index + 1]._lo, children[index + 1]._hi):
+            return False
+        return True
+
+    def sort_children(self):
+        if not self._children_sorted:
+            self._children_obj = sorted(self._children_obj, key=lambda child: (child._lo, child._hi))
+            self._children_sorted = True
+            self._children_index = None
+
+    def children_index(self) -> Tuple[List[Tuple[str, str]], List[str], List[str]]:
+        """
+        Return the (lo, hi) of the children, their los, and the running max of their his, all in the order of the
+        children, to bisect on. The children whose dc range meets [lo, hi] are then the ones from
+        bisect_left(max_his, lo) up to bisect_right(los, hi), less those whose own hi is below lo.
+        """
+        self.sort_children()
+        if self._children_index is None:
+            keys = [(child._lo, child._hi) for child in self._children_obj]
+            los = [lo for (lo, _) in keys]
+            max_his = list(accumulate((hi for (_, hi) in keys), max))
+            self._children_index = (keys, los, max_his)
+        return self._children_index
+
     def insert_child(self, index, obj):
+        index = min(index, len(self._children_obj))
         self._children_obj.insert(index, obj)
+        self.children_changed(self._in_order(index))
+        obj.set_parent(self)
+        self._count_subtree(obj._num_sub_objs, obj._sub_shlock, obj._sub_exlock, 1)
+        obj.touch()
 
     def append_child(self, obj):
         self._children_obj.append(obj)
+        self.children_changed(self._in_order(len(self._children_obj) - 1))
+        obj.set_parent(self)
+        self._count_subtree(obj._num_sub_objs, obj._sub_shlock, obj._sub_exlock, 1)
+        obj.touch()
 
     def add_child(self, obj):
-        if not self._children_obj:
-            self.insert_child(0, obj)
-            return
+        """Insert obj in front of the children with the same (lo, hi)"""
+        (keys, _, _) = self.children_index()
+        self.insert_child(bisect_left(keys, (obj._lo, obj._hi)), obj)
 
-        for i in range(len(self._children_obj)):
-            child = self._children_obj[i]
-            if obj._lo < child._lo or (obj._lo == child._lo and obj._hi <= child._hi):
-                self._children_obj.insert(i, obj)
-                return
-
-        self._children_obj.append(obj)
+    def insort_child(self, obj):
+        """Insert obj behind the children with the same (lo, hi), where appending and sorting would put it"""
+        (keys, _, _) = self.children_index()
+        self.insert_child(bisect_right(keys, (obj._lo, obj._hi)), obj)
 
     def del_child(self, obj):
-        return self._children_obj.remove(obj)
+        self._children_obj.remove(obj)
+        self.children_changed(True)
+        self._count_subtree(obj._num_sub_objs, obj._sub_shlock, obj._sub_exlock, -1)
+        self.touch()
+        # the obj may already hang under its new parent
+        if obj._parent is self:
+            obj.set_parent(None)
 
     def get_children(self):
         return self._children_obj
@@ -144,6 +314,8 @@ class TreeObjRegex:
 class RegexTreeRegex:
     def __init__(self, using_trace: bool, runner: Runner):
         self._root = TreeObjRegex(".*", using_trace, runner)
+        self._root._dirty_children = set()
+        self._root._dirty_waits = set()
         self._using_trace = using_trace
         self._runner = runner
 
@@ -156,17 +328,16 @@ class RegexTreeRegex:
         return objs
 
     def _find_path(self, root: TreeObjRegex, obj: TreeObjRegex):
-        if root == obj:
-            return [root]
-
-        if len(root.get_children()) == 0:
+        """Return the objs from root down to obj by following the parents of obj up, or [] if obj is not below root"""
+        if obj._depth < root._depth:
             return []
-
-        for child in root.get_children():
-            res = self._find_path(child, obj)
-            if res:
-                return [root] + res
-        return []
+        path = [obj]
+        while path[-1] is not root:
+            if path[-1]._parent is None:
+                return []
+            path.append(path[-1]._parent)
+        path.reverse()
+        return path
 
     def find_path(self, root: TreeObjRegex, obj: TreeObjRegex):
         path = self._find_path(root, obj)
@@ -187,12 +358,14 @@ class RegexTreeRegex:
         if atype == AccType.READ:
             assert (wf not in obj._ishlock) and (obj not in wf._ishlock)
             obj._ishlock.append(wf)
-            wf._ishlock.append(obj)
+            wf.add_ishlock(obj)
+            obj.touch()
         elif atype == AccType.WRITE:
             assert wf not in obj._iexlock
             assert obj not in wf._iexlock
             obj._iexlock.append(wf)
-            wf._iexlock.append(obj)
+            wf.add_iexlock(obj)
+            obj.touch()
         else:
             raise Exception("Wrong access type!")
 
@@ -204,6 +377,7 @@ class RegexTreeRegex:
             self.insert_req_edge(obj, wf)
             return
 
+        (_, los, max_his) = root.children_index()
         # less than all children, insert at the front
         if obj.get_hi() < root.get_children()[0].get_lo():
             logger.debug("less than all")
@@ -211,8 +385,10 @@ class RegexTreeRegex:
             self.insert_req_edge(obj, wf)
             return
 
-        num_child = len(root.get_children())
-        idx = 0
+        # only the children whose dc range meets the one of obj can contain or overlap it: the children before idx
+        # all end below obj._lo and the ones from num_child on all start above obj._hi
+        idx = bisect_left(max_his, obj._lo)
+        num_child = bisect_right(los, obj._hi)
         flag_untouched = True
         contains = []
         overlaps = []
@@ -221,27 +397,24 @@ class RegexTreeRegex:
         # Stage 1: classify the relation of children in the current layer
         while idx < num_child:
             child: TreeObjRegex = root.get_children()[idx]
-            logger.debug(
-                "{} child={}, obj={}, idx={}, num_child={}".format(
-                    "inter while,", child._regex, obj._regex, idx, num_child
-                )
-            )
+            logger.debug("%s child=%s, obj=%s, idx=%s, num_child=%s", "inter while,", child, obj, idx, num_child)
 
-            if child._lo > obj._hi:
-                break
+            if child._hi < obj._lo:
+                idx += 1
+                continue
 
             # the inserted obj contains existing objects
             # we regard obj == child as obj contains child
             # if RegexTool.contain_regex(obj._fsm, child._fsm):
             if RegexTool.contain_regex_opt(obj, child, self._runner):
-                logger.debug("{} child = {} obj = {}".format("insert: obj contains child", child._regex, obj._regex))
+                logger.debug("%s child = %s obj = %s", "insert: obj contains child", child, obj)
                 flag_untouched = False
                 contains.append(child)
 
             # an existing obj contains the inserted one, going into the next layer
             # elif RegexTool.contain_proper_regex(child._fsm, obj._fsm):
             elif RegexTool.contain_proper_regex_opt(child, obj, self._runner):
-                logger.debug("{} child = {} obj = {}".format("insert: child contains obj", child._regex, obj._regex))
+                logger.debug("%s child = %s obj = %s", "insert: child contains obj", child, obj)
                 flag_untouched = False
                 if not child.get_children():
                     child.insert_child(0, obj)
@@ -253,30 +426,27 @@ class RegexTreeRegex:
             # overlapping
             # elif RegexTool.overlap_regex(obj._fsm, child._fsm):
             elif RegexTool.overlap_regex_opt(obj, child, self._runner):
-                logger.debug("{} child = {} obj = {}".format("insert: overlapping", child._regex, obj._regex))
+                logger.debug("%s child = %s obj = %s", "insert: overlapping", child, obj)
                 flag_untouched = False
                 overlaps.append(child)
             idx += 1
 
         if flag_untouched:
-            logger.debug("insert untouch {}".format(obj._regex))
-            root.append_child(obj)
+            logger.debug("insert untouch %s", obj)
+            root.insort_child(obj)
             self.insert_req_edge(obj, wf)
-            self.sort_layer(root)
             return
 
         if overlaps or contains:
             # Stage 2: partition for the overlapping child
             flag_remaining = True
             for ch in overlaps:
-                logger.debug("{} obj = {} ch = {}".format("insert: iterate over overlaps, ", obj._regex, ch._regex))
+                logger.debug("%s obj = %s ch = %s", "insert: iterate over overlaps, ", obj, ch)
                 # after partitioning, the remaining obj == ch
                 # if RegexTool.equal_regex(obj._fsm, ch._fsm):
                 if RegexTool.equal_regex_opt(obj, ch, self._runner):
                     logger.debug("in equal_regex")
-                    logger.debug(
-                        "{} obj = {} ch = {}".format("partition overlapping: obj is equal to ch", obj._regex, ch._regex)
-                    )
+                    logger.debug("%s obj = %s ch = %s", "partition overlapping: obj is equal to ch", obj, ch)
                     flag_remaining = False
                     obj.append_child(ch)
                     self.insert_req_edge(obj, wf)
@@ -287,11 +457,7 @@ class RegexTreeRegex:
                 # elif RegexTool.contain_regex(ch._fsm, obj._fsm):
                 elif RegexTool.contain_regex_opt(ch, obj, self._runner):
                     logger.debug("in contain_regex")
-                    logger.debug(
-                        "{} obj = {} ch = {}".format(
-                            "partition overlapping: ch now contains obj", obj._regex, ch._regex
-                        )
-                    )
+                    logger.debug("%s obj = %s ch = %s", "partition overlapping: ch now contains obj", obj, ch)
                     flag_remaining = False
                     if not ch.get_children():
                         ch.insert_child(0, obj)
@@ -302,7 +468,7 @@ class RegexTreeRegex:
                     overlaps = overlaps[: len(commons)]
                     break
                 intersec, obj_diff, ch_diff = RegexTool.intersec_regex(obj._fsm, ch._fsm)
-                intersec_obj = TreeObjRegex(RegexTool.to_regex(intersec), self._using_trace, self._runner)
+                intersec_obj = TreeObjRegex(None, self._using_trace, self._runner, intersec)
                 ch.set_fsm(ch_diff)
                 obj.set_fsm(obj_diff)
                 commons.append(intersec_obj)
@@ -335,27 +501,26 @@ class RegexTreeRegex:
         """
         for wf in child._exlock:
             wf._exlock.append(common)
-            common._exlock.append(wf)
+            common.add_exlock(wf)
 
         for wf in child._shlock:
             wf._shlock.append(common)
-            common._shlock.append(wf)
+            common.add_shlock(wf)
 
         for wf in child._iexlock:
-            wf._iexlock.append(common)
+            wf.add_iexlock(common)
             common._iexlock.append(wf)
 
         for wf in child._ishlock:
-            wf._ishlock.append(common)
+            wf.add_ishlock(common)
             common._ishlock.append(wf)
+        common.touch()
 
     def rebuild_child(self, intersec: TreeObjRegex, child: TreeObjRegex):
         """
         Rebuild the tree for overlapping. Child has wrong children now that is going to be adjusted.
         """
-        logger.debug(
-            "{} intersec = {}, child = {}".format("rebuild_child: intersec, child: ", intersec._regex, child._regex)
-        )
+        logger.debug("%s intersec = %s, child = %s", "rebuild_child: intersec, child: ", intersec, child)
         i = 0
         child_num = len(child.get_children())
         while i < child_num:
@@ -367,18 +532,14 @@ class RegexTreeRegex:
             # if RegexTool.contain_regex(child._fsm, ch._fsm):
             if RegexTool.contain_regex_opt(child, ch, self._runner):
                 logger.debug(
-                    "{} child = {} intersec = {} ch = {}".format(
-                        "rebuild_child: child contains", child._regex, intersec._regex, ch._regex
-                    )
+                    "%s child = %s intersec = %s ch = %s", "rebuild_child: child contains", child, intersec, ch
                 )
                 pass
             # The child is now contained by the intersec; move the obj to intersec.
             # elif RegexTool.contain_regex(intersec._fsm, ch._fsm):
             elif RegexTool.contain_regex_opt(intersec, ch, self._runner):
                 logger.debug(
-                    "{} child = {} intersec = {} ch = {}".format(
-                        "rebuild_child: intersec contains", child._regex, intersec._regex, ch._regex
-                    )
+                    "%s child = %s intersec = %s ch = %s", "rebuild_child: intersec contains", child, intersec, ch
                 )
                 intersec.append_child(ch)
                 child.del_child(ch)
@@ -386,24 +547,15 @@ class RegexTreeRegex:
                 i -= 1
             # overlap with intersec and child
             else:
-                logger.debug(
-                    "{} child = {} intersec = {} ch = {}".format(
-                        "rebuild_child: overlap", child._regex, intersec._regex, ch._regex
-                    )
-                )
+                logger.debug("%s child = %s intersec = %s ch = %s", "rebuild_child: overlap", child, intersec, ch)
 
                 insec_intersec, _, _ = RegexTool.intersec_regex(ch._fsm, intersec._fsm)
                 insec_child, _, _ = RegexTool.intersec_regex(ch._fsm, child._fsm)
 
-                logger.debug(
-                    "{} child_part = {} common_part = {} ".format(
-                        "rebuild_child:", RegexTool.to_regex(insec_child), RegexTool.to_regex(insec_intersec)
-                    )
-                )
-
-                insec_intersec_obj = TreeObjRegex(RegexTool.to_regex(insec_intersec), self._using_trace, self._runner)
+                insec_intersec_obj = TreeObjRegex(None, self._using_trace, self._runner, insec_intersec)
                 self.rebuild_edge(ch, insec_intersec_obj)
                 ch.set_fsm(insec_child)
+                logger.debug("%s child_part = %s common_part = %s ", "rebuild_child:", ch, insec_intersec_obj)
                 intersec.append_child(insec_intersec_obj)
                 # rebuild the subtree recursively
                 self.rebuild_child(insec_intersec_obj, ch)
@@ -411,10 +563,8 @@ class RegexTreeRegex:
         self.sort_layer(child)
 
     def sort_layer(self, root: TreeObjRegex):
-        def dc_cmp(item: TreeObjRegex):
-            return (item.get_lo(), item.get_hi())
-
-        root._children_obj = sorted(root._children_obj, key=dc_cmp)
+        # only sorts if a child was put out of order or changed its dc range since the last time
+        root.sort_children()
 
     def delete_obj_if_possible(self, obj: TreeObjRegex) -> bool:
         if len(obj._ishlock) == 0 and len(obj._iexlock) == 0 and len(obj._shlock) == 0 and len(obj._exlock) == 0:
@@ -425,34 +575,30 @@ class RegexTreeRegex:
     def delete_obj(self, obj: TreeObjRegex):
         parent = self.find_parent(self._root, obj)
         if parent:
-            for child in obj.get_children():
+            # the children leave obj as well, or taking obj off would set their depths from it
+            for child in list(obj.get_children()):
                 parent.append_child(child)
+                obj.del_child(child)
             parent.del_child(obj)
             self.sort_layer(parent)
         else:
             self.show()
             raise Exception("Cannot find the parent in the regextree!")
 
-    # TODO: add a parent field to avoid this
     def find_parent(self, root: TreeObjRegex, obj: TreeObjRegex):
-        if root.has_child(obj):
-            return root
-
-        for child in root.get_children():
-            p = self.find_parent(child, obj)
-            if p:
-                return p
-        return None
+        """Return the parent of obj if obj is below root, else None"""
+        path = self._find_path(root, obj)
+        return path[-2] if len(path) > 1 else None
 
     def delete(self, wf: Workflow) -> None:
         # TODO: a workflow asks for the same obj
         # self.show(self._root)
         for obj in wf._shlock:
-            obj._shlock.remove(wf)
+            obj.del_shlock(wf)
             if len(obj._ishlock) == 0 and len(obj._iexlock) == 0 and len(obj._shlock) == 0:
                 self.delete_obj(obj)
         for obj in wf._exlock:
-            obj._exlock.remove(wf)
+            obj.del_exlock(wf)
             if len(obj._ishlock) == 0 and len(obj._iexlock) == 0:
                 self.delete_obj(obj)
 
@@ -11,6 +11,7 @@ from regex.regextool import RegexTool
 from .workflow import *
 from .events import *
 from .scheduler import *
+from .waitfor import WaitForGraph, num_wfs
 from tools.mylogging import logger
 
 if TYPE_CHECKING:
@@ -27,6 +28,18 @@ class NetObj:
         self._ishlock: List[Workflow] = []
         self._iexlock: List[Workflow] = []
 
+    def del_shlock(self, wf: Workflow):
+        self._shlock.remove(wf)
+
+    def del_exlock(self, wf: Workflow):
+        self._exlock.remove(wf)
+
+    def del_ishlock(self, wf: Workflow):
+        self._ishlock.remove(wf)
+
+    def del_iexlock(self, wf: Workflow):
+        self._iexlock.remove(wf)
+
 
 class BaselineScheduler(Scheduler):
     __metaclass__ = ABCMeta
@@ -35,6 +48,7 @@ class BaselineScheduler(Scheduler):
         super().__init__(using_trace)
         self._netobj_dict: Dict[str, NetObj] = dict()
         self._opt_level = 1
+        self.waitfor = WaitForGraph(self.get_waiting_wfs, self.get_holding_wfs)
 
     @abstractmethod
     def get_netobj_from_regex(self, regex: str):
@@ -51,21 +65,29 @@ class BaselineScheduler(Scheduler):
             if netobj._name in self._netobj_dict:
                 self._netobj_dict.pop(netobj._name)
 
+    def get_waiting_wfs(self, wf: Workflow) -> Dict[NetObj, List[Workflow]]:
+        """Return the wfs asking for the netobjs wf holds, by netobj"""
+        return dict((netobj, netobj._iexlock + netobj._ishlock) for netobj in wf._exlock + wf._shlock)
+
+    def get_holding_wfs(self, netobj: NetObj) -> List[Workflow]:
+        return netobj._shlock + netobj._exlock
+
     def add_edges(self, netobj: NetObj, wf: Workflow, wfobj: WfObj):
+        self.waitfor.touch(netobj)
         if wfobj._atype == AccType.READ:
             if not netobj._exlock:
                 netobj._shlock.append(wf)
                 wf._shlock.append(netobj)
             else:
                 netobj._ishlock.append(wf)
-                wf._ishlock.append(netobj)
+                wf.add_ishlock(netobj)
         elif wfobj._atype == AccType.WRITE:
             if not netobj._exlock and not netobj._shlock:
                 netobj._exlock.append(wf)
                 wf._exlock.append(netobj)
             else:
                 netobj._iexlock.append(wf)
-                wf._iexlock.append(netobj)
+                wf.add_iexlock(netobj)
         else:
             raise Exception("Undefined access type!")
 
@@ -91,8 +113,10 @@ class BaselineScheduler(Scheduler):
     def release_lock(self, wf: Workflow, task_to_metadata: dict):
         for netobj in wf._shlock:
             netobj._shlock.remove(wf)
+            self.waitfor.touch(netobj)
         for netobj in wf._exlock:
             netobj._exlock.remove(wf)
+            self.waitfor.touch(netobj)
 
         if task_to_metadata:
             task_to_metadata[wf._name]["schedule_time"] += self.lock_delay * len(wf._shlock + wf._exlock)
@@ -115,13 +139,7 @@ class BaselineScheduler(Scheduler):
         """return the next scheduled wf. Implemented by different policies."""
         pass
 
-    def reset_depset(self):
-        for wf in self.wf_list_running + self.wf_list_pending:
-            wf._dp_valid = False
-
     def schedule(self, ev_queue: list, ev_time: float) -> None:
-        # reset the dp cache flag
-        # self.reset_depset()
         alloc_dict = dict()
         has_deadlock = False
         logger.debug("schedule: {} netobjs to schedule".format(len(self._netobj_dict.values())))
@@ -131,9 +149,10 @@ class BaselineScheduler(Scheduler):
                 logger.debug("schedule: get shlock immedately")
                 for wf in netobj._ishlock:
                     wf._shlock.append(netobj)
-                    wf._ishlock.remove(netobj)
+                    wf.del_ishlock(netobj)
                 netobj._shlock = netobj._shlock + netobj._ishlock
                 netobj._ishlock.clear()
+                self.waitfor.touch(netobj)
 
             if len(netobj._exlock) == 0 and len(netobj._shlock) == 0:
                 assert len(netobj._iexlock) != 0 or len(netobj._ishlock) != 0
@@ -142,7 +161,7 @@ class BaselineScheduler(Scheduler):
                     sched_wf = self.get_candidate(netobj)
                 except DeadlockException as e:
                     deadlockrollback(
-                        e._rb_wf, self.objtree, self.wf_list_pending, ev_queue, ev_time, self.records, self.runner
+                        e._wfs, self.objtree, self.wf_list_pending, ev_queue, ev_time, self.records, self.runner
                     )
                     has_deadlock = True
                 if has_deadlock:
@@ -170,15 +189,16 @@ class BaselineScheduler(Scheduler):
                 else:
                     if sched_wf.get_cur_obj()._atype == AccType.READ:
                         for wf in netobj._ishlock:
-                            wf._ishlock.remove(netobj)
+                            wf.del_ishlock(netobj)
                             wf._shlock.append(netobj)
                         netobj._shlock = netobj._shlock + netobj._ishlock
                         netobj._ishlock.clear()
                     else:
                         netobj._iexlock.remove(sched_wf)
                         netobj._exlock.append(sched_wf)
-                        sched_wf._iexlock.remove(netobj)
+                        sched_wf.del_iexlock(netobj)
                         sched_wf._exlock.append(netobj)
+                    self.waitfor.touch(netobj)
 
             # exlock auto get exlock
             if len(netobj._exlock) > 0 and len(netobj._iexlock) > 0:
@@ -188,9 +208,10 @@ class BaselineScheduler(Scheduler):
                         removed.append(wf)
                 for wf in removed:
                     netobj._iexlock.remove(wf)
-                    wf._iexlock.remove(netobj)
+                    wf.del_iexlock(netobj)
                 if removed:
                     logger.debug("schedule: exlock auto get exlock")
+                    self.waitfor.touch(netobj)
 
             # exlock auto get shlock
             if len(netobj._exlock) > 0 and len(netobj._ishlock) > 0:
@@ -200,9 +221,10 @@ class BaselineScheduler(Scheduler):
                         removed.append(wf)
                 for wf in removed:
                     netobj._ishlock.remove(wf)
-                    wf._ishlock.remove(netobj)
+                    wf.del_ishlock(netobj)
                 if removed:
                     logger.debug("schedule: exlock auto get shlock")
+                    self.waitfor.touch(netobj)
 
             # shlock upgrade to exlock
             if len(netobj._shlock) > 0 and len(netobj._iexlock) > 0:
@@ -216,11 +238,12 @@ class BaselineScheduler(Scheduler):
                         wf._shlock.remove(netobj)
 
                         netobj._iexlock.remove(wf)
-                        wf._iexlock.remove(netobj)
+                        wf.del_iexlock(netobj)
                         netobj._exlock.append(wf)
                         wf._exlock.append(netobj)
                 if removed:
                     logger.debug("schedule: shlock upgrade to exlock")
+                    self.waitfor.touch(netobj)
 
         # To allocate the device at once
         if self._opt_level >= 2 and (
@@ -230,7 +253,7 @@ class BaselineScheduler(Scheduler):
             for netobj in alloc_dict:
                 if alloc_dict[netobj][0].get_cur_obj()._atype == AccType.READ:
                     for wf in alloc_dict[netobj]:
-                        wf._ishlock.remove(netobj)
+                        wf.del_ishlock(netobj)
                         wf._shlock.append(netobj)
                     netobj._shlock = netobj._shlock + netobj._ishlock
                     netobj._ishlock.clear()
@@ -238,24 +261,19 @@ class BaselineScheduler(Scheduler):
                     wf = alloc_dict[netobj][0]
                     netobj._iexlock.remove(wf)
                     netobj._exlock.append(wf)
-                    wf._iexlock.remove(netobj)
+                    wf.del_iexlock(netobj)
                     wf._exlock.append(netobj)
+                self.waitfor.touch(netobj)
 
-        remove_wf = []
-        for wf in self.wf_list_pending:
+        for wf in self.pop_ready():
             # self.show_scheduling_info(wf)
-            if wf.runnable():
-                wf._status = Status.RUNNING
-                remove_wf.append(wf)
-                heappush(ev_queue, (ev_time, alloc_event_id(), EvObjStart(ev_time=ev_time, wf=wf, runner=self.runner)))
-        for wf in remove_wf:
-            self.wf_list_pending.remove(wf)
-            self.wf_list_running.append(wf)
+            heappush(ev_queue, (ev_time, alloc_event_id(), EvObjStart(ev_time=ev_time, wf=wf, runner=self.runner)))
 
         if len(self.wf_list_running) == 0 and len(self.wf_list_pending) > 0 and not has_deadlock:
             has_deadlock = True
+            # the pending wfs may wait on each other in ways the wait-for graph does not see, then the first one goes
             deadlockrollback(
-                self.wf_list_pending[0],
+                self.waitfor.find_cycle(self.wf_list_pending) or self.wf_list_pending[:1],
                 self.objtree,
                 self.wf_list_pending,
                 ev_queue,
@@ -287,7 +305,7 @@ class BaselineScheduler(Scheduler):
         )
         start = time.time()
         wf: Workflow = event._wf
-        self.wf_list_pending.append(wf)
+        self.add_pending(wf)
         # insert the first obj into the objtree
         wf._cur_obj = 0
         wfobj = wf.get_cur_obj()
@@ -320,9 +338,10 @@ class BaselineScheduler(Scheduler):
         start = time.time()
         # step 1: remove the allocated edges and the obj if no wf waiting for it
         self.release_lock(event._wf, task_to_metadata)
-        # step 2: remove the wf from the active list
+        # step 2: remove the wf from the active list and the wait-for graph
         self.wf_list_running.remove(event._wf)
         self.wf_list_complete.append(event._wf)
+        self.waitfor.remove(event._wf)
         # step 3: record completion time
         if task_to_metadata:
             task_to_metadata[event._wf._name]["finish_time"] = ev_time
@@ -377,7 +396,7 @@ class BaselineScheduler(Scheduler):
             # set the status to pending before scheduling the next obj
             wf._status = Status.PENDING
             self.wf_list_running.remove(wf)
-            self.wf_list_pending.append(wf)
+            self.add_pending(wf)
             self.schedule(ev_queue=ev_queue, ev_time=ev_time)
         # This is the last obj in this workflow, we need to insert a flow completion event
         else:
@@ -418,8 +437,7 @@ def get_device_from_regex(runner, using_trace, regex: str) -> List[str]:
         if regex in runner.reg2dev_map:
             return runner.reg2dev_map[regex]
         else:
-            devices = runner.device_cache
-            return [d for d in devices if re.match(regex, d)]
+            return get_matched_devices(runner, regex)
     else:
         fsm: fsm = RegexTool.to_fsm(regex)
         res: List[str] = []
@@ -471,26 +489,6 @@ class BaselineDepSetScheduler(BaselineScheduler):
         """implemented by subclass to get devices or dcs"""
         pass
 
-    def get_depedent_wfs(self, wf: Workflow) -> Set[Workflow]:
-        # print("get_depedent_wfs", wf._name)
-        if wf._dp_valid:
-            return wf._dep_wfs
-        dep_wfs = set()
-        dep_wfs.add(wf)
-        # print("wf._exlock + wf._shlock", len(wf._exlock + wf._shlock))
-        for netobj in wf._exlock + wf._shlock:  # 14471
-            # print("netobj._iexlock + netobj._ishlock", len(netobj._iexlock + netobj._ishlock))
-            for waited_wf in netobj._iexlock + netobj._ishlock:  # 4
-                # print("waited_wf:", waited_wf._name)
-                try:
-                    dep_wfs.update(self.get_depedent_wfs(waited_wf))
-                except RecursionError:
-                    logger.debug("----- deadlock detected -----")
-                    raise DeadlockException(waited_wf)
-        wf._dp_valid = True
-        wf._dep_wfs = dep_wfs
-        return dep_wfs
-
     def get_candidate(self, netobj: NetObj) -> Workflow:
         """Return the next scheduled wf. Implemented by different policies.
         We use dynamic programming to optimize it.
@@ -518,9 +516,6 @@ class BaselineDepSetScheduler(BaselineScheduler):
             logger.debug("candidate: netobj._iexlock=1")
             sched_wf = netobj._iexlock[0]
         else:
-            # reset the dp cache flag
-            self.reset_depset()
-
             logger.debug("candidate: compute depesent set")
             assert not (len(netobj._iexlock) == 0 and len(netobj._ishlock) == 0)
             super_read_wf = None
@@ -531,18 +526,18 @@ class BaselineDepSetScheduler(BaselineScheduler):
                     super_read_wf.add_obj(WfObj("pod[1-8]dc1", 1, AccType.READ))
                     super_read_wf._cur_obj = 0
                     super_read_wf.get_cur_obj()._arrival_time = float("inf")
-                wf._dep_wfs = self.get_depedent_wfs(wf)
-                super_read_wf._dep_wfs.update(wf._dep_wfs)
+                wf._dep_wfs = self.waitfor.get_dependent_wfs(wf)
+                super_read_wf._dep_wfs |= wf._dep_wfs
                 if super_read_wf.get_cur_obj()._arrival_time > wf.get_cur_obj()._arrival_time:
                     super_read_wf.get_cur_obj()._arrival_time = wf.get_cur_obj()._arrival_time
 
             sched_wf = super_read_wf
-            max_depset: int = -1 if not super_read_wf else len(super_read_wf._dep_wfs)
+            max_depset: int = -1 if not super_read_wf else num_wfs(super_read_wf._dep_wfs)
             earliest_arrival: float = float("inf") if not super_read_wf else super_read_wf.get_cur_obj()._arrival_time
             for wf in netobj._iexlock:
-                wf._dep_wfs = self.get_depedent_wfs(wf)
+                wf._dep_wfs = self.waitfor.get_dependent_wfs(wf)
                 logger.debug(
-                    "candidate: wf.name={}, depset={}, max_depset={}".format(wf._name, len(wf._dep_wfs), max_depset)
+                    "candidate: wf.name={}, depset={}, max_depset={}".format(wf._name, num_wfs(wf._dep_wfs), max_depset)
                 )
                 logger.debug(
                     "candidate: wf.name={}, arrival={}, earliest_arrival={}".format(
@@ -550,12 +545,12 @@ class BaselineDepSetScheduler(BaselineScheduler):
                     )
                 )
 
-                if len(wf._dep_wfs) > max_depset:
-                    max_depset = len(wf._dep_wfs)
+                if num_wfs(wf._dep_wfs) > max_depset:
+                    max_depset = num_wfs(wf._dep_wfs)
                     sched_wf = wf
                     earliest_arrival = wf.get_cur_obj()._arrival_time
-                elif len(wf._dep_wfs) == max_depset and wf.get_cur_obj()._arrival_time < earliest_arrival:
-                    max_depset = len(wf._dep_wfs)
+                elif num_wfs(wf._dep_wfs) == max_depset and wf.get_cur_obj()._arrival_time < earliest_arrival:
+                    max_depset = num_wfs(wf._dep_wfs)
                     earliest_arrival = wf.get_cur_obj()._arrival_time
                     sched_wf = wf
 
@@ -3,42 +3,61 @@ from tools.util import *
 from .events import EvWfArrival
 from regex.regextree import RegexTreeRegex
 from .workflow import Workflow
+from tools.mylogging import logger
 
 
 class DeadlockException(Exception):
     """Exception raised for deadlock in scheduling.
 
     Attributes:
-        rb_wf: The workflow that needs to rollback
+        wfs: The workflows waiting for each other, one of which needs to rollback
     """
 
-    def __init__(self, rb_wf, message="deadlock exception"):
-        self._rb_wf = rb_wf
-        self._message = "Deadlock casued by " + rb_wf._name
+    def __init__(self, wfs, message="deadlock exception"):
+        self._wfs = wfs
+        self._message = "Deadlock among " + ", ".join(wf._name for wf in wfs)
         super().__init__(self._message)
 
 
-def deadlockrollback(rb_wf: Workflow, objtree: RegexTreeRegex, wf_list, ev_queue, ev_time, records: List[str], runner):
+def num_locks(wf: Workflow) -> int:
+    return len(wf._exlock) + len(wf._shlock)
+
+
+# how to pick the wf to rollback out of a deadlock, the one with the smallest key. Ties go to the wf found first.
+VICTIM_POLICIES = {
+    # the least to give back and to ask for again, then the youngest
+    "fewest_locks": lambda wf: (num_locks(wf), -wf.get_cur_obj()._arrival_time),
+    # the one which waited the least so far, then the one with fewest locks
+    "youngest": lambda wf: (-wf.get_cur_obj()._arrival_time, num_locks(wf)),
+}
+
+
+def deadlockrollback(
+    wfs: List[Workflow], objtree: RegexTreeRegex, wf_list, ev_queue, ev_time, records: List[str], runner
+):
+    rb_wf = min(wfs, key=VICTIM_POLICIES[runner.scheduler.deadlock_victim])
+    logger.debug("deadlock among %s, rollback %s", [wf._name for wf in wfs], rb_wf._name)
+    runner.scheduler.waitfor.remove(rb_wf)
     for obj in rb_wf._exlock:
-        obj._exlock.remove(rb_wf)
+        obj.del_exlock(rb_wf)
         if runner.scheduler.__class__.__name__.startswith("Occam"):
             objtree.delete_obj_if_possible(obj)
         else:
             runner.scheduler.delete_obj_if_possible(obj)
     for obj in rb_wf._shlock:
-        obj._shlock.remove(rb_wf)
+        obj.del_shlock(rb_wf)
         if runner.scheduler.__class__.__name__.startswith("Occam"):
             objtree.delete_obj_if_possible(obj)
         else:
             runner.scheduler.delete_obj_if_possible(obj)
     for obj in rb_wf._ishlock:
-        obj._ishlock.remove(rb_wf)
+        obj.del_ishlock(rb_wf)
         if runner.scheduler.__class__.__name__.startswith("Occam"):
             objtree.delete_obj_if_possible(obj)
         else:
             runner.scheduler.delete_obj_if_possible(obj)
     for obj in rb_wf._iexlock:
-        obj._iexlock.remove(rb_wf)
+        obj.del_iexlock(rb_wf)
         if runner.scheduler.__class__.__name__.startswith("Occam"):
             objtree.delete_obj_if_possible(obj)
         else:
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest scheduler`")
+
+import contextlib
+import io
+
+import pytest
+from regex.regextree import TreeObjRegex
+from scheduler.occamscheduler import OccamDepSetScheduler, OccamFIFOScheduler
+from scheduler.runner import TestRunner as Runner
+from scheduler.workflow import Workflow, WfObj
+from tools.util import AccType
+
+
+def arrive(scheduler, name: str, regex: str, atype: AccType, arrival_time: float) -> Workflow:
+    """Put the requests of a new wf into the objtree, without scheduling them"""
+    wf = Workflow(name)
+    wf.add_obj(WfObj(regex, 2, atype))
+    wf._cur_obj = 0
+    wf.get_cur_obj()._arrival_time = arrival_time
+    scheduler.objtree.insert(scheduler.objtree._root, TreeObjRegex(regex, False, scheduler.runner), wf)
+    return wf
+
+
+def grant(wf: Workflow, obj: TreeObjRegex):
+    """Grant the lock wf asks for on obj, as schedule() does"""
+    if wf in obj._iexlock:
+        obj._iexlock.remove(wf)
+        obj.add_exlock(wf)
+        wf.del_iexlock(obj)
+        wf._exlock.append(obj)
+    else:
+        obj._ishlock.remove(wf)
+        obj.add_shlock(wf)
+        wf.del_ishlock(obj)
+        wf._shlock.append(obj)
+
+
+def make_cycle(cls, victim: str):
+    """
+    Return a scheduler with two pending wfs waiting for each other, and the wfs. w writes (tor|agg)3pod3dc[2-3]
+    and holds all of it but tor3pod3dc3, r reads tor3pod[1-3]dc[2-3] and holds all of it but tor3pod3dc2.
+    w arrived after r, but holds more locks.
+    """
+    ev_queue = []
+    runner = Runner(ev_queue)
+    scheduler = cls(using_trace=False)
+    scheduler.deadlock_victim = victim
+    scheduler.enable_sanity_check = True
+    runner.set_scheduler(scheduler)
+    # a wf across both dcs splits the requests of w and r at the dc
+    splitter = arrive(scheduler, "splitter", "(tor|agg)[1-3]pod3dc3", AccType.WRITE, 0)
+    w = arrive(scheduler, "w", "(tor|agg)3pod3dc[2-3]", AccType.WRITE, 2)
+    r = arrive(scheduler, "r", "tor3pod[1-3]dc[2-3]", AccType.READ, 1)
+    for obj in list(splitter._iexlock):
+        obj._iexlock.remove(splitter)
+        splitter.del_iexlock(obj)
+        scheduler.objtree.delete_obj_if_possible(obj)
+
+    both = [obj for obj in w._iexlock if obj in r._ishlock]
+    assert sorted(str(obj) for obj in both) == ["tor3pod3dc2", "tor3pod3dc3"]
+    for obj in list(w._iexlock):
+        if str(obj) != "tor3pod3dc3":
+            grant(w, obj)
+    for obj in list(r._ishlock):
+        if str(obj) != "tor3pod3dc2":
+            grant(r, obj)
+    assert (len(w._exlock), len(r._shlock)) == (3, 2)
+    scheduler.add_pending(r)
+    scheduler.add_pending(w)
+    return (scheduler, w, r)
+
+
+@pytest.mark.parametrize("cls", [OccamDepSetScheduler, OccamFIFOScheduler])
+@pytest.mark.parametrize("victim", ["fewest_locks", "youngest"])
+def test_two_cycle(cls, victim):
+    (scheduler, w, r) = make_cycle(cls, victim)
+    rb_wf = r if victim == "fewest_locks" else w
+    assert set(scheduler.waitfor.find_cycle(scheduler.wf_list_pending)) == {w, r}
+
+    # nothing runs, so the next schedule() finds the cycle and rolls back one wf
+    scheduler.schedule(scheduler.runner.ev_queue, 3)
+    assert scheduler.records == ["Deadlock: ev_time = 3, wf_name = {}\n".format(rb_wf._name)]
+    assert scheduler.wf_list_running == [w if rb_wf is r else r]
+    assert rb_wf not in scheduler.wf_list_pending
+    assert not rb_wf._exlock and not rb_wf._shlock and not rb_wf._iexlock and not rb_wf._ishlock
+
+    # it arrives again, and runs after the other one
+    with contextlib.redirect_stdout(io.StringIO()):
+        records = scheduler.runner.run()
+    completions = [record for record in records if record.startswith("EvWfCompletion")]
+    assert completions == [
+        "EvWfCompletion: ev_time = 5, wf_name = {}\n".format(scheduler.wf_list_complete[0]._name),
+        "EvWfCompletion: ev_time = 7, wf_name = {}\n".format(rb_wf._name),
+    ]
+    assert scheduler.wf_list_complete[0] is not rb_wf
+    assert not scheduler.wf_list_pending and not scheduler.wf_list_running
+    assert not scheduler.objtree._root.get_children()
@@ -5,7 +5,7 @@ from typing import TYPE_CHECKING
 from heapq import heappush
 from regex.greenery.fsm import fsm
 from regex.regextool import RegexTool
-from typing import List, Set
+from typing import Dict, List, Set
 from abc import ABCMeta, abstractmethod
 
 from regex.regextree import TreeObjRegex, logger
@@ -15,6 +15,7 @@ from tools.util import *
 from .sanity_check import check_regextree, check_workflow
 from .deadlock import *
 from .scheduler import Scheduler
+from .waitfor import WaitForGraph, num_wfs
 
 if TYPE_CHECKING:
     from scheduler.runner import Runner
@@ -25,15 +26,14 @@ class OccamScheduler(Scheduler):
 
     def __init__(self, using_trace=True) -> None:
         super().__init__(using_trace)
+        # only go through the subtrees which changed since the last schedule(), see objs_to_schedule()
+        self.incremental_schedule = True
+        self.waitfor = WaitForGraph(self.get_waiting_wfs, self.get_holding_wfs)
 
     @abstractmethod
     def get_candidate(self, super_read_wf, write_wfs):
         pass
 
-    def reset_depset(self):
-        for wf in self.wf_list_running + self.wf_list_pending:
-            wf._dp_valid = False
-
     def handle_EvWfArrival(
         self, ev_queue: list, ev_id: int, ev_time: float, event: EvWfArrival, task_to_metadata: dict
     ):
@@ -58,12 +58,12 @@ class OccamScheduler(Scheduler):
         if task_to_metadata:
             task_to_metadata[wf._name]["schedule_time"] += self.lock_delay * 6
 
-        self.wf_list_pending.append(wf)
+        self.add_pending(wf)
         start = time.time()
         self.schedule(ev_queue=ev_queue, ev_time=ev_time)
         end = time.time()
         self.pending_q_len.append((ev_time, len(self.wf_list_pending)))
-        self.active_netobj.append((ev_time, len(self.objtree.get_all_children(self.objtree._root))))
+        self.active_netobj.append((ev_time, self.objtree._root._num_sub_objs - 1))
         if task_to_metadata:
             task_to_metadata[event._wf._name]["schedule_time"] += int((end - start) * 1000000)
 
@@ -86,9 +86,10 @@ class OccamScheduler(Scheduler):
         if task_to_metadata:
             task_to_metadata[event._wf._name]["schedule_time"] += self.lock_delay * 6
 
-        # step 2: remove the wf from the active list
+        # step 2: remove the wf from the active list and the wait-for graph
         self.wf_list_running.remove(event._wf)
         self.wf_list_complete.append(event._wf)
+        self.waitfor.remove(event._wf)
         # step 3: record completion time
         if task_to_metadata:
             task_to_metadata[event._wf._name]["finish_time"] = ev_time
@@ -98,7 +99,7 @@ class OccamScheduler(Scheduler):
         self.schedule(ev_queue=ev_queue, ev_time=ev_time)
         end = time.time()
         self.pending_q_len.append((ev_time, len(self.wf_list_pending)))
-        self.active_netobj.append((ev_time, len(self.objtree.get_all_children(self.objtree._root))))
+        self.active_netobj.append((ev_time, self.objtree._root._num_sub_objs - 1))
         if task_to_metadata:
             task_to_metadata[event._wf._name]["schedule_time"] += int((end - start) * 1000000)
 
@@ -165,12 +166,12 @@ class OccamScheduler(Scheduler):
             if not flag_all_get:
                 # still ask for lock, update the regex
                 self.objtree.insert(
-                    self.objtree._root, TreeObjRegex(RegexTool.to_regex(wfobj_fsm), self.using_trace, self.runner), wf
+                    self.objtree._root, TreeObjRegex(None, self.using_trace, self.runner, wfobj_fsm), wf
                 )
             # set the status to pending before scheduling the next obj
             wf._status = Status.PENDING
             self.wf_list_running.remove(wf)
-            self.wf_list_pending.append(wf)
+            self.add_pending(wf)
             self.schedule(ev_queue=ev_queue, ev_time=ev_time)
         # This is the last obj in this workflow, we need to insert a flow completion event
         else:
@@ -180,8 +181,8 @@ class OccamScheduler(Scheduler):
         """grant all read look for the obj"""
         for wf in obj._ishlock:
             wf._shlock.append(obj)
-            wf._ishlock.remove(obj)
-        obj._shlock = obj._shlock + obj._ishlock
+            wf.del_ishlock(obj)
+            obj.add_shlock(wf)
         obj._ishlock.clear()
 
     def show_scheduling_info(self, wf: Workflow):
@@ -208,35 +209,57 @@ class OccamScheduler(Scheduler):
                 assert len(co._shlock) == 1
                 assert co._shlock[0] == wf
                 wf._shlock.remove(co)
-                co._shlock.remove(wf)
+                co.del_shlock(wf)
                 self.objtree.delete_obj_if_possible(obj)
             elif len(co._exlock) > 0:
                 assert len(co._exlock) == 1
                 assert co._exlock[0] == wf
                 wf._exlock.remove(co)
-                co._exlock.remove(wf)
+                co.del_exlock(wf)
                 self.objtree.delete_obj_if_possible(obj)
 
-    def get_depedent_wfs(self, objtree, wf: Workflow) -> Set[Workflow]:
-        if wf._dp_valid:
-            return wf._dep_wfs
-
-        dep_wfs = set()
-        dep_wfs.add(wf)
-
+    def get_waiting_wfs(self, wf: Workflow) -> Dict[TreeObjRegex, List[Workflow]]:
+        """Return the wfs asking for a lock in the containment of the locks of wf, by the child of the root above"""
+        waiting = dict()
         for obj in wf._exlock + wf._shlock:
-            contain_objs = objtree.get_containment(objtree._root, obj, proper=False)
+            contain_objs = self.objtree.get_containment(self.objtree._root, obj, proper=False)
+            # the containment starts with the path from the child of the root down to obj
+            wfs = waiting.setdefault(contain_objs[0], [])
             for co in contain_objs:
-                for waited_wf in co._iexlock + co._ishlock:
-                    if waited_wf != wf:
-                        try:
-                            dep_wfs.update(self.get_depedent_wfs(objtree, waited_wf))
-                        except RecursionError:
-                            logger.debug("----- deadlock detected -----")
-                            raise DeadlockException(waited_wf)
-        wf._dp_valid = True
-        wf._dep_wfs = dep_wfs
-        return dep_wfs
+                wfs += co._iexlock + co._ishlock
+        return waiting
+
+    def get_holding_wfs(self, top: TreeObjRegex) -> List[Workflow]:
+        """Return the wfs holding locks under top, a child of the root now or before"""
+        if top._parent is not self.objtree._root:
+            return []
+        return list(top._sub_shlock) + list(top._sub_exlock)
+
+    def touch_waits(self):
+        """Tell the wait-for graph which subtrees changed since it last heard"""
+        root = self.objtree._root
+        for top in root._dirty_waits:
+            self.waitfor.touch(top)
+        root._dirty_waits = set()
+
+    def objs_to_schedule(self) -> List[TreeObjRegex]:
+        """
+        Return the objs for schedule() to go through, in the order of get_all_children(root). Whether a case below
+        applies to an obj only depends on the locks and the requests in the subtree of the child of the root it is
+        under. So with incremental_schedule, the subtrees which did not change since schedule() last went through
+        them, and changed nothing, are left out: they would not change anything this time either.
+        """
+        self.touch_waits()
+        root = self.objtree._root
+        if not self.incremental_schedule:
+            return self.objtree.get_all_children(root)
+        dirty = root._dirty_children
+        root._dirty_children = set()
+        tops = [child for child in root.get_children() if child in dirty]
+        objs = list(tops)
+        for top in tops:
+            objs += self.objtree.get_all_children(top)
+        return objs
 
     def schedule(self, ev_queue: list, ev_time: float) -> None:
         reschedule = False
@@ -244,11 +267,11 @@ class OccamScheduler(Scheduler):
 
         # logger.debug(self.objtree.show())
 
-        all_objs = self.objtree.get_all_children(self.objtree._root)
+        all_objs = self.objs_to_schedule()
         for obj in all_objs:
             # delete the obj if no wfs ask for or hold it
             if self.objtree.delete_obj_if_possible(obj):
-                logger.debug("delete {}".format(obj._regex))
+                logger.debug("delete %s", obj)
                 continue
 
             # only one type of lock is allowed.
@@ -326,24 +349,23 @@ class OccamScheduler(Scheduler):
                 elif len(write_wfs) == 1 and len(read_wfs) == 0:
                     sched_wf = list(write_wfs)[0]
                 else:
-                    # reset the dp cache flag
-                    self.reset_depset()
+                    self.touch_waits()
                     try:
                         for wf in read_wfs:
-                            wf._dep_wfs = self.get_depedent_wfs(self.objtree, wf)
-                            super_read_wf._dep_wfs.update(wf._dep_wfs)
+                            wf._dep_wfs = self.waitfor.get_dependent_wfs(wf)
+                            super_read_wf._dep_wfs |= wf._dep_wfs
 
                         for wf in write_wfs:
-                            wf._dep_wfs = self.get_depedent_wfs(self.objtree, wf)
+                            wf._dep_wfs = self.waitfor.get_dependent_wfs(wf)
                     except DeadlockException as e:
                         deadlockrollback(
-                            e._rb_wf, self.objtree, self.wf_list_pending, ev_queue, ev_time, self.records, self.runner
+                            e._wfs, self.objtree, self.wf_list_pending, ev_queue, ev_time, self.records, self.runner
                         )
                         has_deadlock = True
 
                     if has_deadlock:
                         break
-                    logger.debug("schedule: get candidate " + str(obj._regex) + " at " + str(ev_time))
+                    logger.debug("schedule: get candidate %s at %s", obj, ev_time)
                     sched_wf = self.get_candidate(super_read_wf, write_wfs)
 
                 logger.debug("time= {}, sched_wf={}".format(ev_time, sched_wf._name))
@@ -357,10 +379,10 @@ class OccamScheduler(Scheduler):
                         for ro in wf._ishlock:
                             if ro in contain_objs:
                                 ro._ishlock.remove(wf)
-                                ro._shlock.append(wf)
+                                ro.add_shlock(wf)
                                 remove.append(ro)
                         for r in remove:
-                            wf._ishlock.remove(r)
+                            wf.del_ishlock(r)
                             wf._shlock.append(r)
                 else:  # ask for write lock
                     remove = []
@@ -368,10 +390,10 @@ class OccamScheduler(Scheduler):
                     for wo in sched_wf._iexlock:
                         if wo in contain_objs:
                             wo._iexlock.remove(sched_wf)
-                            wo._exlock.append(sched_wf)
+                            wo.add_exlock(sched_wf)
                             remove.append(wo)
                     for r in remove:
-                        sched_wf._iexlock.remove(r)
+                        sched_wf.del_iexlock(r)
                         sched_wf._exlock.append(r)
                     #       obj1
                     #       /  \
@@ -389,10 +411,10 @@ class OccamScheduler(Scheduler):
                     remove = []
                     if this_wf in obj._iexlock:
                         remove.append(this_wf)
-                        this_wf._iexlock.remove(obj)
-                        obj._shlock.remove(this_wf)
+                        this_wf.del_iexlock(obj)
+                        obj.del_shlock(this_wf)
                         this_wf._shlock.remove(obj)
-                        obj._exlock.append(this_wf)
+                        obj.add_exlock(this_wf)
                         this_wf._exlock.append(obj)
                     for r in remove:
                         obj._iexlock.remove(r)
@@ -427,10 +449,10 @@ class OccamScheduler(Scheduler):
                         assert target_obj
                         self.upgrade_to_exlock_children(target_obj, wf)
                         wf._exlock.append(target_obj)
-                        wf._iexlock.remove(obj)
-                        target_obj._exlock.append(wf)
+                        wf.del_iexlock(obj)
+                        target_obj.add_exlock(wf)
                         remove.append(wf)
-                        target_obj._shlock.remove(wf)
+                        target_obj.del_shlock(wf)
                         wf._shlock.remove(target_obj)
                     # the obj has children and only wf in the children
                     elif only_wf_in_children(self.objtree, obj, wf) and self.objtree.get_all_children(obj):
@@ -438,30 +460,29 @@ class OccamScheduler(Scheduler):
                         # upgrade all locks in the children to the exlock of this obj
                         self.upgrade_to_exlock_children(obj, wf)
                         wf._exlock.append(obj)
-                        wf._iexlock.remove(obj)
-                        obj._exlock.append(wf)
+                        wf.del_iexlock(obj)
+                        obj.add_exlock(wf)
                         remove.append(wf)
 
                 for r in remove:
                     obj._iexlock.remove(r)
 
-        # scan the wf_list to excute runnable workflows
-        # TODO: This can also be done by check and run the workflow when changing the edge above?
-        removed_wf = []
-        for wf in self.wf_list_pending:
-            if wf.runnable():
-                wf._status = Status.RUNNING
-                removed_wf.append(wf)
-                heappush(ev_queue, (ev_time, alloc_event_id(), EvObjStart(ev_time=ev_time, wf=wf, runner=self.runner)))
-        for wf in removed_wf:
-            self.wf_list_pending.remove(wf)
-            self.wf_list_running.append(wf)
+        # the loop stopped at a deadlock, the objs it did not get to are gone through again
+        if has_deadlock:
+            for obj in all_objs:
+                obj.touch()
+
+        # excute the workflows which got all their locks
+        for wf in self.pop_ready():
+            heappush(ev_queue, (ev_time, alloc_event_id(), EvObjStart(ev_time=ev_time, wf=wf, runner=self.runner)))
 
         # deadlock check
         if len(self.wf_list_running) == 0 and len(self.wf_list_pending) > 0 and not has_deadlock:
             has_deadlock = True
+            self.touch_waits()
+            # the pending wfs may wait on each other in ways the wait-for graph does not see, then the first one goes
             deadlockrollback(
-                self.wf_list_pending[0],
+                self.waitfor.find_cycle(self.wf_list_pending) or self.wf_list_pending[:1],
                 self.objtree,
                 self.wf_list_pending,
                 ev_queue,
@@ -503,23 +524,23 @@ class OccamDepSetScheduler(OccamScheduler):
         #             return 0
 
         sched_wf = super_read_wf
-        max_depset: int = -1 if not super_read_wf else len(super_read_wf._dep_wfs)
+        max_depset: int = -1 if not super_read_wf else num_wfs(super_read_wf._dep_wfs)
         earliest_arrival: float = float("inf") if not super_read_wf else super_read_wf.get_cur_obj()._arrival_time
         for wf in write_wfs:
             logger.debug(
-                "candidate: wf.name={}, depset={}, max_depset={}".format(wf._name, len(wf._dep_wfs), max_depset)
+                "candidate: wf.name={}, depset={}, max_depset={}".format(wf._name, num_wfs(wf._dep_wfs), max_depset)
             )
             logger.debug(
                 "candidate: wf.name={}, arrival={}, earliest_arrival={}".format(
                     wf._name, wf.get_cur_obj()._arrival_time, earliest_arrival
                 )
             )
-            if len(wf._dep_wfs) > max_depset:
-                max_depset = len(wf._dep_wfs)
+            if num_wfs(wf._dep_wfs) > max_depset:
+                max_depset = num_wfs(wf._dep_wfs)
                 earliest_arrival = wf.get_cur_obj()._arrival_time
                 sched_wf = wf
-            elif len(wf._dep_wfs) == max_depset and wf.get_cur_obj()._arrival_time < earliest_arrival:
-                max_depset = len(wf._dep_wfs)
+            elif num_wfs(wf._dep_wfs) == max_depset and wf.get_cur_obj()._arrival_time < earliest_arrival:
+                max_depset = num_wfs(wf._dep_wfs)
                 earliest_arrival = wf.get_cur_obj()._arrival_time
                 sched_wf = wf
         return sched_wf
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest scheduler`")
+
+import contextlib
+import io
+import random
+from heapq import heappush
+
+import pytest
+from scheduler.events import EvWfArrival
+from scheduler.occamscheduler import OccamDepSetScheduler, OccamFIFOScheduler
+from scheduler.runner import TestRunner as Runner
+from scheduler.workflow import Workflow, WfObj
+from tools.util import AccType, alloc_event_id
+
+
+@pytest.fixture(autouse=True)
+def hash_by_name(monkeypatch):
+    # sets of wfs are then iterated in the same order in both runs, as they are across two processes
+    monkeypatch.setattr(Workflow, "__hash__", lambda self: hash(self._name))
+
+
+def some(r: random.Random, lo: int, hi: int) -> str:
+    a = r.randint(lo, hi)
+    b = r.randint(a, hi)
+    return "[{}-{}]".format(a, b) if a < b else str(a)
+
+
+def run(seed: int, cls, incremental: bool) -> list:
+    """Run a random workload of seed through cls and return its records."""
+    r = random.Random(seed)
+    ev_queue = []
+    runner = Runner(ev_queue)
+    scheduler = cls(using_trace=False)
+    scheduler.incremental_schedule = incremental
+    runner.set_scheduler(scheduler)
+    for i in range(r.randint(5, 30)):
+        wf = Workflow("wf{}".format(i))
+        regex = r.choice(["tor", "agg", "(tor|agg)"]) + some(r, 0, 3) + "pod" + some(r, 0, 3) + "dc" + some(r, 1, 3)
+        wf.add_obj(WfObj(regex, r.randint(1, 5), r.choice([AccType.READ, AccType.WRITE])))
+        t = r.choice([0, 0, 1, 2, 3, 5])
+        heappush(ev_queue, (t, alloc_event_id(), EvWfArrival(ev_time=t, wf=wf, runner=runner)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        return runner.run()
+
+
+@pytest.mark.parametrize("cls", [OccamDepSetScheduler, OccamFIFOScheduler])
+def test_incremental_schedule(cls):
+    for seed in range(12):
+        full = run(seed, cls, False)
+        assert any(record.startswith("EvWfCompletion") for record in full)
+        assert run(seed, cls, True) == full
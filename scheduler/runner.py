@@ -1,4 +1,6 @@
 import ast
+import hashlib
+import os
 import random
 import pickle
 import csv
@@ -8,7 +10,11 @@ from scheduler.scheduler import Scheduler
 import sys
 import time
 from heapq import heappush, heappop
+from tools.build_cache import CACHE_VERSION, read_header
 from tools.util import alloc_event_id
+from tools.deviceindex import DeviceIndex
+from tools.devicenamespace import DeviceNamespace
+from tools.fsmcache import FsmCache
 from .workflow import WfObj, Workflow, AccType
 from scheduler.events import EvWfArrival
 
@@ -16,6 +22,8 @@ trace_type = AccType.RW
 cache_hit_rate = 0.95
 use_regextree_dev_opt = False
 regextree_dev_opt_thresh = 1e3
+use_regextree_dev_bitmap = False
+use_regextree_dev_signature = False
 random.seed(0)
 
 
@@ -23,12 +31,15 @@ class Runner:
     def __init__(self, folder, output_file_path, num_wf, gs, es):
         self.use_regextree_dev_opt = use_regextree_dev_opt
         self.regextree_dev_opt_thresh = regextree_dev_opt_thresh
+        self.use_regextree_dev_bitmap = use_regextree_dev_bitmap
+        self.use_regextree_dev_signature = use_regextree_dev_signature
 
         path_prefix_workload = "workload/" + folder
         self.path_dc_database = path_prefix_workload + "/dcs.txt"
         self.path_device_database = path_prefix_workload + "/devices.txt"
         self.path_reg2dev = path_prefix_workload + "/regex_device_map.long"
         self.path_fsm_cache = path_prefix_workload + "/reg2fsm.pkl"
+        self.path_fsm_bin = path_prefix_workload + "/reg2fsm.bin"
         self.path_workload = path_prefix_workload + "/workload_synthetic_gs" + str(gs) + "_es" + str(es) + ".txt"
 
         self.task_to_metadata = {}
@@ -41,23 +52,34 @@ class Runner:
         self.device_cache_dict = dict()
         for d in self.device_cache:
             self.device_cache_dict[d] = d
+        self.device_index = DeviceIndex(self.device_cache)
+        self.device_namespace = DeviceNamespace(self.device_cache)
 
         print("loading the fsm cache...")
-        with open(self.path_fsm_cache, "rb") as f:
-            original_fsm_cache = pickle.load(f)
+        if not os.path.exists(self.path_fsm_bin) or os.path.getmtime(self.path_fsm_bin) < os.path.getmtime(
+            self.path_fsm_cache
+        ):
+            print("converting", self.path_fsm_cache, "to", self.path_fsm_bin)
+            # runs started together may convert at the same time, and others may have the old file mmap-ed, so each
+            # one writes its own copy and moves it into place whole
+            path_tmp = "{}.{}.tmp".format(self.path_fsm_bin, os.getpid())
+            with open(self.path_fsm_cache, "rb") as f:
+                FsmCache.write(path_tmp, pickle.load(f).items())
+            os.replace(path_tmp, self.path_fsm_bin)
+        original_fsm_cache = FsmCache(self.path_fsm_bin)
 
         if len(original_fsm_cache) == 0:
             print("empty cache:", self.path_fsm_cache)
             assert 0
 
-        self.fsm_cache = dict()
-        hit_count = 0
+        # the fsms are only decoded when they are first used
+        kept = []
         for reg in original_fsm_cache:
             if random.randint(1, 100) > cache_hit_rate * 100:
                 continue
-            self.fsm_cache[reg] = original_fsm_cache[reg]
-            hit_count += 1
-        print("cache hit rate = ", hit_count / len(original_fsm_cache))
+            kept.append(reg)
+        self.fsm_cache = original_fsm_cache.subset(kept)
+        print("cache hit rate = ", len(kept) / len(original_fsm_cache))
 
         print("generating the regex to device list cache...")
         self.get_reg2dev_map()
@@ -152,18 +174,44 @@ class Runner:
             # return list(matched_dcs)
 
         self.reg2dc_map = dict()
+        self.fp2dc_map = dict()
         for reg in self.reg2dev_map:
             self.reg2dc_map[reg] = get_dcs_synthetic(reg)
+            self.fp2dc_map[self.fsm_cache.fingerprint(reg)] = self.reg2dc_map[reg]
 
     def get_reg2dev_map(self):
+        """Map the regexes, and the fingerprints of their fsms for the objs split off by the regextree, to devices"""
         self.reg2dev_map = dict()
+        self.fp2dev_map = dict()
+        # a cache built for another devices.txt lists devices which are gone, or misses new ones
+        (version, digest) = read_header(self.path_reg2dev)
+        if version is not None:
+            devices_digest = hashlib.sha1(open(self.path_device_database, "rb").read()).hexdigest()
+            if version != CACHE_VERSION or digest != devices_digest:
+                raise Exception(
+                    "{} is stale for {}, rebuild it with python -m tools.build_cache".format(
+                        self.path_reg2dev, self.path_device_database
+                    )
+                )
         rows = open(self.path_reg2dev, "r").read().splitlines()
         for r in rows:
+            # the header line of tools/build_cache.py
+            if r.startswith("#"):
+                continue
             reg, dev = r.split("&")
             reg = reg.strip()
             dev = dev.strip()
             if reg in self.fsm_cache:
                 self.reg2dev_map[reg] = ast.literal_eval(dev)
+                self.fp2dev_map[self.fsm_cache.fingerprint(reg)] = self.reg2dev_map[reg]
+                # caches from before the header have no digest to check
+                for d in self.reg2dev_map[reg]:
+                    if d not in self.device_cache_dict:
+                        raise Exception(
+                            "{} maps {} to {}, which is not in {}, rebuild it with python -m tools.build_cache".format(
+                                self.path_reg2dev, reg, d, self.path_device_database
+                            )
+                        )
 
     def get_worklod(self):
         wf_list = []
@@ -291,6 +339,7 @@ class Runner:
             + "running: %d    " % (len(self.scheduler.wf_list_running))
             + "pending: %d\n" % (len(self.scheduler.wf_list_pending))
         )
+        print("fsm op cache: {} hits, {} misses".format(RegexTool.op_cache_hits, RegexTool.op_cache_misses))
         sys.stdout.flush()
         expected = "\n".join(scheduler.records)
         with open(self.output_file_path + ".log", "w") as output_file:
@@ -340,9 +389,15 @@ class TestRunner:
         self.ev_queue = ev_queue
         self.fsm_cache = dict()
         self.reg2dev_map = dict()
+        self.fp2dev_map = dict()
+        self.fp2dc_map = dict()
         self.device_cache = list()
         self.device_cache_dict = dict()
+        self.device_index = DeviceIndex(self.device_cache)
+        self.device_namespace = DeviceNamespace(self.device_cache)
         self.use_regextree_dev_opt = False
+        self.use_regextree_dev_bitmap = False
+        self.use_regextree_dev_signature = False
 
     def set_scheduler(self, scheduler):
         self.scheduler: Scheduler = scheduler
@@ -7,6 +7,7 @@ from tools.util import *
 from regex.greenery.fsm import fsm
 
 if TYPE_CHECKING:
+    from typing import Dict
     from scheduler.workflow import Workflow
     from regex.regextree import RegexTreeRegex, TreeObjRegex
 
@@ -25,6 +26,10 @@ def check_workflow(wf_list: List[Workflow]):
         if wf._status == Status.PENDING and not wf._iexlock and not wf._ishlock and (wf._exlock or wf._shlock):
             raise Exception("Only wfs that that has not got all locks can pend.")
 
+        # the count of requests is consistent to the request lists
+        if wf._num_requests != len(wf._iexlock) + len(wf._ishlock):
+            raise Exception("The number of requests is inconsistent.")
+
         # wf lock is consistent to the obj lock
         for obj in wf._ishlock:
             if wf not in obj._ishlock:
@@ -64,9 +69,13 @@ def check_workflow(wf_list: List[Workflow]):
 
 def check_regextree(objtree: RegexTreeRegex):
     all_objs = objtree.get_all_children(objtree._root)
+    check_parents(objtree._root)
+    check_lock_counts(objtree, objtree._root)
     for obj in all_objs:
         check_single_node(obj)
         check_containment(objtree, obj)
+        check_parents(obj)
+        check_lock_counts(objtree, obj)
 
 
 def check_single_node(obj: TreeObjRegex):
@@ -108,6 +117,31 @@ def check_single_node(obj: TreeObjRegex):
         raise Exception("There are duplicate wfs getting read and writing locks.")
 
 
+def check_parents(obj: TreeObjRegex):
+    # the counts are added up along the parents, so each child has to point back to the obj
+    for child in obj.get_children():
+        if child._parent is not obj or child._depth != obj._depth + 1:
+            raise Exception("The parent of the obj is inconsistent.")
+
+
+def check_lock_counts(objtree: RegexTreeRegex, obj: TreeObjRegex):
+    # the obj and lock counts of the subtree are the same as counting them again
+    sub_objs = [obj] + objtree.get_all_children(obj)
+    if len(sub_objs) != obj._num_sub_objs:
+        raise Exception("The obj count of the subtree is inconsistent.")
+    shlock: Dict[Workflow, int] = {}
+    exlock: Dict[Workflow, int] = {}
+    for co in sub_objs:
+        for wf in co._shlock:
+            shlock[wf] = shlock.get(wf, 0) + 1
+        for wf in co._exlock:
+            exlock[wf] = exlock.get(wf, 0) + 1
+    if shlock != obj._sub_shlock or exlock != obj._sub_exlock:
+        raise Exception("The lock counts of the subtree are inconsistent.")
+    if sum(shlock.values()) != obj._num_sub_shlock or sum(exlock.values()) != obj._num_sub_exlock:
+        raise Exception("The lock counts of the subtree are inconsistent.")
+
+
 def check_containment(objtree: RegexTreeRegex, obj: TreeObjRegex):
     if not obj._exlock and not obj._shlock:
         return
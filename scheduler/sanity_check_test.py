@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest scheduler`")
+
+import pytest
+from regex.regextree import TreeObjRegex
+from scheduler.occamscheduler import OccamFIFOScheduler
+from scheduler.runner import TestRunner as Runner
+from scheduler.sanity_check import check_regextree
+from scheduler.workflow import Workflow, WfObj
+from tools.util import AccType
+
+
+@pytest.fixture
+def objtree():
+    runner = Runner([])
+    runner.set_scheduler(OccamFIFOScheduler(using_trace=False))
+    objtree = runner.scheduler.objtree
+    for (i, regex) in enumerate(["tor[1-2]pod1dc1", "tor[2-3]pod1dc1", "(tor|agg)[1-3]pod1dc1", "agg1pod[1-2]dc2"]):
+        wf = Workflow("wf{}".format(i))
+        wf.add_obj(WfObj(regex, 1, AccType.WRITE if i % 2 else AccType.READ))
+        wf._cur_obj = 0
+        objtree.insert(objtree._root, TreeObjRegex(regex, False, runner), wf)
+        # grant what nobody else holds in the containment, as schedule() would
+        for obj in list(wf._iexlock + wf._ishlock):
+            if not any(co._exlock or co._shlock for co in objtree.get_containment(objtree._root, obj, proper=False)):
+                if obj in wf._iexlock:
+                    obj._iexlock.remove(wf)
+                    wf.del_iexlock(obj)
+                    obj.add_exlock(wf)
+                    wf._exlock.append(obj)
+                else:
+                    obj._ishlock.remove(wf)
+                    wf.del_ishlock(obj)
+                    obj.add_shlock(wf)
+                    wf._shlock.append(obj)
+    return objtree
+
+
+def locked(objtree):
+    return [obj for obj in objtree.get_all_children(objtree._root) if obj._exlock or obj._shlock]
+
+
+def test_consistent(objtree):
+    assert objtree._root._num_sub_objs > 3
+    assert objtree._root._num_sub_exlock and objtree._root._num_sub_shlock
+    check_regextree(objtree)
+
+
+def test_lock_count_drift(objtree):
+    obj = locked(objtree)[-1]
+    wf = (obj._exlock + obj._shlock)[0]
+    obj._parent._count_subtree(0, {}, {wf: 1}, 1)
+    with pytest.raises(Exception, match="lock counts"):
+        check_regextree(objtree)
+
+
+def test_lock_count_drift_at_root(objtree):
+    objtree._root._num_sub_shlock += 1
+    with pytest.raises(Exception, match="lock counts"):
+        check_regextree(objtree)
+
+
+def test_obj_count_drift(objtree):
+    objtree.get_all_children(objtree._root)[-1]._num_sub_objs += 1
+    with pytest.raises(Exception, match="obj count"):
+        check_regextree(objtree)
+
+
+def test_parent_drift(objtree):
+    obj = objtree.get_all_children(objtree._root)[-1]
+    obj._parent = objtree._root if obj._parent is not objtree._root else None
+    with pytest.raises(Exception, match="parent"):
+        check_regextree(objtree)
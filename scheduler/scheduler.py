@@ -2,6 +2,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, Tuple
 
 from typing import List, Tuple
+from heapq import heappush, heappop
 from abc import ABCMeta, abstractmethod
 
 from regex.regextree import RegexTreeRegex
@@ -22,6 +23,10 @@ class Scheduler:
         self.wf_list_running: List[Workflow] = []
         self.wf_list_pending: List[Workflow] = []
         self.wf_list_complete: List[Workflow] = []
+        # the pending wfs which got all their locks, by their place in wf_list_pending. Entries of wfs which are no
+        # longer pending there or asked for more locks since are skipped.
+        self.ready_wfs: List[Tuple[int, Workflow]] = []
+        self._pending_seq = 0
         # The log of the scheduling. Can use it for testing and drawing figures
         self.records: List[str] = []
         self.pending_q_len: List[Tuple[float, int]] = []
@@ -29,6 +34,8 @@ class Scheduler:
         self.using_trace = using_trace
         self.enable_sanity_check = False
         self.lock_delay = 10  # us
+        # how deadlockrollback() picks the wf to rollback, one of VICTIM_POLICIES
+        self.deadlock_victim = "fewest_locks"
 
     @abstractmethod
     def handle_EvWfArrival(
@@ -50,6 +57,31 @@ class Scheduler:
     def handle_EvObjEnd(self, ev_queue: list, ev_id: int, ev_time: float, event: EvObjEnd, task_to_metadata: dict):
         pass
 
+    def add_pending(self, wf: Workflow):
+        """Append wf to wf_list_pending, it goes onto ready_wfs once it got all its locks"""
+        self.wf_list_pending.append(wf)
+        wf._pending_seq = self._pending_seq
+        wf._ready_queue = self.ready_wfs
+        self._pending_seq += 1
+        if wf.runnable():
+            heappush(self.ready_wfs, (wf._pending_seq, wf))
+
+    def pop_ready(self) -> List[Workflow]:
+        """Move the pending wfs which got all their locks to wf_list_running, in the order of wf_list_pending"""
+        ready = []
+        while self.ready_wfs:
+            (seq, wf) = heappop(self.ready_wfs)
+            if seq == wf._pending_seq and wf.runnable():
+                wf._pending_seq = -1
+                wf._ready_queue = None
+                wf._status = Status.RUNNING
+                ready.append(wf)
+        if ready:
+            started = set(ready)
+            self.wf_list_pending = [wf for wf in self.wf_list_pending if wf not in started]
+            self.wf_list_running += ready
+        return ready
+
     def set_runner(self, runner: Runner):
         self.runner = runner
         self.objtree: RegexTreeRegex = RegexTreeRegex(self.using_trace, runner)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest scheduler`")
+
+import pytest
+from scheduler.scheduler import Scheduler
+from scheduler.workflow import Status, Workflow
+
+
+@pytest.fixture
+def scheduler():
+    return Scheduler(using_trace=False)
+
+
+def pending(scheduler, name: str, *objs) -> Workflow:
+    """Add a pending wf which asks for an exlock on each of objs"""
+    wf = Workflow(name)
+    for obj in objs:
+        wf.add_iexlock(obj)
+    scheduler.add_pending(wf)
+    return wf
+
+
+def names(wfs):
+    return [wf._name for wf in wfs]
+
+
+def test_pop_ready_order(scheduler):
+    a = pending(scheduler, "a", "o1")
+    b = pending(scheduler, "b", "o1", "o2")
+    c = pending(scheduler, "c")
+    d = pending(scheduler, "d", "o3")
+    assert names(scheduler.pop_ready()) == ["c"]
+    assert c._status == Status.RUNNING
+
+    # granted the other way round, started in the order they are pending
+    d.del_iexlock("o3")
+    b.del_iexlock("o1")
+    a.del_iexlock("o1")
+    assert names(scheduler.pop_ready()) == ["a", "d"]
+    assert names(scheduler.wf_list_pending) == ["b"]
+    b.del_iexlock("o2")
+    assert names(scheduler.pop_ready()) == ["b"]
+    assert names(scheduler.wf_list_running) == ["c", "a", "d", "b"]
+    assert scheduler.pop_ready() == []
+
+
+def test_rollback_ready_wf(scheduler):
+    a = pending(scheduler, "a", "o1")
+    b = pending(scheduler, "b", "o2")
+    c = pending(scheduler, "c", "o3")
+    b.del_iexlock("o2")
+    assert scheduler.ready_wfs
+
+    # b is rolled back while it is on the ready queue, as deadlockrollback() does, then arrives again
+    b.reset()
+    scheduler.wf_list_pending.remove(b)
+    b.add_iexlock("o2")
+    scheduler.add_pending(b)
+    assert names(scheduler.wf_list_pending) == ["a", "c", "b"]
+    assert scheduler.pop_ready() == []
+
+    c.del_iexlock("o3")
+    b.del_iexlock("o2")
+    a.del_iexlock("o1")
+    assert names(scheduler.pop_ready()) == ["a", "c", "b"]
+    assert names(scheduler.wf_list_running) == ["a", "c", "b"]
+    assert scheduler.wf_list_pending == []
+    assert scheduler.pop_ready() == []
+
+
+def test_rollback_ready_wf_readded_ready(scheduler):
+    a = pending(scheduler, "a", "o1")
+    b = pending(scheduler, "b")
+
+    # b arrives again with nothing to ask for, so it is ready at once and has two entries on the ready queue
+    b.reset()
+    scheduler.wf_list_pending.remove(b)
+    scheduler.add_pending(b)
+    a.del_iexlock("o1")
+    assert names(scheduler.pop_ready()) == ["a", "b"]
+    assert names(scheduler.wf_list_running) == ["a", "b"]
+    assert scheduler.ready_wfs == []
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from .deadlock import DeadlockException
+
+if TYPE_CHECKING:
+    from typing import Callable, Dict, Hashable, Iterable, List, Set
+    from .workflow import Workflow
+
+
+def num_wfs(wfs: int) -> int:
+    """Return the number of wfs in a bitmap of wf ids"""
+    return bin(wfs).count("1")
+
+
+class WaitForGraph:
+    """
+    Who waits for whom: an edge goes from a wf to every other wf asking for a lock which the wf holds, and the
+    dependent set of a wf is everything reachable from it. Every wf has an int id while it is in the graph and a
+    set of wfs is a bitmap of ids, so a dependent set is the or of the dependent sets of the waiters.
+
+    The graph is kept across schedule() calls instead of being rebuilt for every contended obj. Locks are grouped
+    into scopes, a netobj or a subtree under the root of the regextree, such that who waits for a lock only depends
+    on its own scope. The edges out of a wf are read from the scopes of its locks once, and read again after touch()
+    marks one of those scopes as changed, and a dependent set is kept until the edges out of a wf in it change.
+    Working out the dependent sets finds the cycles among the wfs on the way, the deadlocks.
+    """
+
+    def __init__(
+        self,
+        get_waiting_wfs: Callable[[Workflow], Dict[Hashable, List[Workflow]]],
+        get_holding_wfs: Callable[[Hashable], Iterable[Workflow]],
+    ):
+        # the wfs waiting for the locks of a wf, per scope of the locks, and the wfs holding locks in a scope
+        self._get_waiting_wfs = get_waiting_wfs
+        self._get_holding_wfs = get_holding_wfs
+        self._ids: Dict[Workflow, int] = dict()
+        self._wfs: List[Workflow] = []
+        self._free_ids: List[int] = []
+        # the edges read so far, as bitmaps of the waiters, the scopes they were read from and the wfs read from each
+        self._edges: Dict[int, int] = dict()
+        self._scopes_of: Dict[int, List[Hashable]] = dict()
+        self._readers: Dict[Hashable, Set[int]] = dict()
+        self._dirty_scopes: Set[Hashable] = set()
+        self._dep_wfs: Dict[int, int] = dict()
+
+    def get_id(self, wf: Workflow) -> int:
+        if wf not in self._ids:
+            if self._free_ids:
+                self._ids[wf] = self._free_ids.pop()
+                self._wfs[self._ids[wf]] = wf
+            else:
+                self._ids[wf] = len(self._wfs)
+                self._wfs.append(wf)
+        return self._ids[wf]
+
+    def touch(self, scope: Hashable):
+        """Note that the locks or the requests in scope changed"""
+        # nothing is read yet, so nothing can be out of date
+        if self._edges:
+            self._dirty_scopes.add(scope)
+
+    def remove(self, wf: Workflow):
+        """Take wf out of the graph, once it holds and asks for no more locks, and free its id"""
+        if wf not in self._ids:
+            return
+        i = self._ids.pop(wf)
+        self._forget({i})
+        mask = ~(1 << i)
+        for (j, waiters) in self._edges.items():
+            self._edges[j] = waiters & mask
+        self._free_ids.append(i)
+
+    def get_dependent_wfs(self, wf: Workflow) -> int:
+        """
+        Return the bitmap of the wfs depending on wf, wf included. Raise a DeadlockException with the wfs waiting
+        for each other if some of them are in a cycle.
+        """
+        self._refresh()
+        start = self.get_id(wf)
+        if start not in self._dep_wfs:
+            cycle = self._visit(start)
+            if cycle:
+                raise DeadlockException([self._wfs[i] for i in cycle])
+        return self._dep_wfs[start]
+
+    def find_cycle(self, wfs: List[Workflow]) -> List[Workflow]:
+        """Return the first wfs found waiting for each other in a cycle, going from each of wfs in turn, or []"""
+        self._refresh()
+        for wf in wfs:
+            start = self.get_id(wf)
+            if start not in self._dep_wfs:
+                cycle = self._visit(start)
+                if cycle:
+                    return [self._wfs[i] for i in cycle]
+        return []
+
+    def _visit(self, start: int) -> List[int]:
+        """
+        Work out the dependent sets of start and of the wfs it reaches with Tarjan's algorithm, without recursion.
+        The strongly connected components come out in reverse topological order, which is the order the dependent
+        sets need, and the wfs whose sets are known already are not gone into. So this takes one pass over the
+        edges not seen since the last change at most. Return the ids of the first component of more than one wf,
+        which wait for each other in a cycle, or [].
+        """
+        index = {start: 0}
+        low = {start: 0}
+        # the wfs of the components not done yet, also as a bitmap
+        component = [start]
+        in_component = 1 << start
+        stack = [(start, self._get_edges(start))]
+        while stack:
+            (i, todo) = stack[-1]
+            if todo:
+                bit = todo & -todo
+                stack[-1] = (i, todo ^ bit)
+                j = bit.bit_length() - 1
+                if j in self._dep_wfs:
+                    continue
+                if j not in index:
+                    index[j] = low[j] = len(index)
+                    component.append(j)
+                    in_component |= bit
+                    stack.append((j, self._get_edges(j)))
+                elif in_component & bit:
+                    low[i] = min(low[i], index[j])
+                continue
+
+            stack.pop()
+            if stack:
+                parent = stack[-1][0]
+                low[parent] = min(low[parent], low[i])
+            if low[i] != index[i]:
+                continue
+            if component[-1] != i:
+                return component[component.index(i) :]
+            # a component of its own, all its waiters are done
+            component.pop()
+            in_component ^= 1 << i
+            dep_wfs = 1 << i
+            waiters = self._edges[i]
+            while waiters:
+                bit = waiters & -waiters
+                waiters ^= bit
+                dep_wfs |= self._dep_wfs[bit.bit_length() - 1]
+            self._dep_wfs[i] = dep_wfs
+        return []
+
+    def _get_edges(self, i: int) -> int:
+        if i not in self._edges:
+            waiting = self._get_waiting_wfs(self._wfs[i])
+            waiters = 0
+            for (scope, wfs) in waiting.items():
+                self._readers.setdefault(scope, set()).add(i)
+                for wf in wfs:
+                    waiters |= 1 << self.get_id(wf)
+            self._edges[i] = waiters & ~(1 << i)
+            self._scopes_of[i] = list(waiting)
+        return self._edges[i]
+
+    def _refresh(self):
+        """Forget the edges out of the wfs which held or now hold locks in a touched scope"""
+        if not self._dirty_scopes:
+            return
+        stale = set()
+        for scope in self._dirty_scopes:
+            stale.update(self._readers.get(scope, ()))
+            stale.update(self._ids[wf] for wf in self._get_holding_wfs(scope) if wf in self._ids)
+        self._dirty_scopes = set()
+        self._forget(stale)
+
+    def _forget(self, ids: Set[int]):
+        """Forget the edges out of the wfs and the dependent sets which have any of them"""
+        mask = 0
+        for i in ids:
+            mask |= 1 << i
+            if i not in self._edges:
+                continue
+            del self._edges[i]
+            for scope in self._scopes_of.pop(i):
+                readers = self._readers[scope]
+                readers.discard(i)
+                if not readers:
+                    del self._readers[scope]
+        if mask:
+            self._dep_wfs = dict((i, dep_wfs) for (i, dep_wfs) in self._dep_wfs.items() if not dep_wfs & mask)
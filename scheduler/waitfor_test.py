@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest scheduler`")
+
+import pytest
+from scheduler.deadlock import DeadlockException
+from scheduler.waitfor import WaitForGraph, num_wfs
+
+
+class Wf:
+    def __init__(self, name):
+        self._name = name
+
+    def __repr__(self):
+        return self._name
+
+
+class Locks:
+    """Who holds a lock in each scope, and who waits for it"""
+
+    def __init__(self):
+        self.held = dict()
+
+    def wait(self, scope, holder, waiter):
+        self.held.setdefault(scope, dict()).setdefault(holder, []).append(waiter)
+
+    def hold(self, scope, holder):
+        self.held.setdefault(scope, dict()).setdefault(holder, [])
+
+    def release(self, wf):
+        for holders in self.held.values():
+            holders.pop(wf, None)
+            for waiters in holders.values():
+                while wf in waiters:
+                    waiters.remove(wf)
+
+    def get_waiting_wfs(self, wf):
+        return dict((scope, holders[wf]) for (scope, holders) in self.held.items() if wf in holders)
+
+    def get_holding_wfs(self, scope):
+        return list(self.held.get(scope, ()))
+
+
+@pytest.fixture
+def locks():
+    return Locks()
+
+
+@pytest.fixture
+def graph(locks):
+    return WaitForGraph(locks.get_waiting_wfs, locks.get_holding_wfs)
+
+
+def bits(graph, *wfs):
+    return sum(1 << graph.get_id(wf) for wf in wfs)
+
+
+def test_chain(locks, graph):
+    (a, b, c) = (Wf("a"), Wf("b"), Wf("c"))
+    locks.wait("s1", a, b)
+    locks.wait("s2", b, c)
+    assert graph.get_dependent_wfs(a) == bits(graph, a, b, c)
+    assert graph.get_dependent_wfs(b) == bits(graph, b, c)
+    assert graph.get_dependent_wfs(c) == bits(graph, c)
+    assert num_wfs(graph.get_dependent_wfs(a)) == 3
+    assert graph.find_cycle([a, b, c]) == []
+
+
+def test_shared_waiter(locks, graph):
+    # a diamond is not a cycle
+    (a, b, c, d) = (Wf("a"), Wf("b"), Wf("c"), Wf("d"))
+    locks.wait("s1", a, b)
+    locks.wait("s1", a, c)
+    locks.wait("s2", b, d)
+    locks.wait("s3", c, d)
+    assert graph.get_dependent_wfs(a) == bits(graph, a, b, c, d)
+    assert graph.find_cycle([a]) == []
+
+
+def test_two_cycle(locks, graph):
+    (a, b, c) = (Wf("a"), Wf("b"), Wf("c"))
+    locks.wait("s1", a, b)
+    locks.wait("s2", b, a)
+    locks.wait("s3", c, a)
+    with pytest.raises(DeadlockException) as e:
+        graph.get_dependent_wfs(a)
+    assert set(e.value._wfs) == {a, b}
+    # going in from outside the cycle finds it too
+    assert set(graph.find_cycle([c])) == {a, b}
+    with pytest.raises(DeadlockException):
+        graph.get_dependent_wfs(c)
+
+
+def test_three_cycle(locks, graph):
+    (a, b, c, d) = (Wf("a"), Wf("b"), Wf("c"), Wf("d"))
+    locks.wait("s1", a, b)
+    locks.wait("s2", b, c)
+    locks.wait("s3", c, a)
+    locks.wait("s3", c, d)
+    # d hangs off the cycle without being in it
+    assert graph.get_dependent_wfs(d) == bits(graph, d)
+    assert graph.find_cycle([d]) == []
+    assert set(graph.find_cycle([d, b])) == {a, b, c}
+    with pytest.raises(DeadlockException) as e:
+        graph.get_dependent_wfs(c)
+    assert set(e.value._wfs) == {a, b, c}
+    # breaking the cycle lets the rest be worked out
+    locks.release(a)
+    graph.remove(a)
+    assert graph.find_cycle([b, c, d]) == []
+    assert graph.get_dependent_wfs(b) == bits(graph, b, c, d)
+
+
+def test_remove_reuses_ids(locks, graph):
+    (a, b, c) = (Wf("a"), Wf("b"), Wf("c"))
+    locks.wait("s1", a, b)
+    locks.wait("s2", b, c)
+    assert graph.get_dependent_wfs(a) == bits(graph, a, b, c)
+    old_id = graph.get_id(b)
+
+    locks.release(b)
+    graph.remove(b)
+    graph.remove(b)
+    # the edges out of a and the dependent set of a lose b without a touch
+    assert graph.get_dependent_wfs(a) == bits(graph, a)
+    assert graph.get_dependent_wfs(c) == bits(graph, c)
+
+    # a new wf gets b's id, but none of its edges
+    d = Wf("d")
+    assert graph.get_id(d) == old_id
+    assert graph.get_dependent_wfs(d) == bits(graph, d)
+    locks.wait("s1", a, d)
+    graph.touch("s1")
+    assert graph.get_dependent_wfs(a) == bits(graph, a, d)
+
+
+def test_touch_forgets_dependent_sets(locks, graph):
+    (x, a, b, c, e) = (Wf("x"), Wf("a"), Wf("b"), Wf("c"), Wf("e"))
+    locks.wait("s0", x, a)
+    locks.wait("s1", a, b)
+    assert graph.get_dependent_wfs(x) == bits(graph, x, a, b)
+
+    # the edges are kept until the scope is touched
+    locks.wait("s1", a, c)
+    assert graph.get_dependent_wfs(x) == bits(graph, x, a, b)
+    graph.touch("s1")
+    assert graph.get_dependent_wfs(a) == bits(graph, a, b, c)
+    assert graph.get_dependent_wfs(x) == bits(graph, x, a, b, c)
+
+    # b starts holding a lock in a scope nobody read from yet
+    locks.wait("s2", b, e)
+    graph.touch("s2")
+    assert graph.get_dependent_wfs(x) == bits(graph, x, a, b, c, e)
+
+    # touching an unrelated scope keeps everything
+    graph.touch("s9")
+    assert graph.get_dependent_wfs(x) == bits(graph, x, a, b, c, e)
+
+
+def test_touch_makes_cycles(locks, graph):
+    (a, b) = (Wf("a"), Wf("b"))
+    locks.wait("s1", a, b)
+    assert graph.get_dependent_wfs(a) == bits(graph, a, b)
+    locks.wait("s2", b, a)
+    graph.touch("s2")
+    assert set(graph.find_cycle([a])) == {a, b}
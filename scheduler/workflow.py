@@ -1,6 +1,7 @@
 import random
+from heapq import heappush
 from tools.util import gen_regex, AccType, Status
-from typing import List, Set
+from typing import List, Optional, Set, Tuple
 
 
 class WfObj:
@@ -21,9 +22,14 @@ class Workflow:
         self._shlock: List[TreeObjRegex] = []
         self._ishlock: List[TreeObjRegex] = []
         self._iexlock: List[TreeObjRegex] = []
-        self._dep_wfs: Set[Workflow] = set()
-        self._dp_valid: bool = False
+        # the ids of the wfs depending on it as a bitmap, see WaitForGraph
+        self._dep_wfs: int = 0
         self._status = Status.PENDING
+        # the ishlocks and iexlocks not granted yet, kept by the methods below. While the wf is pending, it goes
+        # onto the ready queue of the scheduler with its place in wf_list_pending once there are none left.
+        self._num_requests = 0
+        self._ready_queue: Optional[List[Tuple[int, Workflow]]] = None
+        self._pending_seq = -1
 
     def reset(self):
         self._cur_obj = -1
@@ -31,15 +37,40 @@ class Workflow:
         self._shlock: List[TreeObjRegex] = []
         self._ishlock: List[TreeObjRegex] = []
         self._iexlock: List[TreeObjRegex] = []
-        self._dep_wfs: Set[Workflow] = set()
+        self._dep_wfs: int = 0
         self._status = Status.PENDING
-        self._dp_valid: bool = False
+        self._num_requests = 0
+        self._ready_queue = None
+        self._pending_seq = -1
 
     def get_cur_obj(self) -> WfObj:
         return self._objs[self._cur_obj]
 
     def runnable(self) -> bool:
-        return len(self._ishlock) == 0 and len(self._iexlock) == 0
+        return self._num_requests == 0
+
+    def add_ishlock(self, obj):
+        self._ishlock.append(obj)
+        self._num_requests += 1
+
+    def add_iexlock(self, obj):
+        self._iexlock.append(obj)
+        self._num_requests += 1
+
+    def del_ishlock(self, obj):
+        """Take away the ishlock on obj, it was granted, rolled back or is held already"""
+        self._ishlock.remove(obj)
+        self._del_request()
+
+    def del_iexlock(self, obj):
+        """Take away the iexlock on obj, it was granted, rolled back or is held already"""
+        self._iexlock.remove(obj)
+        self._del_request()
+
+    def _del_request(self):
+        self._num_requests -= 1
+        if self._num_requests == 0 and self._ready_queue is not None:
+            heappush(self._ready_queue, (self._pending_seq, self))
 
     def is_last_obj(self) -> bool:
         return self._cur_obj == len(self._objs) - 1
@@ -0,0 +1,176 @@
+"""
+Build the caches the Runner loads from a workload folder: reg2fsm.pkl, the fsm of every regex in the traces, with
+its mmap-able copy reg2fsm.bin, and regex_device_map.long, the devices every regex matches.
+
+Run from the repo root, e.g. `python -m tools.build_cache -f wait_time`. Only the regexes missing from the existing
+caches are compiled, so rerunning it after adding a trace is cheap. The device lists are all recomputed when
+devices.txt changes, and everything is rebuilt when the cache version below changes.
+"""
+import argparse
+import ast
+import glob
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+
+from regex.regextool import RegexTool
+from tools.deviceindex import DeviceIndex
+from tools.fsmcache import FsmCache
+
+# bump when the fsms or the device lists would come out differently for the same regexes and devices
+CACHE_VERSION = 1
+HEADER = "# occam cache v{} devices={}"
+
+device_index = None
+
+
+def _configure() -> argparse.Namespace:
+    """Sets up arg parser"""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-f",
+        dest="folder",
+        required=False,
+        default="wait_time",
+        help="The folder under workload to build the caches for",
+    )
+    parser.add_argument(
+        "-w",
+        dest="workloads",
+        nargs="*",
+        default=None,
+        help="The trace files to take the regexes from, default is every workload_*.txt in the folder",
+    )
+    parser.add_argument(
+        "-p",
+        dest="processes",
+        default=os.cpu_count(),
+        type=int,
+        help="The number of worker processes",
+    )
+    parser.add_argument(
+        "-r",
+        dest="rebuild",
+        action="store_true",
+        help="Ignore the existing caches and build them from scratch",
+    )
+
+    return parser.parse_args()
+
+
+def read_regexes(paths: list) -> list:
+    """Return the distinct regexes of the traces, in the order they first appear."""
+    regexes = dict()
+    for path in paths:
+        for line in open(path, "r").read().splitlines():
+            if line.strip():
+                regexes[line.split()[3]] = None
+    return list(regexes)
+
+
+def read_header(path: str) -> tuple:
+    """
+    Return the cache version and the digest of devices.txt path was built with, or (None, None) if it is missing
+    or from before the caches had versions.
+    """
+    if os.path.exists(path):
+        first = open(path, "r").readline().split()
+        if first[:3] == ["#", "occam", "cache"]:
+            return (int(first[3][1:]), first[4][len("devices=") :])
+    return (None, None)
+
+
+def read_device_map(path: str) -> dict:
+    reg2dev = dict()
+    for r in open(path, "r").read().splitlines():
+        if not r.startswith("#"):
+            reg, dev = r.split("&")
+            reg2dev[reg.strip()] = ast.literal_eval(dev.strip())
+    return reg2dev
+
+
+def _init_worker(devices: list):
+    global device_index
+    device_index = DeviceIndex(devices)
+
+
+def _build(task: tuple) -> tuple:
+    """Return the fsm of the regex, unless the caller already has it, and the devices it matches."""
+    (regex, fsm) = task
+    compiled = fsm is None
+    if compiled:
+        fsm = RegexTool.to_fsm(regex)
+    return (regex, fsm if compiled else None, device_index.match(fsm))
+
+
+def main(args: argparse.Namespace) -> None:
+    """The main program"""
+    folder = os.path.join("workload", args.folder)
+    path_fsm_cache = os.path.join(folder, "reg2fsm.pkl")
+    path_fsm_bin = os.path.join(folder, "reg2fsm.bin")
+    path_reg2dev = os.path.join(folder, "regex_device_map.long")
+    workloads = args.workloads or sorted(glob.glob(os.path.join(folder, "workload_*.txt")))
+
+    devices_text = open(os.path.join(folder, "devices.txt"), "rb").read()
+    devices = devices_text.decode().splitlines()
+    devices_digest = hashlib.sha1(devices_text).hexdigest()
+
+    regexes = read_regexes(workloads)
+    (reg2fsm, reg2dev) = (dict(), dict())
+    (version, digest) = (0, None) if args.rebuild else read_header(path_reg2dev)
+    # the fsms only depend on the regexes, so unversioned ones are kept too
+    if version in (None, CACHE_VERSION) and os.path.exists(path_fsm_cache):
+        with open(path_fsm_cache, "rb") as f:
+            reg2fsm = pickle.load(f)
+    if version == CACHE_VERSION and digest == devices_digest:
+        reg2dev = read_device_map(path_reg2dev)
+
+    # regexes of traces which are gone stay cached, a later trace may bring them back
+    known = set(regexes)
+    order = regexes + [reg for reg in reg2fsm if reg not in known]
+    tasks = [(reg, reg2fsm.get(reg)) for reg in order if reg not in reg2fsm or reg not in reg2dev]
+    print(
+        "{}: {} regexes in {} traces, {} to build on {} processes".format(
+            args.folder, len(regexes), len(workloads), len(tasks), args.processes
+        )
+    )
+
+    start = time.time()
+    if tasks:
+        with multiprocessing.Pool(args.processes, _init_worker, (devices,)) as pool:
+            for (i, (reg, fsm, matched)) in enumerate(pool.imap_unordered(_build, tasks, chunksize=16)):
+                if fsm is not None:
+                    reg2fsm[reg] = fsm
+                reg2dev[reg] = matched
+                if (i + 1) % 500 == 0:
+                    print("    {}/{} in {:.1f} s".format(i + 1, len(tasks), time.time() - start))
+
+    _write(path_fsm_cache, "wb", lambda f: pickle.dump(dict((reg, reg2fsm[reg]) for reg in order), f))
+    FsmCache.write(path_fsm_bin + ".tmp", ((reg, reg2fsm[reg]) for reg in order))
+    os.replace(path_fsm_bin + ".tmp", path_fsm_bin)
+    _write(
+        path_reg2dev,
+        "w",
+        lambda f: f.write(
+            "\n".join(
+                [HEADER.format(CACHE_VERSION, devices_digest)]
+                + ["{} & {}".format(reg, reg2dev[reg]) for reg in order if reg in reg2dev]
+            )
+            + "\n"
+        ),
+    )
+    print("built {} regexes in {:.1f} s".format(len(tasks), time.time() - start))
+
+
+def _write(path: str, mode: str, dump):
+    """Replace path only once the new content is complete, so an interrupted build keeps the old cache."""
+    with open(path + ".tmp", mode) as f:
+        dump(f)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    main(_configure())
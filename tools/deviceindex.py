@@ -0,0 +1,92 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import List, Tuple
+    from regex.greenery.fsm import fsm
+
+
+class DeviceIndex:
+    """
+    A radix tree of the device names. Each node holds the characters its names share beyond its parent and
+    the range of those names in sorted order. Matching a regex walks its fsm down the tree and drops a whole
+    subtree as soon as the fsm falls into oblivion, so the cost is proportional to the prefixes the fsm can
+    follow rather than to the number of devices.
+    """
+
+    def __init__(self, devices: List[str]):
+        self._devices = devices
+        self._order = sorted(range(len(devices)), key=devices.__getitem__)
+        names = [devices[i] for i in self._order]
+        self._rank = dict((name, i) for (i, name) in enumerate(names))
+        self._root = self._build(names, 0, len(names), 0)
+
+    @classmethod
+    def _build(cls, names: List[str], lo: int, hi: int, depth: int) -> Tuple:
+        """Return the node (label, lo, hi, children) of names[lo:hi], which share their first depth characters."""
+        if lo == hi:
+            return ("", lo, hi, ())
+        # names are sorted, so the first and the last ones share the least
+        (first, last) = (names[lo], names[hi - 1])
+        end = depth
+        while end < len(first) and end < len(last) and first[end] == last[end]:
+            end += 1
+        children = []
+        start = lo
+        while start < hi and len(names[start]) == end:
+            start += 1
+        while start < hi:
+            prefix = names[start][: end + 1]
+            stop = bisect_left(names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start, hi)
+            children.append(cls._build(names, start, stop, end))
+            start = stop
+        return (first[depth:end], lo, hi, tuple(children))
+
+    def match(self, fsm: fsm) -> List[str]:
+        """
+        Return the devices, in their original order, which re.match() the regex of fsm, i.e. which start with
+        a string accepted by fsm.
+        """
+        found = []
+        for (lo, hi) in self._walk(fsm):
+            found.extend(self._order[lo:hi])
+        found.sort()
+        return [self._devices[i] for i in found]
+
+    def bitmap(self, devices) -> int:
+        """
+        Return devices as an int whose i-th bit stands for the i-th device in sorted order, or 0 if some of them
+        are not in the index, so that the objs are compared by their fsms.
+        """
+        bits = bytearray(len(self._rank) // 8 + 1)
+        for d in devices:
+            i = self._rank.get(d)
+            if i is None:
+                return 0
+            bits[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(bits, "little")
+
+    def _walk(self, fsm: fsm):
+        """Yield the ranges of sorted names which start with a string accepted by fsm."""
+        t = fsm.table
+        k = len(t.symbols)
+        (columns, other, finals, delta) = (t.columns, t.other, t.finals, t.delta)
+        stack = [(self._root, t.initial)]
+        while stack:
+            ((label, lo, hi, children), state) = stack.pop()
+            for char in label:
+                # re.match() is only anchored at the start, so once the fsm accepts, every name below matches
+                if finals[state]:
+                    break
+                column = columns.get(char, other)
+                state = delta[state * k + column] if column != -1 else -1
+                if state == -1:
+                    break
+            if state == -1:
+                continue
+            if finals[state]:
+                yield (lo, hi)
+                continue
+            for child in children:
+                stack.append((child, state))
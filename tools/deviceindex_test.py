@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest tools`")
+
+import random
+import re
+
+import pytest
+from regex.regextool import RegexTool
+from tools.deviceindex import DeviceIndex
+
+
+@pytest.fixture(scope="module")
+def devices():
+    devices = []
+    for dc in ("_dc0000_1", "_dc0000_2", "_dc0001_1"):
+        for pod in range(10):
+            for role in ("rsw", "fsw"):
+                for n in range(12 if role == "rsw" else 4):
+                    devices.append("{}{:03d}.p{:03d}.f00.{}".format(role, n, pod, dc))
+        for spine in range(3):
+            for n in range(6):
+                devices.append("ssw{:03d}.s{:03d}.f00.{}".format(n, spine, dc))
+    # names outside the scheme, and names which go on after another name ends
+    devices += ["rsw", "rsw000", "rsw000.p000.f00._dc0000_1.mgmt", "console-01", "ssw001.s001"]
+    random.Random(0).shuffle(devices)
+    return devices
+
+
+@pytest.fixture(scope="module")
+def index(devices):
+    return DeviceIndex(devices)
+
+
+def scan(regex, devices):
+    return [d for d in devices if re.match(regex, d)]
+
+
+REGEXES = [
+    # whole names as in the traces
+    "rsw003\\.p004\\.f00\\._dc0000_1",
+    "rsw00[0-3]\\.p00[1-2]\\.f00\\._dc0000_1",
+    "fsw(000|003)\\.p00\\d\\.f00\\._dc0001_1",
+    "rsw0((1[01]|0[2459]))\\.p0{3}\\.f0{2}\\._dc0{4}_2",
+    "s{2}w0{2}[1-4]\\.s0{2}1\\.f0{2}\\._dc0{4}_1",
+    # a leading wildcard
+    ".*\\.p005\\.f00\\._dc0000_2",
+    ".*_1",
+    # a trailing wildcard
+    "rsw00.*_dc0001_1",
+    "fsw.*",
+    # regexes which stop partway through a name
+    "rsw01",
+    "ssw",
+    "fsw00[0-2]\\.p00",
+    "rsw000",
+    "[a-z]+\\d\\d\\d\\.s",
+    "",
+]
+
+
+@pytest.mark.parametrize("regex", REGEXES)
+def test_match(index, devices, regex):
+    assert index.match(RegexTool.to_fsm(regex)) == scan(regex, devices)
+
+
+def test_no_match(index, devices):
+    for regex in ["xsw.*", "rsw0[01]\\.p999", "rsw000\\.p000\\.f00\\._dc0000_1\\.mgmtx"]:
+        assert scan(regex, devices) == []
+        assert index.match(RegexTool.to_fsm(regex)) == []
+
+
+def test_derived(index, devices):
+    fsms = [RegexTool.to_fsm(regex) for regex in REGEXES[:10]]
+    for f1 in fsms:
+        for f2 in fsms[:5]:
+            for derived in (f1 & f2, f1 - f2, f1 | f2):
+                # an empty fsm is written as [], which re does not take
+                expected = [] if derived.empty() else scan(RegexTool.to_regex(derived), devices)
+                assert index.match(derived) == expected
+
+
+def test_bitmap(index, devices):
+    picked = devices[::7]
+    bits = index.bitmap(picked)
+    assert bin(bits).count("1") == len(picked)
+    assert index.bitmap(picked[:3]) & bits == index.bitmap(picked[:3])
+    # a device outside the index gives no bitmap at all
+    assert index.bitmap(picked + ["rsw999.p999.f00._dc9999_9"]) == 0
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, List, Tuple
+
+# role and number, pod (p) or spine (s), fabric and dc, e.g. rsw035.p007.f00._dc0002_2
+DEVICE_NAME = re.compile(r"([a-z]+)\d*\.([a-z]+\d+)\.([a-z]+\d+)\.(_dc\d{4}_\d+)")
+
+
+class DeviceNamespace:
+    """
+    Where each device sits in the naming scheme of devices.txt: its dc, the fabric in the dc, the pod or spine
+    plane in the fabric, and its switch role there. Every level numbers the places it has in a bitmap, and a
+    signature holds, per level, the places a set of devices touches. Two sets of devices with no place in common
+    at some level cannot share a device, which is a couple of integer operations instead of an fsm product.
+    """
+
+    LEVELS = ("dc", "fabric", "pod", "role")
+
+    def __init__(self, devices: List[str]):
+        levels: List[Dict[Tuple, int]] = [dict() for _ in self.LEVELS]
+        places: Dict[Tuple, int] = dict()
+        # the bits at every level of the places at the last level, and the place of each device there
+        self._bits: List[Tuple[int, ...]] = []
+        self._place: Dict[str, int] = dict()
+        for d in devices:
+            path = self.path(d)
+            if path not in places:
+                places[path] = len(self._bits)
+                self._bits.append(
+                    tuple(1 << level.setdefault(path[: i + 1], len(level)) for (i, level) in enumerate(levels))
+                )
+            self._place[d] = places[path]
+
+    @classmethod
+    def path(cls, device: str) -> Tuple[str, ...]:
+        """Return the places of device from the dc down, a name outside of the scheme is a place of its own."""
+        m = DEVICE_NAME.fullmatch(device)
+        if not m:
+            return (device,) * len(cls.LEVELS)
+        (role, pod, fabric, dc) = m.groups()
+        return (dc, fabric, pod, role)
+
+    def signature(self, devices: Iterable[str]) -> Tuple[int, ...]:
+        """
+        Return the places the devices touch at every level, or () if there are no devices or some of them are not
+        in devices.txt, so that the objs are compared by their fsms.
+        """
+        places = set(map(self._place.get, devices))
+        if None in places:
+            return ()
+        (dc, fabric, pod, role) = (0, 0, 0, 0)
+        for place in places:
+            bits = self._bits[place]
+            dc |= bits[0]
+            fabric |= bits[1]
+            pod |= bits[2]
+            role |= bits[3]
+        return (dc, fabric, pod, role) if dc else ()
+
+    @staticmethod
+    def disjoint(sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> bool:
+        """Whether two non-empty signatures have no place in common at some level, from the dc down."""
+        for (places1, places2) in zip(sig1, sig2):
+            if not places1 & places2:
+                return True
+        return False
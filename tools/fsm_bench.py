@@ -0,0 +1,96 @@
+"""
+Benchmark the greenery FSM operations used by the regex tree on the FSMs cached in workload/*/reg2fsm.pkl.
+
+Run from the repo root, e.g. `python -m tools.fsm_bench -f wait_time -n 200`, once before and once after a change
+to regex/greenery/fsm.py to compare the timings.
+"""
+import argparse
+import glob
+import os
+import pickle
+import random
+import time
+
+OPERATIONS = {
+    "reduce": lambda f1, f2: f1.reduce(),
+    "reversed": lambda f1, f2: f1.reversed(),
+    "&": lambda f1, f2: f1 & f2,
+    "-": lambda f1, f2: f1 - f2,
+    "|": lambda f1, f2: f1 | f2,
+    "isdisjoint": lambda f1, f2: f1.isdisjoint(f2),
+    ">=": lambda f1, f2: f1 >= f2,
+    ">": lambda f1, f2: f1 > f2,
+    "==": lambda f1, f2: f1 == f2,
+}
+
+
+def _configure() -> argparse.Namespace:
+    """Sets up arg parser"""
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "-f",
+        dest="folders",
+        nargs="*",
+        default=None,
+        help="The folders under workload to benchmark, default is all of them",
+    )
+    parser.add_argument(
+        "-n",
+        dest="num_pairs",
+        default=200,
+        type=int,
+        help="The number of random fsm pairs per folder",
+    )
+    parser.add_argument(
+        "-r",
+        dest="repeat",
+        default=3,
+        type=int,
+        help="Report the best of this many rounds",
+    )
+    parser.add_argument(
+        "-op",
+        dest="operations",
+        nargs="*",
+        choices=list(OPERATIONS),
+        default=list(OPERATIONS),
+        help="The operations to time",
+    )
+
+    return parser.parse_args()
+
+
+def load_fsms(folder: str) -> list:
+    with open(os.path.join("workload", folder, "reg2fsm.pkl"), "rb") as f:
+        return list(pickle.load(f).values())
+
+
+def bench(operation, pairs: list, repeat: int) -> float:
+    """Return the best total time in seconds of applying operation to all pairs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for f1, f2 in pairs:
+            operation(f1, f2)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args: argparse.Namespace) -> None:
+    """The main program"""
+    folders = args.folders or sorted(os.path.basename(os.path.dirname(p)) for p in glob.glob("workload/*/reg2fsm.pkl"))
+    for folder in folders:
+        fsms = load_fsms(folder)
+        rnd = random.Random(0)
+        pairs = [(rnd.choice(fsms), rnd.choice(fsms)) for _ in range(args.num_pairs)]
+        print("{}: {} fsms, {} pairs".format(folder, len(fsms), len(pairs)))
+        for name in args.operations:
+            elapsed = bench(OPERATIONS[name], pairs, args.repeat)
+            print(
+                "    {:<12}{:>10.3f} ms total{:>10.1f} us/op".format(name, elapsed * 1000, elapsed * 1e6 / len(pairs))
+            )
+
+
+if __name__ == "__main__":
+    main(_configure())
@@ -0,0 +1,141 @@
+from __future__ import annotations
+import mmap
+import struct
+from array import array
+from typing import TYPE_CHECKING
+
+from regex.greenery.fsm import fsm, table, anything_else
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+MAGIC = b"OCCAMFSM"
+VERSION = 1
+# magic, version, number of fsms, offset of the index, offset of the sorted order
+HEADER = struct.Struct("<8sIIQQ")
+# offset and length of the regex, offset of the record, fingerprint of the fsm
+ENTRY = struct.Struct("<QIQ16s")
+# number of states and of symbols, initial state, whether anything_else is a symbol, length of the other symbols
+RECORD = struct.Struct("<IIiBI")
+
+
+class FsmCache:
+    """
+    The fsms of a workload's regexes in one file, as flat arrays, opened with mmap. Opening it reads a fixed size
+    header only, a regex is found by binary search over the index, and its fsm is only decoded the first time
+    somebody asks for it. Iterating goes through the regexes in the order they were written.
+
+    The file is a header, then per fsm a record with its symbols, finals (one byte per state) and transitions
+    (int32 per state and symbol, -1 for oblivion), then the regexes, then the index in the order written, then
+    the index positions sorted by regex.
+    """
+
+    def __init__(self, path: str, regexes: Optional[Set[str]] = None, base: Optional[FsmCache] = None):
+        if base is None:
+            with open(path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            (magic, version, self._count, self._index, self._sorted) = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise Exception("{} is not an fsm cache of version {}".format(path, VERSION))
+            self._decoded: Dict[str, fsm] = dict()
+        else:
+            (self._mm, self._count, self._index, self._sorted) = (base._mm, base._count, base._index, base._sorted)
+            self._decoded = base._decoded
+        self._path = path
+        self._regexes = regexes
+
+    @classmethod
+    def write(cls, path: str, items: Iterable[Tuple[str, fsm]]):
+        """Write the (regex, fsm) items to path in the format above."""
+        (records, keys, entries) = (bytearray(), bytearray(), [])
+        for (regex, f) in items:
+            t = f.table
+            others = [s for s in t.symbols if s is not anything_else]
+            if any(len(s) != 1 for s in others):
+                raise Exception("Only fsms over single characters can be cached, not {}".format(others))
+            others = "".join(others).encode()
+            entries.append((len(keys), regex.encode(), HEADER.size + len(records), f.fingerprint()))
+            keys += regex.encode()
+            records += RECORD.pack(len(t.finals), len(t.symbols), t.initial, t.other != -1, len(others))
+            records += others
+            records += bytes(t.finals)
+            records += array("i", t.delta).tobytes()
+        keys_at = HEADER.size + len(records)
+        index_at = keys_at + len(keys)
+        sorted_at = index_at + ENTRY.size * len(entries)
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(entries), index_at, sorted_at))
+            f.write(records)
+            f.write(keys)
+            for (key_at, key, record_at, fingerprint) in entries:
+                f.write(ENTRY.pack(keys_at + key_at, len(key), record_at, fingerprint))
+            f.write(array("I", sorted(range(len(entries)), key=lambda i: entries[i][1])).tobytes())
+
+    def subset(self, regexes: Iterable[str]) -> FsmCache:
+        """Return a view of the cache with only regexes in it, which shares the file and the decoded fsms."""
+        return FsmCache(self._path, set(regexes), self)
+
+    def _entry(self, i: int) -> Tuple[int, int, int, bytes]:
+        return ENTRY.unpack_from(self._mm, self._index + ENTRY.size * i)
+
+    def _key(self, i: int) -> bytes:
+        (key_at, key_len, _, _) = self._entry(i)
+        return self._mm[key_at : key_at + key_len]
+
+    def _find(self, regex: str) -> int:
+        """Return the position of regex in the file's index, or -1."""
+        key = regex.encode()
+        (lo, hi) = (0, self._count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = struct.unpack_from("<I", self._mm, self._sorted + 4 * mid)[0]
+            found = self._key(i)
+            if found == key:
+                return i
+            if found < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return -1
+
+    def __contains__(self, regex: str) -> bool:
+        if self._regexes is not None:
+            return regex in self._regexes
+        return regex in self._decoded or self._find(regex) != -1
+
+    def __getitem__(self, regex: str) -> fsm:
+        if regex not in self:
+            raise KeyError(regex)
+        if regex not in self._decoded:
+            self._decoded[regex] = self._decode(self._find(regex))
+        return self._decoded[regex]
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            regex = self._key(i).decode()
+            if self._regexes is None or regex in self._regexes:
+                yield regex
+
+    def __len__(self) -> int:
+        return self._count if self._regexes is None else len(self._regexes)
+
+    def fingerprint(self, regex: str) -> bytes:
+        """Return the fingerprint of the fsm of regex without decoding it."""
+        if regex not in self:
+            raise KeyError(regex)
+        return self._entry(self._find(regex))[3]
+
+    def _decode(self, i: int) -> fsm:
+        (_, _, at, fingerprint) = self._entry(i)
+        (n, k, initial, has_other, others_len) = RECORD.unpack_from(self._mm, at)
+        at += RECORD.size
+        symbols = list(self._mm[at : at + others_len].decode())
+        if has_other:
+            symbols.append(anything_else)
+        at += others_len
+        finals = bytearray(self._mm[at : at + n])
+        at += n
+        delta = array("l", memoryview(self._mm)[at : at + 4 * n * k].cast("i"))
+        f = fsm.from_table(symbols, table(symbols, range(n), initial, finals, delta))
+        f.__dict__["_fingerprint"] = fingerprint
+        return f
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+if __name__ == "__main__":
+    raise Exception("Test files can't be run directly. Use `python -m pytest tools`")
+
+import pytest
+from regex.greenery.fsm import fsm, anything_else
+from regex.greenery.lego import parse
+from tools.fsmcache import FsmCache
+
+
+def lego_fsm(regex: str) -> fsm:
+    parsed = parse(regex)
+    return parsed.to_fsm(parsed.alphabet()).reduce()
+
+
+@pytest.fixture
+def items():
+    # anything but a, then b
+    other = fsm(
+        alphabet={"a", "b", anything_else},
+        states={0, 1, 2},
+        initial=0,
+        finals={2},
+        map={
+            0: {"b": 1, anything_else: 1},
+            1: {"b": 2},
+        },
+    )
+    # no finals at all
+    nothing = fsm(
+        alphabet={"x", "y"},
+        states={0, 1},
+        initial=0,
+        finals=set(),
+        map={
+            0: {"x": 1},
+            1: {"y": 0},
+        },
+    )
+    return [
+        ("rsw0[0-3]\\.p001", lego_fsm("rsw0[0-3]\\.p001")),
+        ("[^a]b", other),
+        ("nothing", nothing),
+        ("a*", lego_fsm("a*")),
+        ("é|ü", lego_fsm("é|ü")),
+    ]
+
+
+def test_round_trip(items, tmp_path):
+    path = str(tmp_path / "reg2fsm.bin")
+    FsmCache.write(path, items)
+    cache = FsmCache(path)
+    assert len(cache) == len(items)
+    assert list(cache) == [regex for (regex, _) in items]
+    for (regex, f) in items:
+        assert regex in cache
+        assert cache.fingerprint(regex) == f.fingerprint()
+        decoded = cache[regex]
+        assert decoded.alphabet == f.alphabet
+        assert decoded.equivalent(f)
+        assert decoded.fingerprint() == f.fingerprint()
+        # decoded once, then shared
+        assert cache[regex] is decoded
+    assert cache["[^a]b"].accepts(["b", "b"])
+    assert cache["[^a]b"].accepts([anything_else, "b"])
+    assert not cache["[^a]b"].accepts(["a", "b"])
+    assert cache["nothing"].empty()
+    assert "missing" not in cache
+    with pytest.raises(KeyError):
+        cache["missing"]
+
+
+def test_subset(items, tmp_path):
+    path = str(tmp_path / "reg2fsm.bin")
+    FsmCache.write(path, items)
+    cache = FsmCache(path)
+    subset = cache.subset(["a*", "nothing"])
+    assert len(subset) == 2
+    assert list(subset) == ["nothing", "a*"]
+    assert "[^a]b" not in subset
+    assert subset["a*"].accepts("aaa")
+    assert subset["a*"] is cache["a*"]
+    with pytest.raises(KeyError):
+        subset.fingerprint("[^a]b")
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / "reg2fsm.bin")
+    FsmCache.write(path, [])
+    cache = FsmCache(path)
+    assert len(cache) == 0
+    assert list(cache) == []
+    assert "a" not in cache
+
+
+def test_rejects_multi_character_symbols(tmp_path):
+    words = fsm(
+        alphabet={"ab", "c"},
+        states={0, 1},
+        initial=0,
+        finals={1},
+        map={0: {"ab": 1, "c": 1}},
+    )
+    with pytest.raises(Exception, match="single characters"):
+        FsmCache.write(str(tmp_path / "reg2fsm.bin"), [("ab|c", words)])
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "reg2fsm.pkl"
+    path.write_bytes(b"not an fsm cache at all, just some bytes" * 2)
+    with pytest.raises(Exception, match="is not an fsm cache"):
+        FsmCache(str(path))
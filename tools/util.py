@@ -6,6 +6,7 @@ import random
 import enum
 from typing import List
 
+from regex.regextool import RegexTool
 
 if TYPE_CHECKING:
     from regex.regextree import RegexTreeRegex, TreeObjRegex
@@ -58,22 +59,42 @@ def has_lock_in(objs: List[TreeObjRegex], type: AccType) -> bool:
     return False
 
 
-def has_lock_in_containment(objtree: RegexTreeRegex, obj: TreeObjRegex, type: AccType, proper: bool) -> bool:
-    """Check whether there is an specific type of lock in the containment"""
-    contain_objs: List[TreeObjRegex] = objtree.get_containment(objtree._root, obj, proper=proper)
+def has_lock_of(num_shlock: int, num_exlock: int, type: AccType) -> bool:
+    if type == AccType.READ:
+        return num_shlock > 0
+    elif type == AccType.WRITE:
+        return num_exlock > 0
+    elif type == AccType.RW:
+        return num_shlock > 0 or num_exlock > 0
+    return False
 
-    return has_lock_in(contain_objs, type)
+
+def has_lock_in_containment(objtree: RegexTreeRegex, obj: TreeObjRegex, type: AccType, proper: bool) -> bool:
+    """
+    Check whether there is an specific type of lock in the containment. The subtree of obj is answered by its lock
+    counts, so only the path to the root is walked.
+    """
+    if has_lock_in_children(objtree, obj, type):
+        return True
+    if not proper and has_lock_of(len(obj._shlock), len(obj._exlock), type):
+        return True
+    return has_lock_in_path_to_root(objtree, obj, type, proper=True)
 
 
 def get_wfs_in_containment(objtree: RegexTreeRegex, obj: TreeObjRegex, type: AccType, proper: bool) -> list:
     """get all wfs in the containment that have got the lock"""
-    contain_objs: List[TreeObjRegex] = objtree.get_containment(objtree._root, obj, proper=proper)
-    wfs = set()
-    for co in contain_objs:
-        if type == AccType.READ:
-            wfs.update(set(co._shlock))
-        elif type == AccType.WRITE:
-            wfs.update(set(co._exlock))
+    if type == AccType.READ:
+        (sub, own) = (obj._sub_shlock, obj._shlock)
+    elif type == AccType.WRITE:
+        (sub, own) = (obj._sub_exlock, obj._exlock)
+    else:
+        return []
+    # with proper, the wfs which only hold the lock of obj itself are left out
+    wfs = set(wf for (wf, n) in sub.items() if not proper or n > own.count(wf))
+    path_objs: List[TreeObjRegex] = objtree.find_path(objtree._root, obj)
+    path_objs.remove(obj)
+    for co in path_objs:
+        wfs.update(co._shlock if type == AccType.READ else co._exlock)
     return list(wfs)
 
 
@@ -87,20 +108,16 @@ def has_lock_in_path_to_root(objtree: RegexTreeRegex, obj: TreeObjRegex, type: A
 
 def has_lock_in_children(objtree: RegexTreeRegex, obj: TreeObjRegex, type: AccType) -> bool:
     """Check whether there is an specific type of lock in all the children this obj"""
-    child_objs: List[TreeObjRegex] = objtree.get_all_children(obj)
-    return has_lock_in(child_objs, type)
+    return has_lock_of(obj._num_sub_shlock - len(obj._shlock), obj._num_sub_exlock - len(obj._exlock), type)
 
 
 def only_wf_in_children(objtree: RegexTreeRegex, obj: TreeObjRegex, wf: Workflow) -> bool:
     """Check whether all the children has locks only allocated to wf"""
-    child_objs: List[TreeObjRegex] = objtree.get_all_children(obj)
-    # if not child_objs:
-    #     return False
-    for co in child_objs:
-        for allocated_wf in co._shlock + co._exlock:
-            if allocated_wf != wf:
-                return False
-    return True
+    num_locks = obj._num_sub_shlock - len(obj._shlock) + obj._num_sub_exlock - len(obj._exlock)
+    num_wf_locks = (
+        obj._sub_shlock.get(wf, 0) - obj._shlock.count(wf) + obj._sub_exlock.get(wf, 0) - obj._exlock.count(wf)
+    )
+    return num_locks == num_wf_locks
 
 
 def only_wf_in_path(objtree: RegexTreeRegex, obj: TreeObjRegex, wf: Workflow) -> bool:
@@ -150,20 +167,25 @@ def num_lock_in_path(objtree: RegexTreeRegex, obj: TreeObjRegex, type: AccType,
     return num
 
 
-def get_matched_devices(runner, regex: str):
+def get_matched_devices(runner, regex: str, fsm=None):
     if runner and regex in runner.reg2dev_map:
         all_match = runner.reg2dev_map[regex]
+    elif runner and fsm is not None and fsm.fingerprint() in runner.fp2dev_map:
+        all_match = runner.fp2dev_map[fsm.fingerprint()]
+    elif runner and (fsm is not None or regex in runner.fsm_cache):
+        # walk the regex's fsm down the device index instead of trying every device
+        all_match = runner.device_index.match(fsm if fsm is not None else runner.fsm_cache[regex])
     else:
-        if runner:
-            devices = runner.device_cache
-        else:
-            devices = open("workload/devices.txt", "r").read().splitlines()
+        # compiling an fsm just for this costs more than trying every device
+        devices = runner.device_cache if runner else open("workload/devices.txt", "r").read().splitlines()
+        if regex is None:
+            regex = RegexTool.to_regex(fsm)
         # takes a lot of time
         all_match = [d for d in devices if re.match(regex, d)]
     return all_match
 
 
-def get_matched_dcs(runner, regex: str):
+def get_matched_dcs(runner, regex: str, fsm=None):
     # optimize the performance
     matched_dcs = set()
     if runner and regex in runner.reg2dev_map:  # using the fast path
@@ -179,8 +201,10 @@ def get_matched_dcs(runner, regex: str):
                 all_match = [d for d in dcs if re.match(dc_s, d)]
                 matched_dcs.update(set(all_match))
         return list(matched_dcs)
+    elif runner and fsm is not None and fsm.fingerprint() in runner.fp2dc_map:
+        return runner.fp2dc_map[fsm.fingerprint()]
     else:
-        all_match = get_matched_devices(runner, regex)
+        all_match = get_matched_devices(runner, regex, fsm)
         for am in all_match:
             dc = re.search("(_dc\\d{4}_\\d+|_dc\\d{4}_[a-z]+)", am)
             if dc: